@@ -4,16 +4,194 @@ Posizione: /app.py (root del repository)
 """
 
 import gradio as gr
-import pickle
+import json
+import os
+import sys
+import threading
+import time
 from pathlib import Path
-import chromadb
-from sentence_transformers import SentenceTransformer
+import numpy as np
 from datetime import datetime
 
+# I moduli condivisi con la pipeline di build vivono in scripts/
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'scripts'))
+
+from knowledge_artifact import ARTIFACT_DIR, KnowledgeArtifact, artifact_exists
+from embedding_cache import QUERY_CACHE_FILE, EmbeddingCache, QueryEmbeddingCache, normalize_query
+from bm25_index import identifier_tokens, tokenize
+from vector_backends import EXACT_SEARCH_MAX_CHUNKS, create_backend
+from partitions import PartitionIndex, date_bound
+from microbatch import DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT_MS, MicroBatcher
+from encoders import DEFAULT_ENCODER_BACKEND, create_encoder
+from metrics import REGISTRY, add_to_trace, request_trace, start_metrics_server, timed_stage
+
 
 # Configurazione globale
 MODEL_NAME = 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'
-KNOWLEDGE_FILE = 'knowledge.pkl'
+ENCODER_BACKEND = DEFAULT_ENCODER_BACKEND  # 'torch' oppure 'onnx' (RAG_ENCODER_BACKEND)
+KNOWLEDGE_DIR = ARTIFACT_DIR
+KNOWLEDGE_FILE = 'knowledge.pkl'  # Formato legacy (liste Python in pickle)
+QUERY_CACHE_MAX_BYTES = 64 * 1024 * 1024  # Cache su disco degli embedding delle domande
+QUERY_LRU_SIZE = 1024  # Domande normalizzate tenute in memoria
+MAX_BULK_QUERIES = 500  # Domande per chiamata all'endpoint retrieve_many
+
+# Filtri della UI: fonti (nomi come in scripts/scrape_sources.py) e periodi
+SOURCE_NAMES = [
+    'MIM - Normativa',
+    'USR Lazio',
+    'Orizzonte Scuola - Diventare Insegnanti',
+    'Orizzonte Scuola - ATA',
+    'Orizzonte Scuola - Mobilità',
+    'FLC CGIL',
+    'CISL Scuola Roma e Rieti',
+]
+PERIODS = {
+    'Tutto': None,
+    'Ultimi 7 giorni': 7,
+    'Ultimi 30 giorni': 30,
+    'Ultimi 90 giorni': 90,
+    'Ultimo anno': 365,
+}
+
+# Retrieval: 'dense' (solo embeddings), 'lexical' (solo BM25) o 'hybrid' (RRF)
+RETRIEVAL_MODES = ('dense', 'lexical', 'hybrid')
+RETRIEVAL_MODE = 'hybrid'
+HYBRID_CANDIDATES = 4  # Candidati per lista = top_k * HYBRID_CANDIDATES
+RRF_K = 60
+IDENTIFIER_QUERY_MAX_WORDS = 3  # "OM 88", "DM 242 GPS": solo indice lessicale
+
+# Ricerca vettoriale: 'numpy' (esatta), 'chroma' (HNSW) o 'auto'
+# ('auto': esatta fino a RAG_EXACT_SEARCH_MAX_CHUNKS chunk, vedi vector_backends.py)
+VECTOR_BACKEND = os.environ.get('RAG_VECTOR_BACKEND', 'auto')
+# Artifact float16/int8 con copia float32: candidati rivalutati = top_k * RESCORE_FACTOR
+RESCORE_FACTOR = int(os.environ.get('RAG_RESCORE_FACTOR', 4))
+
+# Caricamento in background all'avvio
+READY_WAIT_SECONDS = 20  # Attesa massima di una richiesta arrivata durante il warm-up
+STATUS_REFRESH_SECONDS = 2  # Aggiornamento del box Status nella UI
+WARMUP_QUERY = "mobilità docenti graduatorie"
+
+# Richieste concorrenti: worker della coda Gradio e micro-batching delle
+# domande arrivate entro MICROBATCH_MAX_WAIT_MS. Con 0 il micro-batcher non
+# viene creato: ogni richiesta fa il proprio encode (in serie, _encode_lock)
+CONCURRENCY_LIMIT = int(os.environ.get('RAG_CONCURRENCY_LIMIT', 16))
+MICROBATCH_MAX_SIZE = int(os.environ.get('RAG_MICROBATCH_MAX_SIZE', DEFAULT_MAX_BATCH_SIZE))
+MICROBATCH_MAX_WAIT_MS = float(os.environ.get('RAG_MICROBATCH_MAX_WAIT_MS', DEFAULT_MAX_WAIT_MS))
+
+# Hot reload: ogni quanto controllare se knowledge/ è stata sostituita
+KB_WATCH_INTERVAL = int(os.environ.get('RAG_KB_WATCH_INTERVAL', 60))
+
+# Osservabilità: endpoint Prometheus (0 = disattivato) e log delle query lente
+METRICS_PORT = int(os.environ.get('RAG_METRICS_PORT', 9464))
+SLOW_QUERY_MS = float(os.environ.get('RAG_SLOW_QUERY_MS', 500))
+SLOW_QUERY_LOG = os.environ.get('RAG_SLOW_QUERY_LOG', 'logs/slow_queries.jsonl')
+
+
+# Metriche (vedi scripts/metrics.py)
+STAGE_SECONDS = REGISTRY.histogram(
+    'rag_stage_seconds', 'Durata delle fasi di una richiesta', ['stage']
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    'rag_request_seconds', 'Durata totale delle richieste', ['endpoint']
+)
+REQUESTS = REGISTRY.counter('rag_requests_total', 'Richieste ricevute', ['endpoint'])
+ERRORS = REGISTRY.counter('rag_errors_total', 'Richieste terminate con errore', ['endpoint'])
+NOT_READY = REGISTRY.counter(
+    'rag_not_ready_total', 'Richieste arrivate con knowledge base non pronta', ['endpoint']
+)
+EMPTY_RESULTS = REGISTRY.counter(
+    'rag_empty_results_total', 'Domande senza documenti trovati', ['endpoint']
+)
+SLOW_QUERIES = REGISTRY.counter(
+    'rag_slow_queries_total', 'Richieste oltre la soglia del log query lente', ['endpoint']
+)
+KB_RELOADS = REGISTRY.counter('rag_kb_reloads_total', 'Hot reload della knowledge base', ['result'])
+MICROBATCH_SIZE = REGISTRY.histogram(
+    'rag_microbatch_size', 'Domande per ricerca vettoriale micro-batch', [],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+)
+
+_slow_log_lock = threading.Lock()
+
+
+def stage(name):
+    """Misura una fase della richiesta corrente (istogramma + traccia)"""
+    return timed_stage(STAGE_SECONDS, name)
+
+
+def resident_memory_mb():
+    """Memoria residente del processo in MB (Linux: VmRSS)"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def knowledge_fingerprint():
+    """Identifica la versione su disco: mtime del manifest (o del pickle legacy)"""
+    
+    for path in (Path(KNOWLEDGE_DIR) / 'manifest.json', Path(KNOWLEDGE_FILE)):
+        try:
+            return (str(path), path.stat().st_mtime_ns)
+        except OSError:
+            continue
+    return None
+
+
+def open_knowledge_artifact():
+    """Apre knowledge/ (mmap) oppure il legacy knowledge.pkl"""
+    
+    if artifact_exists(KNOWLEDGE_DIR):
+        print(f"📂 Apertura knowledge base (mmap): {KNOWLEDGE_DIR}/")
+        return KnowledgeArtifact.open(KNOWLEDGE_DIR)
+    
+    if Path(KNOWLEDGE_FILE).exists():
+        print(f"📂 Caricamento knowledge base legacy: {KNOWLEDGE_FILE}")
+        return KnowledgeArtifact.from_legacy_pickle(KNOWLEDGE_FILE)
+    
+    raise FileNotFoundError(
+        f"❌ Knowledge base non trovata ({KNOWLEDGE_DIR}/ o {KNOWLEDGE_FILE})!\n"
+        "Esegui prima gli script di scraping e build."
+    )
+
+
+class KnowledgeIndex:
+    """Una versione della knowledge base con i suoi indici, sostituita in blocco al reload"""
+    
+    def __init__(self, artifact, fingerprint):
+        self.artifact = artifact
+        self.fingerprint = fingerprint
+        self.version = str(artifact.created_at)[:19].replace('T', ' ')
+        self.row_of_id = {chunk_id: row for row, chunk_id in enumerate(artifact.ids)}
+        
+        # Backend vettoriale: ricerca esatta NumPy sotto soglia, altrimenti HNSW
+        # (l'indice ChromaDB serializzato viene aperto senza reinserimenti)
+        self.backend = create_backend(
+            VECTOR_BACKEND, artifact, self.row_of_id,
+            exact_max_chunks=EXACT_SEARCH_MAX_CHUNKS,
+            rescore_factor=RESCORE_FACTOR
+        )
+        self.lexical_index = artifact.lexical_index
+        
+        # Righe per fonte ordinate per data: i filtri scandiscono solo queste
+        self.partitions = PartitionIndex.from_metadatas(artifact.metadatas)
+    
+    def select_rows(self, sources=None, date_from=None, date_to=None):
+        """Righe della partizione richiesta (None = nessun filtro)"""
+        return self.partitions.select(
+            sources=sources,
+            date_from=date_bound(date_from),
+            date_to=date_bound(date_to, end_of_day=True)
+        )
+    
+    def __len__(self):
+        return len(self.backend)
 
 
 class RAGBot:
@@ -21,88 +199,495 @@ class RAGBot:
     
     def __init__(self):
         self.model = None
-        self.collection = None
+        self.index = None  # KnowledgeIndex corrente: ogni ricerca ne legge un solo riferimento
+        self.embedding_cache = None
+        self.query_cache = QueryEmbeddingCache(maxsize=QUERY_LRU_SIZE)
         self.loaded = False
         
-    def load_knowledge_base(self):
-        """Carica il database da knowledge.pkl"""
+        # Stato di prontezza: 'idle', 'loading', 'ready' o 'failed'
+        self.state = 'idle'
+        self.progress = None
+        self.error = None
+        self.status_message = None
+        self.reloading = False
+        self._load_started = None
+        self._load_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._ready_event = threading.Event()
+        self._stop_watcher = threading.Event()
+        self._failed_fingerprint = None
         
-        if not Path(KNOWLEDGE_FILE).exists():
-            raise FileNotFoundError(
-                f"❌ File {KNOWLEDGE_FILE} non trovato!\n"
-                "Esegui prima gli script di scraping e build."
+        # Il modello non si chiama da più thread insieme (il tokenizer fast non è
+        # rientrante); le domande concorrenti si accorpano nel micro-batcher
+        self._encode_lock = threading.Lock()
+        self.batcher = None
+        if MICROBATCH_MAX_WAIT_MS > 0:
+            self.batcher = MicroBatcher(
+                self._dense_search_traced,
+                max_batch_size=MICROBATCH_MAX_SIZE,
+                max_wait_ms=MICROBATCH_MAX_WAIT_MS,
+                name='rag-microbatch'
             )
+    
+    @property
+    def kb_version(self):
+        index = self.index
+        return index.version if index is not None else None
+    
+    def start_background_load(self):
+        """Avvia il caricamento in un thread daemon (no-op se già in corso o completato)"""
         
-        print("📂 Caricamento knowledge base...")
+        with self._load_lock:
+            if self.state in ('loading', 'ready'):
+                return False
+            self._begin_loading()
         
-        with open(KNOWLEDGE_FILE, 'rb') as f:
-            data = pickle.load(f)
+        threading.Thread(target=self._background_load, name='kb-loader', daemon=True).start()
+        return True
+    
+    def _background_load(self):
+        try:
+            self.load_knowledge_base()
+        except Exception as e:
+            print(f"❌ Caricamento knowledge base fallito: {e}")
+    
+    def _begin_loading(self):
+        self.state = 'loading'
+        self.progress = 'avvio'
+        self.error = None
+        self._load_started = time.perf_counter()
+        self._ready_event.clear()
+    
+    def wait_until_ready(self, timeout=None):
+        """Attende la fine del caricamento; True se la knowledge base è pronta"""
         
-        # Carica modello embeddings
-        print(f"🤖 Caricamento modello: {MODEL_NAME}")
-        self.model = SentenceTransformer(MODEL_NAME)
+        if not self.loaded and self.state == 'loading':
+            self._ready_event.wait(timeout)
+        return self.loaded
+    
+    def status(self):
+        """Stato di prontezza leggibile per la UI"""
+        
+        if self.state == 'loading':
+            elapsed = time.perf_counter() - self._load_started
+            return f"⏳ Caricamento knowledge base: {self.progress}... ({elapsed:.0f}s)"
+        if self.state == 'failed':
+            return f"❌ Errore: {self.error}"
+        if self.state == 'ready':
+            if self.reloading:
+                return f"🔄 Nuova versione in preparazione (in uso: KB {self.kb_version})"
+            return self.status_message
+        return "⏳ Knowledge base non ancora caricata"
+    
+    def load_knowledge_base(self):
+        """Carica il database da knowledge/ (o dal legacy knowledge.pkl)"""
         
-        # Ricostruisci ChromaDB in memoria
-        print("🗄️  Ricostruzione ChromaDB...")
-        client = chromadb.EphemeralClient()  # In memoria (più veloce)
+        if self.loaded:
+            return self.reload_knowledge_base()
         
-        self.collection = client.create_collection(
-            name="scuola_docs",
-            metadata={"hnsw:space": "cosine"}
-        )
+        if self.state != 'loading':
+            self._begin_loading()
+        
+        try:
+            self.status_message = self._load()
+            self.state = 'ready'
+        except Exception as e:
+            self.error = str(e)
+            self.state = 'failed'
+            raise
+        finally:
+            self._ready_event.set()
         
-        # Popola collection
-        self.collection.add(
-            ids=data['ids'],
-            embeddings=data['embeddings'],
-            documents=data['documents'],
-            metadatas=data['metadatas']
+        return self.status_message
+    
+    def _load(self):
+        start = time.perf_counter()
+        rss_before = resident_memory_mb()
+        
+        self.progress = 'apertura artifact'
+        fingerprint = knowledge_fingerprint()
+        artifact = open_knowledge_artifact()
+        
+        open_time = time.perf_counter() - start
+        
+        # Carica modello embeddings
+        self.progress = 'caricamento modello'
+        print(f"🤖 Caricamento modello: {MODEL_NAME} (encoder {ENCODER_BACKEND})")
+        self.model = create_encoder(ENCODER_BACKEND, MODEL_NAME)
+        if artifact.manifest.get('encoder', 'torch') != self.model.backend:
+            print(f"   ⚠️  Knowledge base codificata con encoder {artifact.manifest.get('encoder', 'torch')}")
+        self.embedding_cache = EmbeddingCache(
+            self.model.cache_key, path=QUERY_CACHE_FILE, max_bytes=QUERY_CACHE_MAX_BYTES
         )
+        self.query_cache.bind_model(self.model.cache_key)
+        self.query_cache.clear()  # Nuova istanza del modello
+        
+        self.progress = 'indice vettoriale'
+        index = KnowledgeIndex(artifact, fingerprint)
+        
+        # La prima domanda reale non deve pagare il primo forward del modello
+        self.progress = 'warm-up encoder'
+        warmup_time = self._warm_up(index)
+        
+        self.index = index
         
         # Stats
-        total_docs = self.collection.count()
-        created_at = data.get('created_at', 'N/A')
+        total_docs = len(index)
+        load_time = time.perf_counter() - start
+        rss_after = resident_memory_mb()
         
         print(f"✅ Knowledge base caricata:")
         print(f"   - Documenti: {total_docs}")
-        print(f"   - Creata il: {created_at}")
+        print(f"   - Creata il: {artifact.created_at}")
+        print(f"   - Apertura artifact: {open_time * 1000:.1f} ms")
+        print(f"   - Caricamento totale: {load_time:.2f} s")
+        print(f"   - Warm-up encoder: {warmup_time * 1000:.0f} ms")
+        print(f"   - Mappati su disco: {artifact.mapped_bytes / (1024 * 1024):.1f} MB")
+        print(f"   - Memoria residente: {rss_after:.0f} MB (+{rss_after - rss_before:.0f} MB)")
+        print(f"   - Backend vettoriale: {index.backend.name} (embeddings {artifact.dtype})")
+        print(f"   - Indice BM25: {len(index.lexical_index.terms)} termini")
+        print(f"   - Partizioni: {index.partitions.stats()}")
+        print(f"   - Cache embeddings query: {self.embedding_cache.stats()}")
         
         self.loaded = True
         
-        return f"✅ Caricati {total_docs} documenti"
+        return (
+            f"✅ Caricati {total_docs} documenti "
+            f"in {load_time:.1f}s (RAM {rss_after:.0f} MB) · KB {index.version}"
+        )
+    
+    def reload_knowledge_base(self):
+        """
+        Prepara la nuova versione in parallelo e la sostituisce in un colpo solo
+        
+        Le ricerche in corso hanno già letto self.index e finiscono sulla
+        versione precedente; le successive vedono la nuova.
+        """
+        
+        with self._reload_lock:
+            start = time.perf_counter()
+            self.reloading = True
+            try:
+                fingerprint = knowledge_fingerprint()
+                index = KnowledgeIndex(open_knowledge_artifact(), fingerprint)
+                self._warm_up(index)
+            except Exception:
+                KB_RELOADS.inc(result='failed')
+                raise
+            finally:
+                self.reloading = False
+            
+            previous_version = self.kb_version
+            self.index = index
+            KB_RELOADS.inc(result='ok')
+            self._failed_fingerprint = None
+            
+            swap_time = time.perf_counter() - start
+            print(f"🔄 Knowledge base aggiornata: {previous_version} -> {index.version} "
+                  f"({len(index)} documenti, {swap_time:.2f}s)")
+            
+            self.status_message = (
+                f"✅ KB {index.version}: {len(index)} documenti "
+                f"(aggiornata in {swap_time:.1f}s, senza interruzioni)"
+            )
+            return self.status_message
     
-    def retrieve(self, query, top_k=5):
-        """Recupera documenti rilevanti"""
+    def start_watcher(self, interval=KB_WATCH_INTERVAL):
+        """Controlla periodicamente se la knowledge base su disco è cambiata"""
+        
+        threading.Thread(
+            target=self._watch, args=(interval,), name='kb-watcher', daemon=True
+        ).start()
+    
+    def stop_watcher(self):
+        self._stop_watcher.set()
+    
+    def _watch(self, interval):
+        while not self._stop_watcher.wait(interval):
+            index = self.index
+            
+            # None: build in corso (directory in fase di rename) o artifact rimosso
+            fingerprint = knowledge_fingerprint()
+            if fingerprint in (None, self._failed_fingerprint):
+                continue
+            
+            # Primo caricamento fallito (es. artifact non ancora presente all'avvio):
+            # si carica appena compare una knowledge base valida
+            if index is None:
+                with self._load_lock:
+                    if self.state in ('loading', 'ready'):
+                        continue
+                    self._begin_loading()
+                
+                print("👀 Knowledge base comparsa su disco, caricamento...")
+                try:
+                    self.load_knowledge_base()
+                except Exception as e:
+                    self._failed_fingerprint = fingerprint
+                    print(f"⚠️  Caricamento fallito: {e}")
+                continue
+            
+            if fingerprint == index.fingerprint:
+                continue
+            
+            print("👀 Nuova knowledge base su disco, reload in background...")
+            try:
+                self.reload_knowledge_base()
+            except Exception as e:
+                self._failed_fingerprint = fingerprint
+                print(f"⚠️  Reload fallito, resta in uso la KB {self.kb_version}: {e}")
+    
+    def _warm_up(self, index):
+        """Forward del modello e ricerca a vuoto (senza cache): pesi e pagine mmap pronti"""
+        
+        start = time.perf_counter()
+        embedding = self._model_encode([WARMUP_QUERY])
+        index.backend.search(embedding, 1)
+        index.lexical_index.search(WARMUP_QUERY, top_k=1)
+        return time.perf_counter() - start
+    
+    def _encode_queries(self, queries):
+        """
+        Embedding delle domande normalizzate: LRU in memoria, poi cache su
+        disco; tutte le domande mancanti passano in un unico forward batch
+        """
+        
+        with stage('normalize'):
+            keys = [normalize_query(query) for query in queries]
+        
+        # La chiave normalizzata serve solo alla cache: il modello vede il testo
+        # originale ("D.M. 242 MIM", non "d m 242 mim")
+        original = {}
+        for key, query in zip(keys, queries):
+            original.setdefault(key, query)
+        
+        embeddings = {}
+        
+        with stage('query_cache'):
+            for key in original:
+                embedding = self.query_cache.get(key)
+                if embedding is not None:
+                    embeddings[key] = embedding
+        
+        missing = [key for key in original if key not in embeddings]
+        
+        if missing:
+            with stage('encode'):
+                encoded = self.embedding_cache.get_or_encode(
+                    [original[key] for key in missing], self._model_encode, keys=missing
+                )
+            for key, embedding in zip(missing, encoded):
+                self.query_cache.put(key, embedding)
+                embeddings[key] = embedding
+        
+        return [embeddings[key] for key in keys]
+    
+    def _model_encode(self, texts):
+        """Forward del modello, un thread alla volta"""
+        with self._encode_lock:
+            return self.model.encode(texts)
+    
+    def _encode_query(self, query):
+        """Embedding di una singola domanda (vedi _encode_queries)"""
+        return self._encode_queries([query])[0]
+    
+    def retrieve(self, query, top_k=5, mode=None, sources=None, date_from=None, date_to=None):
+        """Recupera documenti rilevanti (filtri opzionali per fonte e periodo)"""
         
         if not self.loaded:
             return []
         
-        # Genera embedding della query
-        query_embedding = self.model.encode(query).tolist()
+        return self.retrieve_many(
+            [query], top_k=top_k, mode=mode,
+            sources=sources, date_from=date_from, date_to=date_to
+        )[0]
+    
+    def retrieve_many(self, queries, top_k=5, mode=None, sources=None, date_from=None, date_to=None):
+        """
+        Recupera documenti rilevanti per più domande insieme
         
-        # Query ChromaDB
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k
-        )
+        Un solo encode batch e una sola ricerca multi-embedding sul backend.
+        
+        Args:
+            queries: lista di domande
+            top_k: documenti per domanda
+            mode: 'dense', 'lexical' o 'hybrid' (default RETRIEVAL_MODE)
+            sources: fonti ammesse (None = tutte)
+            date_from, date_to: periodo di pubblicazione, estremi inclusi
+                (epoch, date o stringa; i documenti senza data sono esclusi)
+        
+        Returns:
+            una lista di documenti per ogni domanda (stesso formato di retrieve)
+        """
+        
+        mode = mode or RETRIEVAL_MODE
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Modalità di retrieval sconosciuta: {mode}")
+        
+        # Un solo riferimento per tutta la richiesta: un reload concorrente non la tocca
+        index = self.index
+        
+        if not self.loaded or index is None or not queries:
+            return [[] for _ in queries]
+        
+        # Filtri: righe delle partizioni scelte, calcolate una volta per tutte le domande
+        with stage('filter'):
+            rows = index.select_rows(sources, date_from, date_to)
+        
+        if rows is not None and not len(rows):
+            return [[] for _ in queries]
+        
+        n_candidates = top_k * HYBRID_CANDIDATES if mode == 'hybrid' else top_k
+        
+        # Le domande che sono solo un identificativo ("OM 88") non passano dal modello
+        use_dense = [
+            mode == 'dense' or (mode == 'hybrid' and not self._is_identifier_query(index, query))
+            for query in queries
+        ]
+        use_lexical = [mode != 'dense' for _ in queries]
+        
+        dense_rankings = {}
+        dense_queries = [i for i, dense in enumerate(use_dense) if dense]
+        if dense_queries:
+            rankings = self._dense_search(
+                index, [queries[i] for i in dense_queries], n_candidates, rows
+            )
+            dense_rankings = dict(zip(dense_queries, rankings))
         
         # Formatta risultati
-        documents = []
+        all_documents = []
         
-        for i in range(len(results['ids'][0])):
-            doc = {
-                'id': results['ids'][0][i],
-                'text': results['documents'][0][i],
-                'metadata': results['metadatas'][0][i],
-                'distance': results['distances'][0][i] if 'distances' in results else None
-            }
-            documents.append(doc)
+        for q, query in enumerate(queries):
+            dense = dense_rankings.get(q, [])
+            distances = dict(dense)
+            
+            rankings = [[row for row, _ in dense]] if use_dense[q] else []
+            
+            if use_lexical[q]:
+                with stage('lexical_search'):
+                    lexical_rows, _ = index.lexical_index.search(
+                        query, top_k=n_candidates, rows=rows
+                    )
+                rankings.append(lexical_rows.tolist())
+            
+            with stage('fusion'):
+                fused = self._fuse_rankings(rankings, top_k)
+                all_documents.append([
+                    self._make_document(index, row, distances.get(row)) for row in fused
+                ])
         
-        return documents
+        return all_documents
+    
+    def _dense_search(self, index, queries, n_results, rows=None):
+        """Ricerca vettoriale (limitata a `rows`): per ogni domanda lista di (riga, distanza)"""
+        
+        request = (index, queries, n_results, rows)
+        
+        if self.batcher is None:
+            return self._dense_search_batch([request])[0]
+        
+        # Richieste concorrenti: un solo encode e una sola ricerca per tutto il batch.
+        # Il batch gira nel thread del micro-batcher: le sue fasi (encode,
+        # vector_search...) tornano con il risultato e finiscono nella traccia
+        # di questa richiesta, più il tempo passato ad aspettare il batch
+        start = time.perf_counter()
+        rankings, stages = self.batcher.submit(request, size=len(queries))
+        waited = max(0.0, time.perf_counter() - start - sum(stages.values()))
+        
+        STAGE_SECONDS.observe(waited, stage='microbatch_wait')
+        add_to_trace({**stages, 'microbatch_wait': waited})
+        return rankings
+    
+    def _dense_search_traced(self, requests):
+        """_dense_search_batch per il micro-batcher: risultati con i tempi delle fasi del batch"""
+        with request_trace() as trace:
+            results = self._dense_search_batch(requests)
+        return [(rankings, dict(trace.stages)) for rankings in results]
+    
+    def _dense_search_batch(self, requests):
+        """
+        Ricerca vettoriale di più richieste insieme
+        
+        Args:
+            requests: lista di (KnowledgeIndex, domande, risultati per domanda, righe)
+        
+        Returns:
+            per ogni richiesta, la lista di risultati delle sue domande
+        """
+        
+        # Genera embedding di tutte le domande (le ripetute arrivano dalla cache)
+        all_queries = [query for _, queries, _, _ in requests for query in queries]
+        MICROBATCH_SIZE.observe(len(all_queries))
+        embeddings = self._encode_queries(all_queries)
+        
+        # Una ricerca multi-embedding per versione della KB e filtro (di solito una sola)
+        groups = {}
+        offset = 0
+        for r, (index, queries, n_results, rows) in enumerate(requests):
+            key = (id(index), None if rows is None else rows.tobytes())
+            groups.setdefault(key, []).append((r, offset, len(queries)))
+            offset += len(queries)
+        
+        results = [None] * len(requests)
+        
+        for members in groups.values():
+            index, _, _, rows = requests[members[0][0]]
+            n_results = max(requests[r][2] for r, _, _ in members)
+            query_embeddings = np.stack([
+                embeddings[start + i] for _, start, count in members for i in range(count)
+            ])
+            
+            with stage('vector_search'):
+                rankings = index.backend.search(query_embeddings, n_results, rows=rows)
+            
+            position = 0
+            for r, _, count in members:
+                limit = requests[r][2]
+                results[r] = [ranking[:limit] for ranking in rankings[position:position + count]]
+                position += count
+        
+        return results
+    
+    def _is_identifier_query(self, index, query):
+        """Domanda breve che contiene un identificativo presente nell'indice (es. "DM 242")"""
+        
+        words = normalize_query(query).split()
+        if len(words) > IDENTIFIER_QUERY_MAX_WORDS:
+            return False
+        
+        return index.lexical_index.has_terms(identifier_tokens(tokenize(query)))
+    
+    @staticmethod
+    def _fuse_rankings(rankings, top_k):
+        """Reciprocal Rank Fusion di più classifiche di righe"""
+        
+        if len(rankings) == 1:
+            return rankings[0][:top_k]
+        
+        scores = {}
+        for ranking in rankings:
+            for rank, row in enumerate(ranking):
+                scores[row] = scores.get(row, 0.0) + 1.0 / (RRF_K + rank + 1)
+        
+        return sorted(scores, key=scores.get, reverse=True)[:top_k]
+    
+    @staticmethod
+    def _make_document(index, row, distance=None):
+        artifact = index.artifact
+        return {
+            'id': artifact.ids[row],
+            'text': artifact.texts[row],
+            'metadata': artifact.metadatas[row],
+            'distance': distance
+        }
     
     def generate_answer(self, query, documents):
         """Genera risposta citando le fonti"""
         
+        with stage('format'):
+            return self._format_answer(query, documents)
+    
+    def _format_answer(self, query, documents):
         if not documents:
             return (
                 "❌ Non ho trovato informazioni rilevanti nella knowledge base.\n\n"
@@ -122,7 +707,8 @@ class RAGBot:
                 'title': metadata.get('title', 'N/A'),
                 'url': metadata.get('source_url', ''),
                 'source': metadata.get('source', 'N/A'),
-                'date': metadata.get('date', 'N/A')
+                'date': metadata.get('date', 'N/A'),
+                'also_urls': [url for url in metadata.get('duplicate_urls', '').split('\n') if url]
             })
         
         context = "\n\n".join(context_parts)
@@ -140,6 +726,8 @@ class RAGBot:
             
             answer_parts.append(f"**{i}. {metadata.get('title', 'Documento')}**")
             answer_parts.append(f"   *Fonte: {metadata.get('source', 'N/A')}*")
+            if metadata.get('duplicate_sources'):
+                answer_parts.append(f"   *Pubblicato anche su: {metadata['duplicate_sources']}*")
             answer_parts.append(f"   *Data: {metadata.get('date', 'N/A')}*\n")
             answer_parts.append(f"   {text_preview}...\n")
             answer_parts.append(f"   🔗 [Leggi tutto]({metadata.get('source_url', '#')})\n")
@@ -156,31 +744,190 @@ class RAGBot:
 bot = RAGBot()
 
 
-def chat(message, history):
+def collect_bot_metrics():
+    """Metriche lette dal bot a ogni scrape: cache e knowledge base in uso"""
+    
+    cache_samples = [
+        ({'layer': 'memory', 'result': 'hit'}, bot.query_cache.hits),
+        ({'layer': 'memory', 'result': 'miss'}, bot.query_cache.misses),
+    ]
+    if bot.embedding_cache is not None:
+        cache_samples += [
+            ({'layer': 'disk', 'result': 'hit'}, bot.embedding_cache.hits),
+            ({'layer': 'disk', 'result': 'miss'}, bot.embedding_cache.misses),
+        ]
+    
+    families = [
+        ('rag_query_cache_requests_total', 'counter',
+         'Lookup degli embedding delle domande per livello di cache', cache_samples),
+        ('rag_kb_ready', 'gauge', 'Knowledge base pronta (1) o no (0)',
+         [({}, int(bot.loaded))]),
+    ]
+    
+    if bot.batcher is not None:
+        families.append(
+            ('rag_microbatch_batches_total', 'counter', 'Batch elaborati dal micro-batcher',
+             [({}, bot.batcher.batches)])
+        )
+    
+    index = bot.index
+    if index is not None:
+        families += [
+            ('rag_kb_chunks', 'gauge', 'Chunk nella knowledge base in uso', [({}, len(index))]),
+            ('rag_kb_mapped_bytes', 'gauge', 'Byte della knowledge base mappati da disco',
+             [({}, index.artifact.mapped_bytes)]),
+            ('rag_kb_info', 'gauge', 'Versione e configurazione della knowledge base in uso',
+             [({'version': index.version, 'backend': index.backend.name,
+                'dtype': index.artifact.dtype}, 1)]),
+        ]
+    
+    return families
+
+
+REGISTRY.register_collector(collect_bot_metrics)
+
+
+def record_request(endpoint, trace, queries, kb_version, error=None):
+    """Durata della richiesta nelle metriche e, se oltre soglia, nel log delle query lente"""
+    
+    elapsed_ms = trace.elapsed * 1000
+    REQUEST_SECONDS.observe(trace.elapsed, endpoint=endpoint)
+    
+    if elapsed_ms < SLOW_QUERY_MS:
+        return
+    
+    SLOW_QUERIES.inc(endpoint=endpoint)
+    stages_ms = trace.stages_ms()
+    breakdown = ', '.join(f"{name} {ms:.0f}" for name, ms in sorted(stages_ms.items(), key=lambda x: -x[1]))
+    print(f"🐢 Query lenta ({endpoint}, {elapsed_ms:.0f} ms): {breakdown}")
+    
+    entry = {
+        'timestamp': datetime.now().isoformat(),
+        'endpoint': endpoint,
+        'total_ms': round(elapsed_ms, 2),
+        'stages_ms': stages_ms,
+        'queries': [q[:200] for q in queries[:10]],
+        'num_queries': len(queries),
+        'kb_version': kb_version,
+        'error': error,
+    }
+    
+    try:
+        with _slow_log_lock:
+            Path(SLOW_QUERY_LOG).parent.mkdir(parents=True, exist_ok=True)
+            with open(SLOW_QUERY_LOG, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    except OSError as e:
+        print(f"⚠️  Log query lente non scrivibile: {e}")
+
+
+def period_start(period):
+    """Inizio del periodo scelto nella UI (None = nessun limite)"""
+    days = PERIODS.get(period)
+    if not days:
+        return None
+    return int(time.time()) - days * 86400
+
+
+def chat(message, history, sources=None, period=None):
     """Funzione principale di chat"""
     
-    if not bot.loaded:
-        return "⚠️ Knowledge base non caricata. Premi 'Carica Knowledge Base' prima di iniziare."
+    REQUESTS.inc(endpoint='chat')
+    
+    # Durante il warm-up la richiesta aspetta un po' invece di fallire subito
+    if not bot.wait_until_ready(READY_WAIT_SECONDS):
+        NOT_READY.inc(endpoint='chat')
+        if bot.state == 'loading':
+            return f"{bot.status()}\n\nRiprova tra qualche secondo."
+        return f"⚠️ Knowledge base non disponibile. {bot.status()}"
     
     if not message or len(message.strip()) < 3:
         return "⚠️ Per favore scrivi una domanda più specifica."
     
-    # Retrieve documenti
-    documents = bot.retrieve(message, top_k=5)
+    kb_version = bot.kb_version
     
-    # Genera risposta
-    answer, sources = bot.generate_answer(message, documents)
+    with request_trace() as trace:
+        error = None
+        try:
+            # Retrieve documenti
+            documents = bot.retrieve(
+                message, top_k=5,
+                sources=sources or None, date_from=period_start(period)
+            )
+            
+            # Genera risposta
+            answer, sources = bot.generate_answer(message, documents)
+        except Exception as e:
+            ERRORS.inc(endpoint='chat')
+            error = str(e)
+            raise
+        finally:
+            record_request('chat', trace, [message], kb_version, error)
+    
+    if not documents:
+        EMPTY_RESULTS.inc(endpoint='chat')
     
-    return answer
+    return f"{answer}\n\n📦 *Knowledge base: versione {kb_version}*"
+
+
+def retrieve_many_api(queries, top_k=5, filters=None):
+    """
+    Endpoint per client bulk: lista di domande -> lista di risultati
+    
+    filters (opzionale): {"sources": [...], "date_from": "2026-01-01", "date_to": ...}
+    """
+    
+    REQUESTS.inc(endpoint='retrieve_many')
+    
+    if not bot.wait_until_ready(READY_WAIT_SECONDS):
+        NOT_READY.inc(endpoint='retrieve_many')
+        raise gr.Error(bot.status())
+    
+    if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+        raise gr.Error("'queries' deve essere una lista di stringhe.")
+    
+    if len(queries) > MAX_BULK_QUERIES:
+        raise gr.Error(f"Massimo {MAX_BULK_QUERIES} domande per richiesta.")
+    
+    top_k = max(1, min(int(top_k or 5), 50))
+    
+    filters = filters or {}
+    if not isinstance(filters, dict) or set(filters) - {'sources', 'date_from', 'date_to'}:
+        raise gr.Error("'filters' ammette solo sources, date_from e date_to.")
+    
+    kb_version = bot.kb_version
+    
+    with request_trace() as trace:
+        error = None
+        try:
+            results = bot.retrieve_many(queries, top_k=top_k, **filters)
+        except ValueError as e:
+            ERRORS.inc(endpoint='retrieve_many')
+            error = str(e)
+            raise gr.Error(error)
+        except Exception as e:
+            ERRORS.inc(endpoint='retrieve_many')
+            error = str(e)
+            raise
+        finally:
+            record_request('retrieve_many', trace, queries, kb_version, error)
+    
+    EMPTY_RESULTS.inc(sum(1 for documents in results if not documents), endpoint='retrieve_many')
+    
+    return results
 
 
 def load_kb_button():
-    """Carica knowledge base al click"""
+    """Ricarica la knowledge base al click (attende un caricamento già in corso)"""
+    if bot.state == 'loading':
+        bot.wait_until_ready()
+        return bot.status()
     try:
-        result = bot.load_knowledge_base()
-        return f"✅ {result}"
+        return bot.load_knowledge_base()
     except Exception as e:
-        return f"❌ Errore: {str(e)}"
+        if bot.loaded:
+            return f"⚠️ Reload fallito, resta in uso la KB {bot.kb_version}: {e}"
+        return bot.status()
 
 
 # Interfaccia Gradio
@@ -203,10 +950,11 @@ with gr.Blocks(
     """)
     
     with gr.Row():
-        load_btn = gr.Button("🔄 Carica Knowledge Base", variant="primary")
+        load_btn = gr.Button("🔄 Ricarica Knowledge Base", variant="secondary")
         status_text = gr.Textbox(
             label="Status",
-            value="⏳ Premi 'Carica Knowledge Base' per iniziare",
+            value=bot.status,
+            every=STATUS_REFRESH_SECONDS,
             interactive=False
         )
     
@@ -215,22 +963,51 @@ with gr.Blocks(
         outputs=status_text
     )
     
+    # Endpoint API per client bulk (/api/retrieve_many), senza elementi visibili
+    bulk_queries = gr.JSON(visible=False)
+    bulk_top_k = gr.Number(value=5, precision=0, visible=False)
+    bulk_filters = gr.JSON(visible=False)
+    bulk_results = gr.JSON(visible=False)
+    bulk_btn = gr.Button(visible=False)
+    
+    bulk_btn.click(
+        fn=retrieve_many_api,
+        inputs=[bulk_queries, bulk_top_k, bulk_filters],
+        outputs=bulk_results,
+        api_name="retrieve_many"
+    )
+    
     gr.Markdown("---")
     
     chatbot = gr.ChatInterface(
         fn=chat,
+        # Con additional_inputs ogni esempio indica anche i filtri (nessuno)
         examples=[
-            "Quali sono le ultime circolari del MIM?",
-            "Novità su concorsi e reclutamento docenti",
-            "Informazioni su mobilità ATA 2024",
-            "Comunicazioni USR Lazio recenti",
-            "Notizie sui contratti scuola",
+            [question, [], 'Tutto'] for question in (
+                "Quali sono le ultime circolari del MIM?",
+                "Novità su concorsi e reclutamento docenti",
+                "Informazioni su mobilità ATA 2024",
+                "Comunicazioni USR Lazio recenti",
+                "Notizie sui contratti scuola",
+            )
         ],
         title="💬 Fai una domanda",
         description="Chiedi informazioni su normativa, concorsi, mobilità, contratti...",
         retry_btn=None,
         undo_btn=None,
-        clear_btn="🗑️ Pulisci chat"
+        clear_btn="🗑️ Pulisci chat",
+        additional_inputs=[
+            gr.CheckboxGroup(
+                choices=SOURCE_NAMES,
+                label="Fonti (nessuna selezione = tutte)"
+            ),
+            gr.Dropdown(
+                choices=list(PERIODS),
+                value='Tutto',
+                label="Periodo"
+            ),
+        ],
+        additional_inputs_accordion_name="🔎 Filtri: fonti e periodo"
     )
     
     gr.Markdown("""
@@ -255,4 +1032,11 @@ with gr.Blocks(
 
 # Avvio
 if __name__ == "__main__":
+    # La knowledge base si carica mentre il server è già in ascolto
+    bot.start_background_load()
+    bot.start_watcher()
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+    # Più richieste in parallelo: le domande concorrenti finiscono nello stesso micro-batch
+    demo.queue(default_concurrency_limit=CONCURRENCY_LIMIT)
     demo.launch()
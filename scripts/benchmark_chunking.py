@@ -0,0 +1,115 @@
+"""
+Token codificati e token troncati: chunk di parole vs. chunk in token del modello
+Posizione: /scripts/benchmark_chunking.py
+
+Per ogni chunker (chunk_text da 800 parole e TokenChunker) tokenizza i chunk
+con il tokenizer del modello e conta quanti token entrano nella finestra
+dell'encoder (max_seq_length) e quanti vengono scartati dal troncamento.
+Serve solo il tokenizer, non i pesi del modello.
+
+I documenti vengono da data/documents.sqlite; se l'archivio è vuoto si usa
+il corpus sintetico di benchmark_retrieval.py.
+
+Uso:
+    python scripts/benchmark_chunking.py
+    python scripts/benchmark_chunking.py --docs 500 --output chunking.json
+"""
+
+import argparse
+import json
+import time
+
+from build_knowledge import MODEL_NAME, chunk_text
+from chunking import TokenChunker, truncation_report
+from document_store import DocumentStore
+
+
+def load_texts(num_docs, seed=42):
+    texts = []
+    for doc in DocumentStore().iter_documents():
+        text = doc.get('text', '')
+        if text and len(text.strip()) >= 100:
+            texts.append(text)
+        if len(texts) >= num_docs:
+            return texts, 'data/documents.sqlite'
+
+    if texts:
+        return texts, 'data/documents.sqlite'
+
+    from benchmark_retrieval import CorpusGenerator
+
+    documents = CorpusGenerator(seed).documents(num_docs)
+    return [doc['text'] for doc in documents], 'corpus sintetico'
+
+
+def run_benchmark(num_docs=300, seed=42):
+    chunker = TokenChunker.for_model(MODEL_NAME)
+    texts, origin = load_texts(num_docs, seed)
+
+    report = {
+        'model': MODEL_NAME,
+        'max_seq_length': chunker.max_seq_length,
+        'documents': len(texts),
+        'origin': origin,
+        'chunkers': {},
+    }
+
+    start = time.perf_counter()
+    word_chunks = [chunk for text in texts for chunk in chunk_text(text)]
+    word_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    token_chunks = [chunk for chunks in chunker.chunk_many(texts) for chunk in chunks]
+    token_seconds = time.perf_counter() - start
+
+    # Token dei documenti: la base per la copertura dei due chunker
+    document_tokens = chunker.stats['document_tokens']
+    report['document_tokens'] = document_tokens
+
+    for name, chunks, seconds in (
+        ('words_800', word_chunks, word_seconds),
+        ('tokens', token_chunks, token_seconds),
+    ):
+        stats = truncation_report(chunks, chunker.tokenizer, chunker.max_seq_length)
+        stats['chunk_seconds'] = round(seconds, 3)
+        # Quota del testo dei documenti che arriva davvero all'encoder
+        stats['coverage'] = round(
+            min(stats['encoded_tokens'], document_tokens) / document_tokens, 4
+        ) if document_tokens else 0.0
+        report['chunkers'][name] = stats
+
+    return report
+
+
+def print_report(report):
+    print("\n" + "=" * 60)
+    print("📊 CHUNKING: TOKEN CODIFICATI VS TRONCATI")
+    print("=" * 60)
+    print(f"Documenti: {report['documents']} ({report['origin']})  "
+          f"token: {report['document_tokens']}  max_seq_length: {report['max_seq_length']}")
+    print()
+    print(f"{'chunker':<12}{'chunk':>8}{'token':>10}{'codificati':>12}{'troncati':>10}"
+          f"{'% tronc.':>10}{'copertura':>11}{'s':>7}")
+
+    for name, s in report['chunkers'].items():
+        print(f"{name:<12}{s['chunks']:>8}{s['tokens']:>10}{s['encoded_tokens']:>12}"
+              f"{s['discarded_tokens']:>10}{s['discarded_ratio']:>10.1%}{s['coverage']:>11.1%}"
+              f"{s['chunk_seconds']:>7.2f}")
+
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark del chunking in token")
+    parser.add_argument('--docs', type=int, default=300, help="documenti da usare")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="salva il report in JSON")
+    args = parser.parse_args()
+
+    report = run_benchmark(num_docs=args.docs, seed=args.seed)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report salvato: {args.output}")
@@ -0,0 +1,182 @@
+"""
+Load test: richieste concorrenti con e senza micro-batching dell'encoder
+Posizione: /scripts/benchmark_concurrency.py
+
+Costruisce una knowledge base sintetica (come benchmark_retrieval.py) in una
+directory temporanea, carica un RAGBot e, per ogni livello di concorrenza,
+manda le stesse domande da N thread client:
+
+    serial      ogni richiesta fa il proprio forward del modello (uno alla volta)
+    microbatch  le domande arrivate entro max_wait_ms condividono un forward
+                e una ricerca multi-embedding
+
+Ogni domanda porta un suffisso univoco per run, quindi le cache degli
+embedding non nascondono il costo del modello. Il report riporta QPS e
+latenza p50/p95/p99 di retrieve() e lo speedup del micro-batching.
+
+Uso:
+    python scripts/benchmark_concurrency.py
+    python scripts/benchmark_concurrency.py --docs 1000 --concurrency 1,8,32 --output load.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from benchmark_retrieval import CorpusGenerator, git_commit, percentiles
+from build_knowledge import build_rag_database
+from document_store import DocumentStore
+from microbatch import DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT_MS, MicroBatcher
+
+
+def run_load(bot, queries, concurrency, tag):
+    """Tutte le domande da `concurrency` thread client: QPS e latenze"""
+    queries = [f"{query} {tag}{i}" for i, query in enumerate(queries)]
+
+    def timed(query):
+        start = time.perf_counter()
+        bot.retrieve(query, top_k=5)
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(timed, queries))
+    elapsed = time.perf_counter() - start
+
+    return {'qps': round(len(queries) / elapsed, 1), **percentiles(latencies)}
+
+
+def run_benchmark(num_docs=300, num_queries=256, levels=(1, 4, 16, 32),
+                  max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS,
+                  seed=42, verbose=False):
+    generator = CorpusGenerator(seed)
+    documents = generator.documents(num_docs)
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(),
+        'documents': num_docs,
+        'queries': num_queries,
+        'max_batch_size': max_batch_size,
+        'max_wait_ms': max_wait_ms,
+        'levels': [],
+    }
+
+    workdir = Path(tempfile.mkdtemp(prefix='rag_load_'))
+    original_cwd = os.getcwd()
+    output = io.StringIO()
+
+    try:
+        os.chdir(workdir)
+        DocumentStore(workdir / 'data').append(documents)
+
+        print(f"🏗️  Build {num_docs} documenti...")
+        with contextlib.redirect_stdout(sys.stdout if verbose else output):
+            build_rag_database(incremental=False)
+
+        import app
+
+        bot = app.RAGBot()
+        print("🚀 Caricamento knowledge base...")
+        with contextlib.redirect_stdout(sys.stdout if verbose else output):
+            bot.load_knowledge_base()
+        report['chunks'] = len(bot.index)
+        report['encoder'] = bot.model.backend
+
+        batcher = MicroBatcher(
+            bot._dense_search_traced,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+            name='bench-microbatch'
+        )
+
+        for level in levels:
+            queries = generator.queries(num_queries)
+            print(f"⚡ {level} client concorrenti...")
+
+            bot.batcher = None
+            serial = run_load(bot, queries, level, f"s{level}_")
+
+            bot.batcher = batcher
+            before = batcher.stats()
+            batched = run_load(bot, queries, level, f"m{level}_")
+            after = batcher.stats()
+            batches = after['batches'] - before['batches']
+            batched['mean_batch'] = round(
+                (after['items'] - before['items']) / batches, 2
+            ) if batches else 0.0
+
+            report['levels'].append({
+                'concurrency': level,
+                'serial': serial,
+                'microbatch': batched,
+                'speedup_qps': round(batched['qps'] / serial['qps'], 2) if serial['qps'] else None,
+            })
+
+        batcher.close()
+    finally:
+        os.chdir(original_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return report
+
+
+def print_report(report):
+    print("\n" + "=" * 72)
+    print("📊 LOAD TEST: SERIALE vs MICRO-BATCH")
+    print("=" * 72)
+    print(f"{report['documents']} documenti, {report.get('chunks', '?')} chunk, "
+          f"{report['queries']} domande per livello, encoder {report.get('encoder', '?')}, "
+          f"batch max {report['max_batch_size']} / {report['max_wait_ms']} ms")
+    print()
+    print(f"{'client':>7}{'QPS ser.':>10}{'p95 ser.':>10}{'QPS batch':>11}{'p95 batch':>11}"
+          f"{'batch medio':>13}{'speedup':>9}")
+
+    for level in report['levels']:
+        serial, batched = level['serial'], level['microbatch']
+        print(f"{level['concurrency']:>7}{serial['qps']:>10.1f}{serial['p95_ms']:>10.1f}"
+              f"{batched['qps']:>11.1f}{batched['p95_ms']:>11.1f}{batched['mean_batch']:>13.2f}"
+              f"{level['speedup_qps']:>8.2f}x")
+
+    print("=" * 72)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test del micro-batching dell'encoder")
+    parser.add_argument('--docs', type=int, default=300, help="documenti del corpus sintetico")
+    parser.add_argument('--queries', type=int, default=256, help="domande per livello")
+    parser.add_argument('--concurrency', default='1,4,16,32', help="client concorrenti, separati da virgola")
+    parser.add_argument('--max-batch-size', type=int, default=DEFAULT_MAX_BATCH_SIZE)
+    parser.add_argument('--max-wait-ms', type=float, default=DEFAULT_MAX_WAIT_MS,
+                        help="attesa del batch (0: nessuna attesa, accorpa solo le domande già in coda)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--verbose', action='store_true', help="mostra l'output di build e caricamento")
+    parser.add_argument('--output', help="salva il report in JSON")
+    args = parser.parse_args()
+
+    output_path = Path(args.output).resolve() if args.output else None
+
+    report = run_benchmark(
+        num_docs=args.docs,
+        num_queries=args.queries,
+        levels=[int(level) for level in args.concurrency.split(',')],
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        seed=args.seed,
+        verbose=args.verbose
+    )
+    print_report(report)
+
+    if output_path:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report salvato: {output_path}")
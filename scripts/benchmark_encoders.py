@@ -0,0 +1,200 @@
+"""
+Confronto encoder PyTorch vs ONNX Runtime int8: latenza, throughput e drift
+Posizione: /scripts/benchmark_encoders.py
+
+    latenza     una domanda alla volta (come la chat), p50/p95 in ms
+    throughput  chunk al secondo in batch (come build_knowledge.py)
+    drift       similarità coseno tra embedding ONNX e PyTorch degli stessi
+                testi, più l'accordo del top-k nella ricerca sui chunk
+
+I testi vengono dall'artifact knowledge/ se presente, altrimenti da
+data/documents.sqlite.
+
+Uso:
+    python scripts/benchmark_encoders.py
+    python scripts/benchmark_encoders.py --chunks 256 --output encoders.json
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from document_store import DocumentStore
+from encoders import ONNX_AVAILABLE, OnnxEncoder, TorchEncoder
+from knowledge_artifact import ARTIFACT_DIR, KnowledgeArtifact, artifact_exists
+from vector_backends import NumpyBackend
+
+
+MODEL_NAME = 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'
+
+SAMPLE_QUERIES = [
+    "Quando scadono le domande di mobilità?",
+    "OM 88",
+    "Come funzionano le graduatorie GPS?",
+    "Supplenze personale ATA",
+    "Requisiti per il concorso docenti",
+    "Nota ministeriale sulle immissioni in ruolo",
+    "DM 242",
+    "Contratto integrativo mobilità annuale",
+]
+
+
+def load_corpus(num_chunks):
+    """Chunk di testo reali su cui misurare throughput e drift"""
+    if artifact_exists(ARTIFACT_DIR):
+        artifact = KnowledgeArtifact.open(ARTIFACT_DIR)
+        return [artifact.texts[i] for i in range(min(num_chunks, len(artifact)))]
+
+    texts = []
+    for doc in DocumentStore().iter_documents():
+        words = doc.get('text', '').split()
+        texts.extend(' '.join(words[i:i + 800]) for i in range(0, len(words), 700))
+        if len(texts) >= num_chunks:
+            break
+    return texts[:num_chunks]
+
+
+def measure(encoder, queries, corpus, batch_size, rounds):
+    encoder.encode(queries[:1])  # warm-up
+
+    latencies = []
+    for _ in range(rounds):
+        for query in queries:
+            start = time.perf_counter()
+            encoder.encode([query])
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    embeddings = encoder.encode(corpus, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'latency_p50_ms': round(float(np.percentile(latencies, 50)), 2),
+        'latency_p95_ms': round(float(np.percentile(latencies, 95)), 2),
+        'throughput_chunks_per_s': round(len(corpus) / elapsed, 1),
+        'batch_seconds': round(elapsed, 2),
+    }, embeddings
+
+
+def cosine(a, b):
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return np.sum(a * b, axis=1)
+
+
+def model_revision(model_name):
+    """
+    Commit dei pesi nella cache Hugging Face (None se il modello non viene dall'hub)
+
+    Finisce nel report: i numeri di drift valgono solo per quella revisione.
+    """
+    try:
+        from huggingface_hub import snapshot_download
+
+        return Path(snapshot_download(model_name, local_files_only=True)).name
+    except Exception:
+        return None
+
+
+def run_benchmark(num_chunks=128, batch_size=32, rounds=5, top_k=5):
+    corpus = load_corpus(num_chunks)
+    if not corpus:
+        raise ValueError("Nessun testo disponibile per il benchmark")
+
+    print(f"🔢 {len(corpus)} chunk, {len(SAMPLE_QUERIES)} domande x {rounds} giri")
+
+    print("🤖 Encoder PyTorch...")
+    torch_encoder = TorchEncoder(MODEL_NAME)
+    torch_stats, torch_corpus = measure(torch_encoder, SAMPLE_QUERIES, corpus, batch_size, rounds)
+
+    report = {
+        'model': MODEL_NAME,
+        'model_revision': model_revision(MODEL_NAME),
+        'chunks': len(corpus),
+        'batch_size': batch_size,
+        'torch': torch_stats,
+    }
+
+    if not ONNX_AVAILABLE:
+        print("⚠️  onnxruntime non installato: solo baseline PyTorch")
+        return report
+
+    print("🤖 Encoder ONNX int8...")
+    onnx_encoder = OnnxEncoder(MODEL_NAME)
+    onnx_stats, onnx_corpus = measure(onnx_encoder, SAMPLE_QUERIES, corpus, batch_size, rounds)
+    report['onnx'] = onnx_stats
+
+    torch_queries = torch_encoder.encode(SAMPLE_QUERIES)
+    onnx_queries = onnx_encoder.encode(SAMPLE_QUERIES)
+    similarity = cosine(torch_corpus, onnx_corpus)
+
+    # Stessa ricerca con gli embedding dei due encoder: quanti top-k coincidono
+    torch_results = NumpyBackend(torch_corpus).search(torch_queries, top_k)
+    onnx_results = NumpyBackend(onnx_corpus).search(onnx_queries, top_k)
+    overlap = np.mean([
+        len({r for r, _ in a} & {r for r, _ in b}) / max(len(a), 1)
+        for a, b in zip(torch_results, onnx_results)
+    ])
+
+    report['drift'] = {
+        'cosine_mean': round(float(similarity.mean()), 5),
+        'cosine_min': round(float(similarity.min()), 5),
+        f'top{top_k}_overlap': round(float(overlap), 4),
+    }
+    report['speedup'] = {
+        'latency_p50': round(torch_stats['latency_p50_ms'] / onnx_stats['latency_p50_ms'], 2),
+        'throughput': round(
+            onnx_stats['throughput_chunks_per_s'] / torch_stats['throughput_chunks_per_s'], 2
+        ),
+    }
+
+    return report
+
+
+def print_report(report):
+    print("\n" + "=" * 60)
+    print("📊 ENCODER: PYTORCH vs ONNX INT8")
+    print("=" * 60)
+    print(f"Modello: {report['model']} @ {report.get('model_revision') or 'revisione sconosciuta'}")
+    print(f"{'encoder':<10}{'p50 ms':>10}{'p95 ms':>10}{'chunk/s':>12}")
+
+    for name in ('torch', 'onnx'):
+        if name in report:
+            stats = report[name]
+            print(f"{name:<10}{stats['latency_p50_ms']:>10.2f}{stats['latency_p95_ms']:>10.2f}"
+                  f"{stats['throughput_chunks_per_s']:>12.1f}")
+
+    if 'drift' in report:
+        print()
+        print(f"Speedup latenza:      {report['speedup']['latency_p50']}x")
+        print(f"Speedup throughput:   {report['speedup']['throughput']}x")
+        for key, value in report['drift'].items():
+            print(f"Drift {key + ':':<15} {value}")
+
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark encoder PyTorch vs ONNX")
+    parser.add_argument('--chunks', type=int, default=128, help="chunk per throughput e drift")
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--rounds', type=int, default=5, help="ripetizioni delle domande")
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--output', help="salva il report in JSON")
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        num_chunks=args.chunks,
+        batch_size=args.batch_size,
+        rounds=args.rounds,
+        top_k=args.top_k
+    )
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report salvato: {args.output}")
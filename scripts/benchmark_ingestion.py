@@ -0,0 +1,469 @@
+"""
+Benchmark offline di scraping e download con un sito locale al posto delle fonti reali
+Posizione: /scripts/benchmark_ingestion.py
+
+Ogni fonte (Orizzonte Scuola, FLC CGIL, MIM, CISL Scuola, USR Lazio) è
+simulata da un server HTTP locale su una porta propria, così il limite
+per host di HostRateLimiter si comporta come con i siti veri. I server
+espongono feed RSS, pagine indice, articoli HTML e PDF con latenza e tasso
+di errore configurabili, e rispondono 304 alle richieste condizionali.
+
+Con --fixtures si possono servire risposte registrate: il file
+<fixtures>/<sito>/<path> (es. mim/web/guest/normativa) sostituisce la
+pagina generata.
+
+Misure riportate (JSON con --output):
+    documenti/s e byte/s di scrape_all_sources() e fetch_all_documents()
+    tempo di attesa (pause di cortesia, latenza simulata) vs. lavoro (CPU)
+    richieste, errori iniettati e risposte 304 per sito
+
+Uso:
+    python scripts/benchmark_ingestion.py
+    python scripts/benchmark_ingestion.py --latency-ms 300 --error-rate 0.05 --output ingest.json
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unicodedata
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+from scrape_sources import (
+    CISLScuolaScraper,
+    MIMNormativaScraper,
+    RSSFeedScraper,
+    USRLazioScraper,
+    scrape_all_sources,
+)
+from document_store import DocumentStore
+from fetch_documents import HostRateLimiter, fetch_all_documents
+
+
+WORDS = """
+scuola docenti studenti dirigente mobilità graduatorie supplenze concorso ruolo
+immissioni personale ata contratto integrativo ministero ufficio regionale domanda
+scadenza requisiti titoli punteggio servizio anno scolastico bando decreto
+ordinanza nota circolare allegato organico posti cattedre sostegno formazione
+neoassunti esami calendario inclusione retribuzione permessi pensione piattaforma
+istanze online procedura pubblicazione elenchi esiti
+""".split()
+
+
+class SiteContent:
+    """Pagine deterministiche di un sito simulato"""
+
+    def __init__(self, seed, items):
+        self.seed = seed
+        self.items = items
+
+    def rng(self, *key):
+        return random.Random(f"{self.seed}:{':'.join(map(str, key))}")
+
+    def paragraph(self, rng, words=60):
+        text = ' '.join(rng.choice(WORDS) for _ in range(words))
+        return text.capitalize() + '.'
+
+    def article_html(self, path):
+        rng = self.rng(path)
+        paragraphs = ''.join(f"<p>{self.paragraph(rng)}</p>" for _ in range(rng.randint(4, 20)))
+        return (
+            f"<html><head><title>{self.paragraph(rng, 6)}</title><script>var x=1;</script></head>"
+            f"<body><nav><a href='/'>Home</a></nav><article><h1>{self.paragraph(rng, 8)}</h1>"
+            f"{paragraphs}</article><footer>Footer</footer></body></html>"
+        )
+
+    def pdf(self, path):
+        rng = self.rng(path)
+        text = ' '.join(self.paragraph(rng) for _ in range(rng.randint(5, 30)))
+        return make_pdf(text)
+
+    def rss(self, base_url, section):
+        rng = self.rng('rss', section)
+        entries = []
+        for i in range(self.items):
+            # Circa metà degli articoli ha il testo completo nel feed (niente fetch)
+            full = rng.random() < 0.5
+            body = ''.join(f"<p>{self.paragraph(rng)}</p>" for _ in range(6 if full else 1))
+            entries.append(
+                f"<item><title>{escape(self.paragraph(rng, 8))}</title>"
+                f"<link>{base_url}/{section}/articoli/{i}.html</link>"
+                f"<pubDate>{formatdate(1767225600 - i * 3600)}</pubDate>"
+                f"<description>{escape(body)}</description></item>"
+            )
+        return (
+            "<?xml version='1.0' encoding='UTF-8'?><rss version='2.0'><channel>"
+            f"<title>{section}</title>{''.join(entries)}</channel></rss>"
+        )
+
+    def listing(self, kind):
+        rng = self.rng('listing', kind)
+        links = []
+        for i in range(self.items):
+            title = escape(self.paragraph(rng, 6))
+            if kind == 'mim':
+                href = f"/normativa/decreto-{i}.pdf" if i % 3 == 0 else f"/normativa/circolare-{i}.html"
+                links.append(f"<li>01/09/2025 <a href='{href}'>Decreto {title}</a></li>")
+            elif kind == 'cisl':
+                links.append(
+                    f"<article><h2><a href='/cisl/notizie/{i}.html'>{title}</a></h2>"
+                    f"<span class='post-date'>0{i % 9 + 1}/10/2025</span></article>"
+                )
+            else:
+                href = f"/comunicazioni/{i}.pdf" if i % 4 == 0 else f"/comunicazioni/{i}.html"
+                links.append(f"<p><a href='{href}'>Comunicazione {title}</a></p>")
+        return f"<html><body><main>{''.join(links)}</main></body></html>"
+
+
+def make_pdf(text):
+    """PDF minimale valido (una pagina di testo Helvetica) estraibile da PyPDF2"""
+    ascii_text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode()
+    words = ascii_text.split()
+    lines = [' '.join(words[i:i + 14]) for i in range(0, len(words), 14)][:60]
+    escaped = [line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)') for line in lines]
+    stream = "BT /F1 10 Tf 40 800 Td 12 TL " + ' '.join(f"({line}) '" for line in escaped) + " ET"
+
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+        "/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream",
+    ]
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n{body}\nendobj\n".encode('latin-1'))
+
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Risponde come uno dei siti sorgente, con latenza ed errori simulati"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        site = self.server.site
+        path = self.path.split('?')[0]
+
+        delay = site.latency * random.uniform(0.5, 1.5)
+        time.sleep(delay)
+
+        if random.random() < site.error_rate:
+            site.record(delay, 0, error=True)
+            return self._send(503, b"Service Unavailable", 'text/plain')
+
+        body, content_type = site.resolve(path)
+        if body is None:
+            site.record(delay, 0, error=True)
+            return self._send(404, b"Not Found", 'text/plain')
+
+        etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+        if self.headers.get('If-None-Match') == etag:
+            site.record(delay, 0, not_modified=True)
+            return self._send(304, b'', content_type, etag)
+
+        site.record(delay, len(body))
+        self._send(200, body, content_type, etag)
+
+    def _send(self, status, body, content_type, etag=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if etag:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+
+class StandInSite:
+    """Un sito simulato su una porta locale dedicata"""
+
+    def __init__(self, name, kind, content, latency, error_rate, fixtures=None):
+        self.name = name
+        self.kind = kind
+        self.content = content
+        self.latency = latency
+        self.error_rate = error_rate
+        self.fixtures = Path(fixtures) / name if fixtures else None
+
+        self.requests = 0
+        self.errors = 0
+        self.not_modified = 0
+        self.bytes_sent = 0
+        self.latency_seconds = 0.0
+        self._lock = threading.Lock()
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        self.server.daemon_threads = True
+        self.server.site = self
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def record(self, delay, size, error=False, not_modified=False):
+        with self._lock:
+            self.requests += 1
+            self.errors += error
+            self.not_modified += not_modified
+            self.bytes_sent += size
+            self.latency_seconds += delay
+
+    def resolve(self, path):
+        """Corpo e content type della risorsa (None se inesistente)"""
+        if self.fixtures is not None:
+            recorded = self.fixtures / path.strip('/')
+            if recorded.is_file():
+                content_type = 'application/pdf' if path.endswith('.pdf') else 'text/html'
+                return recorded.read_bytes(), content_type
+
+        if path.endswith('.pdf'):
+            return self.content.pdf(f"{self.name}{path}"), 'application/pdf'
+        if path.endswith('.html'):
+            return self.content.article_html(f"{self.name}{path}").encode(), 'text/html; charset=utf-8'
+        if self.kind == 'rss' and (path.endswith('/feed/') or path == '/rss/'):
+            section = path.strip('/').split('/')[0]
+            return self.content.rss(self.base_url, section).encode(), 'application/rss+xml'
+        if self.kind in ('mim', 'cisl', 'usr'):
+            return self.content.listing(self.kind).encode(), 'text/html; charset=utf-8'
+        return None, None
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'not_modified': self.not_modified,
+            'bytes': self.bytes_sent,
+            'simulated_latency_seconds': round(self.latency_seconds, 2),
+        }
+
+
+def start_sites(items, latency, error_rate, seed, fixtures=None):
+    content = SiteContent(seed, items)
+    sites = {
+        name: StandInSite(name, kind, content, latency, error_rate, fixtures).start()
+        for name, kind in [
+            ('orizzontescuola', 'rss'),
+            ('flcgil', 'rss'),
+            ('mim', 'mim'),
+            ('cisl', 'cisl'),
+            ('usr', 'usr'),
+        ]
+    }
+    return sites
+
+
+def build_standin_scrapers(sites):
+    """Stessi scraper di build_scrapers(), puntati sui siti locali"""
+    orizzonte = sites['orizzontescuola'].base_url
+    return [
+        RSSFeedScraper('Orizzonte Scuola - Diventare Insegnanti', f"{orizzonte}/diventareinsegnanti/feed/"),
+        RSSFeedScraper('Orizzonte Scuola - ATA', f"{orizzonte}/ata/feed/"),
+        RSSFeedScraper('Orizzonte Scuola - Mobilità', f"{orizzonte}/mobilita/feed/"),
+        RSSFeedScraper('FLC CGIL', f"{sites['flcgil'].base_url}/rss/"),
+        MIMNormativaScraper('MIM - Normativa', f"{sites['mim'].base_url}/web/guest/normativa"),
+        CISLScuolaScraper('CISL Scuola Roma e Rieti', f"{sites['cisl'].base_url}/cisl/notizie/"),
+        USRLazioScraper('USR Lazio', f"{sites['usr'].base_url}/home/"),
+    ]
+
+
+def snapshot(sites):
+    return {name: site.stats() for name, site in sites.items()}
+
+
+def delta(after, before):
+    return {
+        name: {key: round(value - before[name][key], 2) for key, value in stats.items()}
+        for name, stats in after.items()
+    }
+
+
+def measure(fn, sites, verbose):
+    """Esegue una fase misurando tempo reale, CPU e traffico dei siti"""
+    before = snapshot(sites)
+    output = io.StringIO()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+
+    with contextlib.redirect_stdout(sys.stdout if verbose else output):
+        result = fn()
+
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    per_site = delta(snapshot(sites), before)
+
+    return result, {
+        'wall_seconds': round(wall, 2),
+        'cpu_seconds': round(cpu, 2),
+        'requests': sum(s['requests'] for s in per_site.values()),
+        'errors': sum(s['errors'] for s in per_site.values()),
+        'not_modified': sum(s['not_modified'] for s in per_site.values()),
+        'bytes': sum(s['bytes'] for s in per_site.values()),
+        'simulated_latency_seconds': round(
+            sum(s['simulated_latency_seconds'] for s in per_site.values()), 2
+        ),
+        'sites': per_site,
+    }
+
+
+def run_benchmark(items=40, latency_ms=150, error_rate=0.02, max_docs=100, workers=8,
+                  per_host=2, min_delay=1.0, max_delay=3.0, sequential=False, seed=42,
+                  fixtures=None, verbose=False):
+    random.seed(seed)
+    sites = start_sites(items, latency_ms / 1000, error_rate, seed, fixtures)
+
+    workdir = Path(tempfile.mkdtemp(prefix='rag_ingest_'))
+    original_cwd = os.getcwd()
+    report = {
+        'config': {
+            'items_per_source': items, 'latency_ms': latency_ms, 'error_rate': error_rate,
+            'max_docs': max_docs, 'workers': workers, 'per_host': per_host,
+            'min_delay': min_delay, 'max_delay': max_delay, 'sequential': sequential,
+        }
+    }
+
+    try:
+        os.chdir(workdir)
+        scrapers = build_standin_scrapers(sites)
+
+        print("🕷️  Scraping (cache HTTP vuota)...")
+        documents, scrape = measure(
+            lambda: scrape_all_sources(scrapers, parallel=not sequential), sites, verbose
+        )
+        scrape['documents'] = len(documents)
+        report['scrape'] = scrape
+
+        print("🕷️  Scraping ripetuto (richieste condizionali)...")
+        documents, rescrape = measure(
+            lambda: scrape_all_sources(build_standin_scrapers(sites), parallel=not sequential),
+            sites, verbose
+        )
+        rescrape['documents'] = len(documents)
+        report['scrape_conditional'] = rescrape
+
+        print("📥 Download documenti...")
+        limiter = HostRateLimiter(per_host_concurrency=per_host, min_delay=min_delay, max_delay=max_delay)
+        _, fetch = measure(
+            lambda: fetch_all_documents(
+                max_docs=max_docs, max_workers=workers, per_host_concurrency=per_host, limiter=limiter
+            ),
+            sites, verbose
+        )
+        fetch_stats = DocumentStore(workdir / 'data').load_stats()['stats']
+        fetch['documents'] = fetch_stats['fetched']
+        fetch['pdfs'] = fetch_stats['pdfs']
+        fetch['failed'] = fetch_stats['failed']
+        fetch['politeness_sleep_seconds'] = round(limiter.slept_seconds, 2)
+        report['fetch'] = fetch
+    finally:
+        os.chdir(original_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+        for site in sites.values():
+            site.stop()
+
+    for phase in ('scrape', 'scrape_conditional', 'fetch'):
+        stats = report[phase]
+        wall = stats['wall_seconds'] or 1e-9
+        stats['docs_per_second'] = round(stats['documents'] / wall, 2)
+        stats['bytes_per_second'] = round(stats['bytes'] / wall, 1)
+
+    return report
+
+
+def print_report(report):
+    print("\n" + "=" * 60)
+    print("📊 BENCHMARK INGESTIONE (siti locali)")
+    print("=" * 60)
+    config = report['config']
+    print(f"Latenza simulata: {config['latency_ms']} ms  errori: {config['error_rate']:.0%}  "
+          f"pause: {config['min_delay']}-{config['max_delay']}s")
+    print()
+    print(f"{'fase':<20}{'doc':>6}{'doc/s':>8}{'KB/s':>9}{'wall s':>8}{'CPU s':>7}{'req':>6}{'304':>5}{'err':>5}")
+
+    for phase in ('scrape', 'scrape_conditional', 'fetch'):
+        s = report[phase]
+        print(f"{phase:<20}{s['documents']:>6}{s['docs_per_second']:>8.1f}"
+              f"{s['bytes_per_second'] / 1024:>9.1f}{s['wall_seconds']:>8.1f}{s['cpu_seconds']:>7.1f}"
+              f"{s['requests']:>6}{s['not_modified']:>5}{s['errors']:>5}")
+
+    fetch = report['fetch']
+    print()
+    print(f"Download: {fetch['wall_seconds']}s reali, di cui per thread "
+          f"{fetch['politeness_sleep_seconds']}s in pause di cortesia e "
+          f"{fetch['simulated_latency_seconds']}s in latenza di rete simulata; "
+          f"CPU del processo {fetch['cpu_seconds']}s (estrazione PDF esclusa, in processi separati)")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark offline di scraping e download")
+    parser.add_argument('--items', type=int, default=40, help="voci per feed/pagina indice")
+    parser.add_argument('--latency-ms', type=float, default=150, help="latenza media per risposta")
+    parser.add_argument('--error-rate', type=float, default=0.02, help="frazione di risposte 503")
+    parser.add_argument('--max-docs', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--per-host', type=int, default=2)
+    parser.add_argument('--min-delay', type=float, default=1.0, help="pausa minima tra richieste allo stesso host")
+    parser.add_argument('--max-delay', type=float, default=3.0, help="pausa massima tra richieste allo stesso host")
+    parser.add_argument('--sequential', action='store_true', help="scraper uno alla volta")
+    parser.add_argument('--fixtures', help="directory con risposte registrate (<sito>/<path>)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--verbose', action='store_true', help="mostra l'output di scraping e download")
+    parser.add_argument('--output', help="salva il report in JSON")
+    args = parser.parse_args()
+
+    output_path = Path(args.output).resolve() if args.output else None
+    fixtures = Path(args.fixtures).resolve() if args.fixtures else None
+
+    report = run_benchmark(
+        items=args.items,
+        latency_ms=args.latency_ms,
+        error_rate=args.error_rate,
+        max_docs=args.max_docs,
+        workers=args.workers,
+        per_host=args.per_host,
+        min_delay=args.min_delay,
+        max_delay=args.max_delay,
+        sequential=args.sequential,
+        seed=args.seed,
+        fixtures=fixtures,
+        verbose=args.verbose
+    )
+    print_report(report)
+
+    if output_path:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report salvato: {output_path}")
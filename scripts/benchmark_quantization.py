@@ -0,0 +1,217 @@
+"""
+Report di dimensione e recall@k degli embedding quantizzati (float16 / int8)
+Posizione: /scripts/benchmark_quantization.py
+
+Confronta la ricerca esatta sulla matrice float32 della knowledge base con
+la stessa ricerca sui vettori float16 e int8 (con e senza rescoring float32
+dei candidati). Le domande sono righe dell'artifact perturbate con rumore
+gaussiano, così il benchmark non richiede il modello di embedding; con
+--real sono invece domande vere (quelle di benchmark_encoders.py più i
+titoli dei documenti) codificate con il modello dell'artifact.
+
+Le dimensioni sono quelle dell'intera directory knowledge/ riscritta in ogni
+formato (testi, metadati, BM25 e l'eventuale indice ChromaDB compresi) e il
+rapporto è calcolato sugli stessi byte.
+
+Uso:
+    python scripts/benchmark_quantization.py
+    python scripts/benchmark_quantization.py --real --queries 300
+    python scripts/benchmark_quantization.py --queries 500 --top-k 10 --output report.json
+"""
+
+import argparse
+import json
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from knowledge_artifact import ARTIFACT_DIR, KnowledgeArtifact, quantize_embeddings, write_artifact
+from vector_backends import NumpyBackend, normalize_rows
+
+
+def recall_at_k(results, baseline, full, queries):
+    """
+    Frazione dei top-k float32 ritrovati dalla variante
+
+    Chunk con lo stesso testo (es. paragrafi ripetuti in più circolari) hanno
+    lo stesso vettore: a pari punteggio float32 una riga vale l'altra, quindi
+    conta come trovata ogni riga con punteggio esatto non inferiore al k-esimo.
+    """
+    found = 0
+    total = 0
+    for rows, expected, query in zip(results, baseline, queries):
+        if not expected:
+            continue
+        expected_rows = [row for row, _ in expected]
+        threshold = float(np.min(full[expected_rows] @ query)) - 1e-6
+        result_rows = [row for row, _ in rows]
+        exact = full[result_rows] @ query if result_rows else np.empty(0)
+        found += min(len(expected), int(np.count_nonzero(exact >= threshold)))
+        total += len(expected)
+    return found / total if total else 1.0
+
+
+def timed_search(backend, queries, top_k):
+    start = time.perf_counter()
+    results = backend.search(queries, top_k)
+    return results, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def real_queries(artifact, num_queries, rng):
+    """Domande reali: esempi della chat più titoli distinti dei documenti"""
+    from benchmark_encoders import SAMPLE_QUERIES
+
+    titles = list(dict.fromkeys(
+        metadata.get('title', '') for metadata in artifact.metadatas if metadata.get('title')
+    ))
+    rng.shuffle(titles)
+    return (list(SAMPLE_QUERIES) + titles)[:num_queries]
+
+
+def artifact_bytes(artifact, full, dtype, keep_float, workdir):
+    """Byte su disco dell'intera directory knowledge/ scritta nel formato indicato"""
+    path = Path(workdir) / f"{dtype}{'_f32' if keep_float else ''}"
+    size = write_artifact(
+        path,
+        ids=artifact.ids,
+        texts=list(artifact.texts),
+        metadatas=artifact.metadatas,
+        embeddings=full,
+        manifest=artifact.manifest,
+        index_dir=artifact.index_path,
+        hashes=artifact.hashes,
+        lexical_index=artifact.lexical_index,
+        dtype=dtype,
+        keep_float=keep_float
+    )
+    shutil.rmtree(path)
+    return size
+
+
+def run_benchmark(artifact_dir=ARTIFACT_DIR, num_queries=200, top_k=10, noise=0.05,
+                  rescore_factor=4, seed=42, real=False):
+    artifact = KnowledgeArtifact.open(artifact_dir)
+    full = normalize_rows(artifact.float_vectors(slice(None)))
+    n, dim = full.shape
+
+    rng = np.random.default_rng(seed)
+
+    if real:
+        from encoders import create_encoder
+
+        texts = real_queries(artifact, num_queries, rng)
+        encoder = create_encoder(artifact.manifest.get('encoder', 'torch'), artifact.manifest['model_name'])
+        queries = normalize_rows(encoder.encode(texts))
+    else:
+        sample = rng.choice(n, size=min(num_queries, n), replace=False)
+        queries = normalize_rows(full[sample] + rng.normal(0, noise, (len(sample), dim)))
+
+    baseline_backend = NumpyBackend(full, normalized=True)
+    baseline, baseline_ms = timed_search(baseline_backend, queries, top_k)
+
+    # Dimensioni dell'artifact completo (testi, metadati, BM25 e l'eventuale
+    # indice ChromaDB della build misurata), non solo della matrice
+    workdir = tempfile.mkdtemp(prefix='rag_quant_')
+    try:
+        formats = (('float32', False), ('float16', False), ('float16', True),
+                   ('int8', False), ('int8', True))
+        sizes = {
+            f"{dtype}{'+rescore' if keep_float else ''}":
+                artifact_bytes(artifact, full, dtype, keep_float, workdir)
+            for dtype, keep_float in formats
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'artifact': str(artifact_dir),
+        'chunks': n,
+        'dim': dim,
+        'queries': len(queries),
+        'query_type': 'real' if real else 'noisy_rows',
+        'top_k': top_k,
+        'noise': None if real else noise,
+        'chroma_index': artifact.index_path is not None,
+        'variants': {
+            'float32': {
+                'bytes': sizes['float32'],
+                'size_ratio': 1.0,
+                f'recall@{top_k}': 1.0,
+                'ms_per_query': round(baseline_ms, 3),
+            }
+        }
+    }
+
+    for dtype in ('float16', 'int8'):
+        data, scales = quantize_embeddings(full, dtype)
+
+        variants = {
+            dtype: NumpyBackend(data, normalized=True, scales=scales),
+            f'{dtype}+rescore': NumpyBackend(
+                data, normalized=True, scales=scales,
+                full_embeddings=full, rescore_factor=rescore_factor
+            ),
+        }
+
+        for name, backend in variants.items():
+            results, ms = timed_search(backend, queries, top_k)
+            report['variants'][name] = {
+                # Le varianti +rescore includono la copia float32 (embeddings_f32.npy)
+                'bytes': sizes[name],
+                'size_ratio': round(sizes[name] / sizes['float32'], 4),
+                f'recall@{top_k}': round(recall_at_k(results, baseline, full, queries), 4),
+                'ms_per_query': round(ms, 3),
+            }
+
+    return report
+
+
+def print_report(report):
+    top_k = report['top_k']
+
+    print("\n" + "=" * 60)
+    print("📊 QUANTIZZAZIONE EMBEDDINGS")
+    print("=" * 60)
+    print(f"Chunk: {report['chunks']}  dim: {report['dim']}  "
+          f"domande: {report['queries']} ({report.get('query_type', 'noisy_rows')})  top-k: {top_k}")
+    print(f"Dimensioni: intera directory knowledge/"
+          f"{' (con indice ChromaDB)' if report.get('chroma_index') else ''}")
+    print()
+    print(f"{'variante':<18}{'MB':>10}{'ratio':>8}{'recall':>9}{'ms/q':>9}")
+
+    for name, stats in report['variants'].items():
+        print(f"{name:<18}{stats['bytes'] / (1024 * 1024):>10.2f}{stats['size_ratio']:>8.2f}"
+              f"{stats[f'recall@{top_k}']:>9.3f}{stats['ms_per_query']:>9.3f}")
+
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark embedding quantizzati")
+    parser.add_argument('--artifact', default=ARTIFACT_DIR, help="directory dell'artifact")
+    parser.add_argument('--queries', type=int, default=200, help="numero di domande campionate")
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--noise', type=float, default=0.05, help="rumore gaussiano sulle domande")
+    parser.add_argument('--rescore-factor', type=int, default=4)
+    parser.add_argument('--real', action='store_true',
+                        help="domande reali codificate con il modello invece di righe con rumore")
+    parser.add_argument('--output', help="salva il report in JSON")
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        artifact_dir=args.artifact,
+        num_queries=args.queries,
+        top_k=args.top_k,
+        noise=args.noise,
+        rescore_factor=args.rescore_factor,
+        real=args.real
+    )
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report salvato: {args.output}")
@@ -0,0 +1,321 @@
+"""
+Benchmark di build, avvio e retrieval su corpus sintetici di dimensione crescente
+Posizione: /scripts/benchmark_retrieval.py
+
+Per ogni dimensione richiesta genera documenti "simil-italiani" (lessico
+scolastico con distribuzione di Zipf, identificativi tipo "OM 88" e
+"DM 242", fonti e date), li passa a TokenChunker e build_rag_database()
+in una directory temporanea e misura:
+
+    build       tempo di chunking e di build, chunk, dimensione artifact
+    avvio       RAGBot.load_knowledge_base() su un bot nuovo
+    query       latenza p50/p95/p99 di retrieve(), generate_answer() e chat()
+                (domande nuove e ripetute, cioè con la cache degli embedding)
+    carico      QPS di retrieve() con più thread in parallelo
+
+Il risultato è un JSON con commit, configurazione e misure, confrontabile
+tra commit con --compare.
+
+Uso:
+    python scripts/benchmark_retrieval.py --sizes 300,3000 --output bench.json
+    python scripts/benchmark_retrieval.py --sizes 300 --compare bench_old.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from build_knowledge import MODEL_NAME, build_rag_database
+from chunking import TokenChunker
+from document_store import DocumentStore
+
+
+VOCABULARY = """
+scuola docente docenti studenti dirigente scolastico istituto classe classi
+mobilità graduatoria graduatorie supplenze supplenza concorso concorsi ruolo
+immissioni nomina nomine personale ata collaboratori amministrativi tecnici
+contratto contrattazione integrativo nazionale sindacato sindacale sindacati
+ministero ufficio scolastico regionale provinciale ambito territoriale sede sedi
+domanda domande scadenza termine termini presentazione modalità requisiti titoli
+punteggio punteggi servizio servizi anno scolastico anni valutazione prova prove
+orale scritta bando bandi decreto ordinanza nota circolare allegato allegati
+tabella tabelle organico organici posti posto cattedra cattedre sostegno
+infanzia primaria secondaria primo secondo grado licei tecnici professionali
+formazione aggiornamento neoassunti periodo prova tutor esami stato maturità
+calendario scolastico lezioni didattica inclusione disabilità alunni famiglie
+retribuzione stipendio arretrati aumento fondo istituzione scolastica ferie
+permessi assenze congedo malattia pensione pensionamento cessazione dimissioni
+piattaforma istanze online sito portale credenziali spid accesso procedura
+informatizzata entro giorni ore comunicazione pubblicazione elenchi esiti
+""".split()
+
+CONNECTIVES = "il la lo i gli le di del della dei delle per con su tra e o che non è sono".split()
+
+IDENTIFIER_PREFIXES = ['OM', 'DM', 'DPR', 'CCNI', 'nota', 'DDG']
+SOURCES = ['MIM', 'Orizzonte Scuola', 'FLC CGIL', 'CISL Scuola', 'USR Lazio']
+
+
+class CorpusGenerator:
+    """Documenti sintetici con lessico e struttura simili a quelli reali"""
+
+    def __init__(self, seed=42):
+        self.rng = np.random.default_rng(seed)
+        ranks = np.arange(1, len(VOCABULARY) + 1)
+        self.weights = (1.0 / ranks) / np.sum(1.0 / ranks)  # Zipf
+
+    def identifier(self):
+        prefix = self.rng.choice(IDENTIFIER_PREFIXES)
+        return f"{prefix} {self.rng.integers(1, 400)}"
+
+    def sentence(self):
+        length = int(self.rng.integers(8, 25))
+        words = []
+        for _ in range(length):
+            if self.rng.random() < 0.3:
+                words.append(self.rng.choice(CONNECTIVES))
+            else:
+                words.append(self.rng.choice(VOCABULARY, p=self.weights))
+        if self.rng.random() < 0.15:
+            words.insert(int(self.rng.integers(0, len(words))), self.identifier())
+        return ' '.join(words).capitalize() + '.'
+
+    def document(self, doc_id):
+        n_words = int(self.rng.lognormal(mean=6.3, sigma=0.7))  # mediana ~550 parole
+        sentences = []
+        total = 0
+        while total < n_words:
+            sentence = self.sentence()
+            sentences.append(sentence)
+            total += len(sentence.split())
+
+        source = SOURCES[doc_id % len(SOURCES)]
+        date = datetime(2025, 9, 1) + timedelta(days=int(self.rng.integers(0, 365)))
+        title = ' '.join(self.rng.choice(VOCABULARY, size=6, p=self.weights)).capitalize()
+
+        return {
+            'id': f"synthetic_{doc_id:06d}",
+            'url': f"https://example.org/{source.lower().replace(' ', '-')}/{doc_id}",
+            'title': f"{title} {self.identifier()}",
+            'source': source,
+            'date': date.strftime('%a, %d %b %Y 09:00:00 +0000'),
+            'document_type': 'html',
+            'text': ' '.join(sentences),
+        }
+
+    def documents(self, count):
+        return [self.document(i) for i in range(count)]
+
+    def queries(self, count):
+        """Mix di domande discorsive e di soli identificativi"""
+        queries = []
+        for _ in range(count):
+            if self.rng.random() < 0.2:
+                queries.append(self.identifier())
+            else:
+                words = self.rng.choice(VOCABULARY, size=int(self.rng.integers(3, 9)), p=self.weights)
+                queries.append(' '.join(words) + '?')
+        return queries
+
+
+def percentiles(samples_ms):
+    if not samples_ms:
+        return {}
+    return {
+        'p50_ms': round(float(np.percentile(samples_ms, 50)), 2),
+        'p95_ms': round(float(np.percentile(samples_ms, 95)), 2),
+        'p99_ms': round(float(np.percentile(samples_ms, 99)), 2),
+        'mean_ms': round(float(np.mean(samples_ms)), 2),
+    }
+
+
+def timed_calls(fn, inputs):
+    samples = []
+    for item in inputs:
+        start = time.perf_counter()
+        fn(item)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def directory_size(path):
+    return sum(f.stat().st_size for f in Path(path).rglob('*') if f.is_file())
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_size(num_docs, num_queries, concurrency, seed, verbose=False):
+    """Build + avvio + query su un corpus di num_docs documenti, in una directory temporanea"""
+    generator = CorpusGenerator(seed)
+    documents = generator.documents(num_docs)
+    result = {'documents': num_docs}
+
+    chunker = TokenChunker.for_model(MODEL_NAME)
+    start = time.perf_counter()
+    chunk_count = sum(len(chunks) for chunks in chunker.chunk_many([doc['text'] for doc in documents]))
+    result['chunk_seconds'] = round(time.perf_counter() - start, 3)
+    result['chunks'] = chunk_count
+
+    workdir = Path(tempfile.mkdtemp(prefix='rag_bench_'))
+    original_cwd = os.getcwd()
+
+    try:
+        os.chdir(workdir)
+        DocumentStore(workdir / 'data').append(documents)
+
+        print(f"🏗️  Build {num_docs} documenti ({chunk_count} chunk)...")
+        output = io.StringIO()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(sys.stdout if verbose else output):
+            build_rag_database(incremental=False)
+        result['build_seconds'] = round(time.perf_counter() - start, 2)
+        result['artifact_mb'] = round(directory_size(workdir / 'knowledge') / (1024 * 1024), 2)
+
+        import app
+
+        bot = app.RAGBot()
+        print("🚀 Caricamento knowledge base...")
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(sys.stdout if verbose else output):
+            bot.load_knowledge_base()
+        result['load_seconds'] = round(time.perf_counter() - start, 3)
+        result['backend'] = bot.index.backend.name
+        app.bot = bot
+
+        queries = generator.queries(num_queries)
+
+        print(f"🔎 {num_queries} domande...")
+        result['retrieve_cold'] = percentiles(timed_calls(bot.retrieve, queries))
+        result['retrieve_warm'] = percentiles(timed_calls(bot.retrieve, queries))
+
+        documents_of = {query: bot.retrieve(query) for query in queries}
+        result['generate_answer'] = percentiles(
+            timed_calls(lambda q: bot.generate_answer(q, documents_of[q]), queries)
+        )
+        result['chat'] = percentiles(timed_calls(lambda q: app.chat(q, []), queries))
+
+        print(f"⚡ Carico con {concurrency} thread...")
+        load_queries = generator.queries(num_queries)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(lambda q: timed_calls(bot.retrieve, [q])[0], load_queries))
+        elapsed = time.perf_counter() - start
+        result['concurrent'] = {
+            'threads': concurrency,
+            'qps': round(len(load_queries) / elapsed, 1),
+            **percentiles(latencies),
+        }
+
+        result['rss_mb'] = round(app.resident_memory_mb(), 1)
+    finally:
+        os.chdir(original_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return result
+
+
+def compare(current, baseline):
+    """Variazione percentuale delle metriche principali rispetto a un run precedente"""
+    print("\n" + "=" * 60)
+    print(f"📈 CONFRONTO con {baseline.get('commit')} ({baseline.get('timestamp', '')[:16]})")
+    print("=" * 60)
+
+    keys = [
+        ('build_seconds', None), ('load_seconds', None), ('artifact_mb', None),
+        ('retrieve_cold', 'p95_ms'), ('retrieve_warm', 'p95_ms'),
+        ('chat', 'p95_ms'), ('concurrent', 'qps'),
+    ]
+    old_by_size = {r['documents']: r for r in baseline.get('results', [])}
+
+    for result in current['results']:
+        old = old_by_size.get(result['documents'])
+        if old is None:
+            continue
+        print(f"\n{result['documents']} documenti:")
+        for key, sub in keys:
+            new_value = result[key][sub] if sub else result[key]
+            old_value = old.get(key, {}).get(sub) if sub else old.get(key)
+            if not old_value:
+                continue
+            delta = (new_value - old_value) / old_value * 100
+            label = f"{key}.{sub}" if sub else key
+            print(f"   {label:<22} {old_value:>10} -> {new_value:>10} ({delta:+.1f}%)")
+
+
+def print_report(report):
+    print("\n" + "=" * 60)
+    print("📊 BENCHMARK RETRIEVAL")
+    print("=" * 60)
+    print(f"{'docs':>7}{'chunk':>8}{'build s':>9}{'MB':>8}{'load s':>8}"
+          f"{'p50':>8}{'p95':>8}{'p99':>8}{'QPS':>8}")
+
+    for r in report['results']:
+        cold = r['retrieve_cold']
+        print(f"{r['documents']:>7}{r['chunks']:>8}{r['build_seconds']:>9.1f}{r['artifact_mb']:>8.1f}"
+              f"{r['load_seconds']:>8.2f}{cold['p50_ms']:>8.1f}{cold['p95_ms']:>8.1f}"
+              f"{cold['p99_ms']:>8.1f}{r['concurrent']['qps']:>8.1f}")
+
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark build/avvio/retrieval su corpus sintetici")
+    parser.add_argument('--sizes', default='300,3000', help="numeri di documenti separati da virgola")
+    parser.add_argument('--queries', type=int, default=200, help="domande per misura")
+    parser.add_argument('--concurrency', type=int, default=8, help="thread per la misura di QPS")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--verbose', action='store_true', help="mostra l'output di build e caricamento")
+    parser.add_argument('--output', help="salva i risultati in JSON")
+    parser.add_argument('--compare', help="JSON di un run precedente da confrontare")
+    args = parser.parse_args()
+
+    output_path = Path(args.output).resolve() if args.output else None
+    compare_path = Path(args.compare).resolve() if args.compare else None
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'config': vars(args),
+        'results': [],
+    }
+
+    for size in (int(s) for s in args.sizes.split(',')):
+        report['results'].append(
+            run_size(size, args.queries, args.concurrency, args.seed, verbose=args.verbose)
+        )
+
+    print_report(report)
+
+    if compare_path:
+        with open(compare_path, 'r', encoding='utf-8') as f:
+            compare(report, json.load(f))
+
+    if output_path:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Risultati salvati: {output_path}")
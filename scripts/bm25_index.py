@@ -0,0 +1,242 @@
+"""
+Indice lessicale BM25 compatto sui chunk della knowledge base
+Posizione: /scripts/bm25_index.py
+
+Le domande sulla normativa dipendono spesso da identificativi esatti
+("OM 88", "DM 242", "GPS", "CCNI") che la ricerca semantica gestisce male.
+L'indice invertito è salvato in formato CSR dentro l'artifact:
+
+    bm25_terms.txt          un termine per riga (riga = id del termine)
+    bm25_offsets.npy        offset int64 (V+1) delle posting list
+    bm25_docs.npy           righe dei chunk (int32), ordinate per termine
+    bm25_tf.npy             frequenza del termine nel chunk (uint16)
+    bm25_doc_lengths.npy    lunghezza in token di ogni chunk (int32)
+"""
+
+import re
+import unicodedata
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+
+TERMS_FILE = 'bm25_terms.txt'
+OFFSETS_FILE = 'bm25_offsets.npy'
+DOCS_FILE = 'bm25_docs.npy'
+TF_FILE = 'bm25_tf.npy'
+DOC_LENGTHS_FILE = 'bm25_doc_lengths.npy'
+
+K1 = 1.2
+B = 0.75
+
+STOPWORDS = frozenset("""
+a ad al alla alle agli ai all anche che chi ci con cui da dal dalla dalle dai dagli
+dall de dei del della delle degli dell di e ed gli i il in io la le li lo l ma ne
+nei nel nella nelle negli nell non o per più quale quali se si sia sono su sul
+sulla sulle sui sugli sull tra fra un una uno è
+""".split())
+
+_TOKEN_RE = re.compile(r'\w+')
+_DOTTED_ABBR_RE = re.compile(r'\b(?:[^\W\d_]\.){2,}')
+
+# Sigle seguite da un numero ("om 88", "dm 242", "om n. 88") diventano
+# anche un unico token ("om88"), così l'identificativo pesa come tale
+_MAX_PREFIX_LEN = 5
+_NUMBER_WORDS = frozenset(['n', 'nr', 'num', 'numero'])
+
+
+def tokenize(text):
+    """Token normalizzati (minuscole, senza stopword) più gli identificativi uniti"""
+    text = unicodedata.normalize('NFKC', text).lower()
+
+    # "D.M." -> "dm", "O.M." -> "om"
+    text = _DOTTED_ABBR_RE.sub(lambda m: m.group().replace('.', ''), text)
+
+    words = _TOKEN_RE.findall(text)
+    tokens = [w for w in words if w not in STOPWORDS]
+
+    for i, word in enumerate(words):
+        if not word.isdigit() or i == 0:
+            continue
+
+        prefix_pos = i - 1
+        if words[prefix_pos] in _NUMBER_WORDS and prefix_pos > 0:
+            prefix_pos -= 1
+
+        prefix = words[prefix_pos]
+        if prefix.isalpha() and len(prefix) <= _MAX_PREFIX_LEN:
+            tokens.append(prefix + word)
+
+    return tokens
+
+
+def identifier_tokens(tokens):
+    """Token che sono identificativi (lettere + cifre, es. "om88")"""
+    return [
+        t for t in tokens
+        if any(ch.isdigit() for ch in t) and any(ch.isalpha() for ch in t)
+    ]
+
+
+class BM25Index:
+    """Indice invertito BM25 in formato CSR (array numpy, apribili con mmap)"""
+
+    def __init__(self, terms, offsets, docs, tf, doc_lengths):
+        self.terms = terms
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.docs = docs
+        self.tf = tf
+        self.doc_lengths = doc_lengths
+        self.num_docs = len(doc_lengths)
+        self.avg_doc_length = float(np.mean(doc_lengths)) if self.num_docs else 0.0
+
+        df = np.diff(offsets).astype(np.float32)
+        self.idf = np.log1p((self.num_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        # Normalizzazione per lunghezza precalcolata: k1 * (1 - b + b * dl / avgdl)
+        if self.num_docs:
+            self._norm = (K1 * (1 - B + B * doc_lengths / self.avg_doc_length)).astype(np.float32)
+        else:
+            self._norm = np.zeros(0, dtype=np.float32)
+
+    def __len__(self):
+        return self.num_docs
+
+    @classmethod
+    def build(cls, texts):
+        """Costruisce l'indice da una lista di testi"""
+        postings = {}
+        doc_lengths = np.zeros(len(texts), dtype=np.int32)
+
+        for row, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lengths[row] = sum(counts.values())
+            for term, count in counts.items():
+                postings.setdefault(term, []).append((row, count))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        for i, term in enumerate(terms):
+            offsets[i + 1] = offsets[i] + len(postings[term])
+
+        docs = np.empty(offsets[-1], dtype=np.int32)
+        tf = np.empty(offsets[-1], dtype=np.uint16)
+        for i, term in enumerate(terms):
+            rows, counts = zip(*postings[term])
+            docs[offsets[i]:offsets[i + 1]] = rows
+            tf[offsets[i]:offsets[i + 1]] = np.minimum(counts, np.iinfo(np.uint16).max)
+
+        return cls(terms, offsets, docs, tf, doc_lengths)
+
+    @classmethod
+    def open(cls, path):
+        """Apre l'indice salvato in una directory (array in mmap)"""
+        path = Path(path)
+
+        with open(path / TERMS_FILE, 'r', encoding='utf-8') as f:
+            terms = f.read().splitlines()
+
+        return cls(
+            terms,
+            np.load(path / OFFSETS_FILE, mmap_mode='r'),
+            np.load(path / DOCS_FILE, mmap_mode='r'),
+            np.load(path / TF_FILE, mmap_mode='r'),
+            np.load(path / DOC_LENGTHS_FILE),
+        )
+
+    @staticmethod
+    def exists(path):
+        return (Path(path) / TERMS_FILE).exists()
+
+    def save(self, path):
+        path = Path(path)
+
+        with open(path / TERMS_FILE, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(self.terms))
+
+        np.save(path / OFFSETS_FILE, self.offsets)
+        np.save(path / DOCS_FILE, self.docs)
+        np.save(path / TF_FILE, self.tf)
+        np.save(path / DOC_LENGTHS_FILE, self.doc_lengths)
+
+    def has_terms(self, tokens):
+        return any(t in self.term_ids for t in tokens)
+
+    def search(self, query, top_k=5, rows=None):
+        """
+        Chunk con punteggio BM25 più alto
+
+        Args:
+            rows: array ordinato delle sole righe ammesse (partizione), None = tutte
+
+        Returns:
+            (righe, punteggi) ordinati per punteggio decrescente
+        """
+        tokens = tokenize(query)
+        term_ids = {self.term_ids[t] for t in tokens if t in self.term_ids}
+
+        if not term_ids or not self.num_docs or (rows is not None and not len(rows)):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        if rows is not None:
+            return self._search_rows(term_ids, top_k, np.asarray(rows, dtype=np.int64))
+
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.docs[start:end]
+            tf = self.tf[start:end].astype(np.float32)
+
+            # Ogni chunk compare una sola volta per termine: niente np.add.at
+            scores[docs] += self.idf[term_id] * tf * (K1 + 1) / (tf + self._norm[docs])
+
+        return self._top(scores, top_k)
+
+    def _search_rows(self, term_ids, top_k, rows):
+        """
+        Ricerca limitata a una partizione: si leggono solo le posting che cadono
+        nelle righe ammesse e i punteggi stanno in un array di len(rows)
+        """
+        # Intervalli contigui della partizione (di solito uno per fonte/periodo);
+        # le posting di ogni termine sono ordinate per riga
+        breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+        run_starts = rows[np.r_[0, breaks]]
+        run_ends = rows[np.r_[breaks - 1, len(rows) - 1]]
+
+        scores = np.zeros(len(rows), dtype=np.float32)
+
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            postings = self.docs[start:end]
+
+            lo = np.searchsorted(postings, run_starts, side='left')
+            hi = np.searchsorted(postings, run_ends, side='right')
+            spans = [(a, b) for a, b in zip(lo, hi) if b > a]
+            if not spans:
+                continue
+
+            positions = np.concatenate([np.arange(a, b) for a, b in spans]) + start
+            docs = self.docs[positions]
+            tf = self.tf[positions].astype(np.float32)
+
+            scores[np.searchsorted(rows, docs)] += (
+                self.idf[term_id] * tf * (K1 + 1) / (tf + self._norm[docs])
+            )
+
+        return self._top(scores, top_k, rows)
+
+    @staticmethod
+    def _top(scores, top_k, rows=None):
+        """Top-k dei punteggi non nulli; `rows` riporta le posizioni alle righe"""
+        matched = np.flatnonzero(scores)
+        if len(matched) > top_k:
+            top = np.argpartition(-scores[matched], top_k - 1)[:top_k]
+            matched = matched[top]
+
+        matched = matched[np.argsort(-scores[matched], kind='stable')]
+        found = matched if rows is None else rows[matched]
+
+        return found, scores[matched]
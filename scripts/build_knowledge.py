@@ -3,17 +3,39 @@ Script per costruire il database ChromaDB dal contenuto scaricato
 Posizione: /scripts/build_knowledge.py
 """
 
-import json
+import argparse
+import shutil
 from pathlib import Path
+import numpy as np
 import chromadb
-from sentence_transformers import SentenceTransformer
-import pickle
+from chromadb.api.client import SharedSystemClient
 from datetime import datetime
 
+from knowledge_artifact import (
+    ARTIFACT_DIR,
+    EMBEDDING_DTYPES,
+    KnowledgeArtifact,
+    artifact_exists,
+    chunk_hash,
+    write_artifact,
+)
+from embedding_cache import EmbeddingCache
+from encoders import DEFAULT_ENCODER_BACKEND, ENCODER_BACKENDS, cache_key, create_encoder, resolve_backend
+from bm25_index import BM25Index
+from chunking import TokenChunker, truncation_report
+from near_duplicates import DEFAULT_THRESHOLD, NearDuplicateDetector
+from document_store import DocumentStore, normalize_date
+from partitions import partition_order
+from vector_backends import EXACT_SEARCH_MAX_CHUNKS, normalize_rows, persist_collection
+
 
 def chunk_text(text, chunk_size=800, overlap=100):
     """
-    Divide il testo in chunk con overlap
+    Divide il testo in chunk di parole con overlap (chunker precedente)
+    
+    Il modello tronca a 128 token: di questi chunk viene codificato solo
+    l'inizio. La build usa TokenChunker (vedi chunking.py); questa funzione
+    resta come termine di confronto in benchmark_chunking.py.
     
     Args:
         text: testo da dividere
@@ -39,57 +61,242 @@ def chunk_text(text, chunk_size=800, overlap=100):
     return chunks
 
 
-def build_rag_database():
-    """Costruisce il database ChromaDB dai documenti fetchati"""
+MODEL_NAME = 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'
+COLLECTION_NAME = 'scuola_docs'
+CHUNK_DOC_BATCH = 64  # documenti le cui frasi vengono tokenizzate insieme
+MIN_DOC_CHARS = 100
+CHROMA_PATH = Path('./chroma_db')
+
+
+def load_previous_build(model_name, encoder='torch'):
+    """
+    Apre l'artifact della build precedente, se riutilizzabile
+
+    Returns:
+        KnowledgeArtifact oppure None (assente o di un altro modello/encoder)
+    """
+    if not artifact_exists(ARTIFACT_DIR):
+        return None
+
+    try:
+        previous = KnowledgeArtifact.open(ARTIFACT_DIR)
+    except Exception as e:
+        print(f"   ⚠️  Artifact precedente illeggibile: {e}")
+        return None
+
+    if previous.model_name != model_name:
+        print(f"   ⚠️  Artifact precedente creato con un altro modello ({previous.model_name})")
+        return None
+
+    if previous.manifest.get('encoder', 'torch') != encoder:
+        print(f"   ⚠️  Artifact precedente creato con un altro encoder ({previous.manifest.get('encoder', 'torch')})")
+        return None
+
+    return previous
+
+
+def same_artifact_format(previous, dtype, keep_float, ship_index):
+    """True se l'artifact precedente ha già il formato richiesto (riusabile tale e quale)"""
+    return (
+        previous.has_lexical_index
+        and previous.dtype == dtype
+        and (previous.full_embeddings is not None) == (keep_float and dtype != 'float32')
+        and (previous.index_path is not None) == ship_index
+    )
+
+
+def ship_chroma_index(chroma_index, num_chunks):
+    """
+    True se l'artifact deve includere l'indice ChromaDB
+
+    Args:
+        chroma_index: 'always', 'never' oppure 'auto' (solo oltre la soglia di
+            chunk a cui il backend 'auto' dell'app passa da NumPy a ChromaDB)
+    """
+    if chroma_index == 'auto':
+        return num_chunks > EXACT_SEARCH_MAX_CHUNKS
+    return chroma_index == 'always'
+
+
+def vector_precision(dtype, float_copy):
+    """Rango di precisione dei vettori (0 = float32, più alto = più perdita)"""
+    return 0 if float_copy else EMBEDDING_DTYPES.index(dtype)
+
+
+def find_near_duplicates(store, threshold=DEFAULT_THRESHOLD):
+    """
+    Primo passaggio sui documenti: gruppi di quasi duplicati (MinHash/LSH)
+
+    Returns:
+        (dict id -> id canonico, dict id canonico -> membri del gruppo, report per fonte)
+    """
+    detector = NearDuplicateDetector(threshold=threshold)
+    
+    for doc in store.iter_documents():
+        text = doc.get('text', '')
+        if text and len(text.strip()) >= MIN_DOC_CHARS:
+            detector.add(doc['id'], text, doc['url'], doc.get('source', ''))
+    
+    groups = detector.groups()
+    canonical = detector.canonical_ids()
+    return canonical, groups, detector.report()
+
+
+def update_chroma_index(previous_index, ids, chunks, metadatas, embeddings, to_upsert, removed_ids):
+    """
+    Aggiorna l'indice ChromaDB di lavoro (CHROMA_PATH) da includere nell'artifact
+
+    Args:
+        previous_index: indice della build precedente da cui partire (None = da zero,
+            e allora `to_upsert` deve contenere tutti i chunk)
+        to_upsert: indici dei chunk da scrivere
+        removed_ids: id dei chunk da togliere dall'indice precedente
+
+    Returns:
+        numero di chunk nella collection
+    """
+    
+    # Inizializza ChromaDB
+    print("🔧 Inizializzazione ChromaDB...")
+    
+    # Rimuovi DB di lavoro esistente se presente
+    if CHROMA_PATH.exists():
+        shutil.rmtree(CHROMA_PATH)
+        print("   ♻️  DB esistente rimosso")
+    
+    # In modalità incrementale si parte dall'indice della build precedente
+    if previous_index is not None:
+        shutil.copytree(previous_index, CHROMA_PATH)
+        print("   ♻️  Indice della build precedente ripristinato")
+    
+    # La directory è stata appena ricreata: niente client Chroma riusato dal
+    # processo (build ripetute nello stesso processo, es. benchmark)
+    SharedSystemClient.clear_system_cache()
+    client = chromadb.PersistentClient(path=str(CHROMA_PATH))
+    
+    # Crea collection
+    collection = client.get_or_create_collection(
+        name=COLLECTION_NAME,
+        metadata={"hnsw:space": "cosine"}
+    )
+    
+    print("   ✅ Collection pronta\n")
+    
+    # Aggiorna ChromaDB
+    print("💾 Aggiornamento database ChromaDB...")
+    
+    # ChromaDB ha un limite di ~40k documenti per batch
+    batch_size = 5000
+    
+    if previous_index is not None:
+        for i in range(0, len(removed_ids), batch_size):
+            collection.delete(ids=removed_ids[i:i + batch_size])
+    
+    for i in range(0, len(to_upsert), batch_size):
+        batch = to_upsert[i:i + batch_size]
+        
+        print(f"   Batch {i//batch_size + 1}: {len(batch)} chunk")
+        
+        collection.upsert(
+            ids=[ids[idx] for idx in batch],
+            embeddings=embeddings[batch].tolist(),
+            documents=[chunks[idx] for idx in batch],
+            metadatas=[metadatas[idx] for idx in batch]
+        )
+    
+    # Grafo HNSW completo su disco: l'app apre l'indice senza reinserire nulla
+    persist_collection(client, collection)
+    
+    print("   ✅ Database aggiornato\n")
+    
+    # Verifica
+    count = collection.count()
+    print(f"✅ Verifica: {count} documenti in ChromaDB\n")
+    
+    return count
+
+
+def build_rag_database(incremental=True, dtype='float32', keep_float=False,
+                       encoder=DEFAULT_ENCODER_BACKEND, dedup_threshold=DEFAULT_THRESHOLD,
+                       chroma_index='auto'):
+    """
+    Costruisce il database ChromaDB dai documenti fetchati
+
+    Args:
+        incremental: riusa gli embedding della build precedente e applica
+            alla collection solo upsert/delete dei chunk cambiati
+        dtype: formato degli embedding nell'artifact ('float32', 'float16', 'int8')
+        keep_float: con dtype quantizzato salva anche la copia float32
+            usata dall'app per il rescoring dei candidati
+        encoder: 'torch' (SentenceTransformer) oppure 'onnx' (ONNX Runtime int8)
+        dedup_threshold: similarità (Jaccard stimata) oltre la quale due
+            documenti sono lo stesso contenuto; None disattiva la deduplicazione
+        chroma_index: indice ChromaDB nell'artifact ('auto', 'always', 'never');
+            in 'auto' solo quando l'app non userebbe la ricerca esatta NumPy
+    """
     
     print("🧠 Costruzione Knowledge Base RAG...\n")
     
-    # Carica documenti fetchati
-    input_file = Path('data') / 'fetched_documents.json'
+    # Documenti fetchati: letti a blocchi dal database, non caricati tutti insieme
+    store = DocumentStore()
     
-    if not input_file.exists():
-        print(f"❌ File non trovato: {input_file}")
+    if not store.exists():
+        print(f"❌ File non trovato: {store.db_path}")
         print("   Esegui prima:")
         print("   1. python scripts/scrape_sources.py")
         print("   2. python scripts/fetch_documents.py")
         return None
     
-    with open(input_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    documents = data.get('documents', [])
+    total_docs = len(store)
     
-    if not documents:
+    if not total_docs:
         print("❌ Nessun documento trovato")
         return None
     
-    print(f"📚 Caricati {len(documents)} documenti\n")
+    print(f"📚 {total_docs} documenti in archivio\n")
     
-    # Inizializza ChromaDB
-    print("🔧 Inizializzazione ChromaDB...")
+    model_name = MODEL_NAME
+    encoder = resolve_backend(encoder)
     
-    # Rimuovi DB esistente se presente
-    chroma_path = Path('./chroma_db')
-    if chroma_path.exists():
-        import shutil
-        shutil.rmtree(chroma_path)
-        print("   ♻️  DB esistente rimosso")
+    # Build precedente (solo in modalità incrementale)
+    previous = load_previous_build(model_name, encoder) if incremental else None
     
-    client = chromadb.PersistentClient(path="./chroma_db")
+    if incremental and previous is None:
+        print("   ℹ️  Nessuna build precedente riutilizzabile: build completa\n")
     
-    # Crea collection
-    collection = client.get_or_create_collection(
-        name="scuola_docs",
-        metadata={"hnsw:space": "cosine"}
-    )
+    # Chunk misurati in token del modello (solo il tokenizer, non i pesi)
+    chunker = TokenChunker.for_model(model_name)
     
-    print("   ✅ Collection creata\n")
+    # Documenti nuovi dall'ultima build: query sul watermark salvato nel manifest
+    watermark = store.watermark()
+    previous_watermark = previous.manifest.get('documents_seq') if previous is not None else None
     
-    # Carica modello embeddings
-    print("🤖 Caricamento modello embeddings...")
-    model_name = 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'
-    model = SentenceTransformer(model_name)
-    print(f"   ✅ Modello caricato: {model_name}\n")
+    if previous_watermark is not None:
+        changed_docs = store.count_since(previous_watermark)
+        print(f"🆕 {changed_docs} documenti nuovi o aggiornati dall'ultima build\n")
+        
+        if (not changed_docs
+                and same_artifact_format(previous, dtype, keep_float,
+                                         ship_chroma_index(chroma_index, len(previous)))
+                and previous.manifest.get('chunker') == chunker.config()
+                and previous.manifest.get('dedup_threshold') == dedup_threshold):
+            print("✅ Nessun documento nuovo dall'ultima build: artifact invariato")
+            return previous.manifest
+    
+    # Quasi duplicati (stessa notizia da più canali): chunkato solo il canonico
+    canonical_ids, duplicate_groups = {}, {}
+    
+    if dedup_threshold is not None:
+        print(f"🧬 Ricerca quasi duplicati (MinHash/LSH, soglia {dedup_threshold})...")
+        canonical_ids, duplicate_groups, dedup_report = find_near_duplicates(store, dedup_threshold)
+        
+        for source, source_stats in sorted(dedup_report.items()):
+            print(f"   {source or 'N/A':<45} {source_stats['duplicates']:4d}/{source_stats['documents']:<4d} "
+                  f"duplicati ({source_stats['dedup_ratio']:.0%})")
+        
+        n_duplicates = sum(s['duplicates'] for s in dedup_report.values())
+        print(f"   ✅ {n_duplicates} documenti accorpati in "
+              f"{sum(1 for members in duplicate_groups.values() if len(members) > 1)} gruppi\n")
     
     # Processa documenti e crea chunk
     print("✂️  Chunking documenti...")
@@ -99,136 +306,365 @@ def build_rag_database():
     all_ids = []
     
     stats = {
-        'total_docs': len(documents),
+        'total_docs': total_docs,
         'processed_docs': 0,
         'total_chunks': 0,
-        'skipped_docs': 0
+        'skipped_docs': 0,
+        'duplicate_docs': 0
     }
     
-    for i, doc in enumerate(documents, 1):
-        text = doc.get('text', '')
-        
-        # Skip documenti senza testo
-        if not text or len(text.strip()) < 100:
-            print(f"  [{i}/{len(documents)}] ⏭️  Skip (testo insufficiente): {doc.get('title', 'N/A')[:50]}")
-            stats['skipped_docs'] += 1
-            continue
-        
-        print(f"  [{i}/{len(documents)}] ✂️  {doc.get('source', 'N/A')} - {len(text)} chars")
-        
-        # Crea chunk
-        chunks = chunk_text(text)
+    def document_blocks():
+        block = []
+        for item in enumerate(store.iter_documents(), 1):
+            block.append(item)
+            if len(block) == CHUNK_DOC_BATCH:
+                yield block
+                block = []
+        if block:
+            yield block
+    
+    for block in document_blocks():
+        to_chunk = []
         
-        if not chunks:
-            stats['skipped_docs'] += 1
-            continue
-        
-        # Aggiungi ogni chunk
-        for j, chunk in enumerate(chunks):
-            chunk_id = f"{doc['id']}_chunk_{j}"
+        for i, doc in block:
+            text = doc.get('text', '')
             
-            all_chunks.append(chunk)
-            all_ids.append(chunk_id)
+            # Skip documenti senza testo
+            if not text or len(text.strip()) < MIN_DOC_CHARS:
+                print(f"  [{i}/{total_docs}] ⏭️  Skip (testo insufficiente): {doc.get('title', 'N/A')[:50]}")
+                stats['skipped_docs'] += 1
+                continue
             
-            # Metadata per CitedAnswer
-            metadata = {
-                'source_url': doc['url'],
-                'title': doc.get('title', '')[:200],  # Limita lunghezza
-                'source': doc.get('source', ''),
-                'date': doc.get('date', ''),
-                'document_type': doc.get('document_type', 'unknown'),
-                'chunk_index': j,
-                'total_chunks': len(chunks)
-            }
+            if canonical_ids.get(doc['id'], doc['id']) != doc['id']:
+                print(f"  [{i}/{total_docs}] ⏭️  Duplicato di {canonical_ids[doc['id']]}: {doc.get('title', 'N/A')[:50]}")
+                stats['duplicate_docs'] += 1
+                continue
             
-            all_metadatas.append(metadata)
+            print(f"  [{i}/{total_docs}] ✂️  {doc.get('source', 'N/A')} - {len(text)} chars")
+            to_chunk.append(doc)
         
-        stats['processed_docs'] += 1
-        stats['total_chunks'] += len(chunks)
+        # Crea chunk (frasi del blocco tokenizzate in batch)
+        for doc, chunks in zip(to_chunk, chunker.chunk_many([doc['text'] for doc in to_chunk])):
+            if not chunks:
+                stats['skipped_docs'] += 1
+                continue
+            
+            date_epoch = normalize_date(doc.get('date'))
+            
+            # Aggiungi ogni chunk
+            for j, chunk in enumerate(chunks):
+                chunk_id = f"{doc['id']}_chunk_{j}"
+                
+                all_chunks.append(chunk)
+                all_ids.append(chunk_id)
+                
+                # Metadata per CitedAnswer
+                metadata = {
+                    'source_url': doc['url'],
+                    'title': doc.get('title', '')[:200],  # Limita lunghezza
+                    'source': doc.get('source', ''),
+                    'date': doc.get('date', ''),
+                    'document_type': doc.get('document_type', 'unknown'),
+                    'chunk_index': j,
+                    'total_chunks': len(chunks)
+                }
+                
+                # Data in epoch per i filtri per periodo (Chroma non accetta None)
+                if date_epoch is not None:
+                    metadata['date_epoch'] = date_epoch
+                
+                # Stesso contenuto pubblicato anche altrove
+                duplicates = duplicate_groups.get(doc['id'], [])[1:]
+                if duplicates:
+                    metadata['duplicate_urls'] = '\n'.join(url for _, url, _ in duplicates)
+                    metadata['duplicate_sources'] = ' | '.join(
+                        dict.fromkeys(source for _, _, source in duplicates if source)
+                    )
+                
+                all_metadatas.append(metadata)
+            
+            stats['processed_docs'] += 1
+            stats['total_chunks'] += len(chunks)
     
-    print(f"\n   ✅ Creati {stats['total_chunks']} chunk da {stats['processed_docs']} documenti\n")
+    if dedup_threshold is not None:
+        stats['dedup_by_source'] = dedup_report
+    
+    token_stats = chunker.stats
+    stats['document_tokens'] = token_stats['document_tokens']
+    stats['encoded_tokens'] = token_stats['encoded_tokens']
+    stats['overlap_tokens'] = token_stats['overlap_tokens']
+    stats['dropped_tokens'] = token_stats['dropped_tokens']
+    
+    # Verifica sui chunk finali: ritokenizzati interi, quanti superano la finestra
+    truncation = truncation_report(all_chunks, chunker.tokenizer, chunker.max_seq_length)
+    stats['truncated_chunks'] = truncation['truncated_chunks']
+    stats['truncated_tokens'] = truncation['discarded_tokens']
+    
+    print(f"\n   ✅ Creati {stats['total_chunks']} chunk da {stats['processed_docs']} documenti")
+    print(f"   🔤 Token: {stats['document_tokens']} nei documenti, {stats['encoded_tokens']} codificati "
+          f"(sovrapposizioni {stats['overlap_tokens']}), "
+          f"{stats['truncated_tokens']} troncati in {stats['truncated_chunks']} chunk, "
+          f"{stats['dropped_tokens']} in chunk troppo corti\n")
     
     if not all_chunks:
         print("❌ Nessun chunk creato")
         return None
     
-    # Genera embeddings
-    print("🔢 Generazione embeddings...")
-    print(f"   (questo può richiedere alcuni minuti per {len(all_chunks)} chunk)")
+    # Righe ordinate per (fonte, data): ogni fonte è un intervallo contiguo
+    # dell'artifact e i filtri del retrieval scandiscono solo quelle righe
+    order = partition_order(all_metadatas)
+    all_chunks = [all_chunks[i] for i in order]
+    all_ids = [all_ids[i] for i in order]
+    all_metadatas = [all_metadatas[i] for i in order]
     
-    embeddings = model.encode(
-        all_chunks,
-        show_progress_bar=True,
-        batch_size=32
-    )
+    all_hashes = [chunk_hash(chunk) for chunk in all_chunks]
     
-    print("   ✅ Embeddings generati\n")
+    ship_index = ship_chroma_index(chroma_index, len(all_chunks))
     
-    # Aggiungi a ChromaDB
-    print("💾 Popolamento database ChromaDB...")
+    # Diff con la build precedente tramite hash del contenuto
+    print("🔍 Confronto con la build precedente...")
     
-    # ChromaDB ha un limite di ~40k documenti per batch
-    batch_size = 5000
+    reuse_rows = {}       # indice chunk corrente -> riga nell'artifact precedente
+    to_encode = []        # indici dei chunk da codificare
+    to_upsert = []        # indici dei chunk da scrivere nella collection
+    removed_ids = []
     
-    for i in range(0, len(all_chunks), batch_size):
-        end_idx = min(i + batch_size, len(all_chunks))
+    # I vettori della build precedente si riusano solo se sono almeno precisi
+    # quanto il formato richiesto: da un int8/float16 senza copia float32 un
+    # artifact float32 erediterebbe per sempre l'errore di quantizzazione
+    # (quei chunk passano dalla cache degli embedding o dal modello)
+    reuse_vectors = previous is not None and (
+        vector_precision(previous.dtype, previous.full_embeddings is not None)
+        <= vector_precision(dtype, keep_float)
+    )
+    if previous is not None and not reuse_vectors:
+        print(f"   ⚠️  Build precedente {previous.dtype} senza copia float32: vettori non riutilizzati")
+    
+    if previous is not None:
+        prev_rows = {chunk_id: row for row, chunk_id in enumerate(previous.ids)}
+        prev_by_hash = {}
+        for row, h in enumerate(previous.hashes):
+            prev_by_hash.setdefault(h, row)
+        
+        for idx, (chunk_id, h) in enumerate(zip(all_ids, all_hashes)):
+            if reuse_vectors and h in prev_by_hash:
+                reuse_rows[idx] = prev_by_hash[h]
+            else:
+                to_encode.append(idx)
+            
+            row = prev_rows.get(chunk_id)
+            if (not reuse_vectors or row is None or previous.hashes[row] != h
+                    or previous.metadatas[row] != all_metadatas[idx]):
+                to_upsert.append(idx)
+        
+        current_ids = set(all_ids)
+        removed_ids = [chunk_id for chunk_id in previous.ids if chunk_id not in current_ids]
+        
+        # Build precedente senza indice ChromaDB: se ora serve si crea da zero
+        if ship_index and previous.index_path is None:
+            to_upsert = list(range(len(all_chunks)))
+    else:
+        to_encode = list(range(len(all_chunks)))
+        to_upsert = list(range(len(all_chunks)))
+    
+    print(f"   ♻️  Riutilizzati: {len(reuse_rows)} chunk")
+    print(f"   🔢 Da codificare: {len(to_encode)} chunk")
+    print(f"   🗑️  Rimossi:      {len(removed_ids)} chunk\n")
+    
+    stats['reused_chunks'] = len(reuse_rows)
+    stats['encoded_chunks'] = len(to_encode)
+    stats['removed_chunks'] = len(removed_ids)
+    
+    if (previous is not None and not to_upsert and not removed_ids
+            and same_artifact_format(previous, dtype, keep_float, ship_index)):
+        print("✅ Nessuna modifica rispetto alla build precedente: artifact invariato")
+        return previous.manifest
+    
+    # Genera embeddings (solo per il delta)
+    if previous is not None:
+        dim = previous.embeddings.shape[1]
+    else:
+        dim = None
+    
+    new_embeddings = None
+    cache = EmbeddingCache(cache_key(model_name, encoder))
+    
+    if to_encode:
+        model = None
+        
+        def encode_missing(texts):
+            nonlocal model
+            
+            # Il modello si carica solo se la cache non copre tutto il delta
+            if model is None:
+                print(f"🤖 Caricamento modello embeddings (encoder {encoder})...")
+                model = create_encoder(encoder, model_name)
+                print(f"   ✅ Modello caricato: {model_name}\n")
+            
+            print(f"   (questo può richiedere alcuni minuti per {len(texts)} chunk)")
+            return model.encode(
+                texts,
+                show_progress_bar=True,
+                batch_size=32
+            )
         
-        print(f"   Batch {i//batch_size + 1}: chunk {i+1}-{end_idx}")
+        print("🔢 Generazione embeddings...")
         
-        collection.add(
-            ids=all_ids[i:end_idx],
-            embeddings=embeddings[i:end_idx].tolist(),
-            documents=all_chunks[i:end_idx],
-            metadatas=all_metadatas[i:end_idx]
+        new_embeddings = cache.get_or_encode(
+            [all_chunks[idx] for idx in to_encode],
+            encode_missing
         )
-    
-    print("   ✅ Database popolato\n")
-    
-    # Verifica
-    count = collection.count()
-    print(f"✅ Verifica: {count} documenti in ChromaDB\n")
-    
-    # Salva tutto in pickle per Hugging Face Space
-    print("📦 Creazione knowledge.pkl...")
-    
-    knowledge_data = {
-        'collection_name': 'scuola_docs',
+        dim = new_embeddings.shape[1]
+        
+        cache_stats = cache.stats()
+        print(f"   💾 Cache embeddings: {cache_stats['hits']} hit, {cache_stats['misses']} miss "
+              f"(hit rate {cache_stats['hit_rate']:.0%}, {cache_stats['size_mb']} MB)")
+        print("   ✅ Embeddings generati\n")
+    
+    cache.close()
+    stats['encoded_chunks'] = cache.misses
+    stats['cache_hits'] = cache.hits
+    stats['cache_misses'] = cache.misses
+    
+    embeddings = np.empty((len(all_chunks), dim), dtype=np.float32)
+    
+    if reuse_rows:
+        current_rows, previous_rows = zip(*reuse_rows.items())
+        embeddings[list(current_rows)] = previous.float_vectors(np.array(previous_rows))
+    
+    if new_embeddings is not None:
+        embeddings[to_encode] = new_embeddings
+    
+    # Righe normalizzate: l'app può fare ricerca esatta con un prodotto scalare
+    embeddings = normalize_rows(embeddings)
+    
+    # Indice ChromaDB (HNSW) solo se l'app lo userà: altrimenti duplicherebbe
+    # nell'artifact tutti i vettori in float32, con testi e metadati
+    if ship_index:
+        count = update_chroma_index(
+            previous.index_path if previous is not None else None,
+            all_ids, all_chunks, all_metadatas, embeddings, to_upsert, removed_ids
+        )
+    else:
+        if CHROMA_PATH.exists():
+            shutil.rmtree(CHROMA_PATH)
+        count = len(all_chunks)
+        print(f"ℹ️  Indice ChromaDB non incluso: {count} chunk, l'app usa la ricerca esatta NumPy\n")
+    
+    # Indice lessicale BM25 (ricostruito ogni volta: costa poco)
+    print("🔤 Costruzione indice BM25...")
+    lexical_index = BM25Index.build(all_chunks)
+    print(f"   ✅ {len(lexical_index.terms)} termini, {len(lexical_index.docs)} posting\n")
+    
+    # Salva artifact binario per Hugging Face Space
+    print(f"📦 Creazione artifact {ARTIFACT_DIR}/...")
+    
+    manifest = {
+        'collection_name': COLLECTION_NAME,
         'model_name': model_name,
+        'encoder': encoder,
         'created_at': datetime.now().isoformat(),
+        'normalized': True,
+        'documents_seq': watermark,
+        'chunker': chunker.config(),
+        'dedup_threshold': dedup_threshold,
         'stats': {
             **stats,
             'total_chunks_in_db': count
-        },
-        # Salviamo i dati necessari per ricostruire
-        'documents': all_chunks,
-        'metadatas': all_metadatas,
-        'embeddings': embeddings.tolist(),
-        'ids': all_ids
+        }
     }
     
-    with open('knowledge.pkl', 'wb') as f:
-        pickle.dump(knowledge_data, f)
+    kb_bytes = write_artifact(
+        ARTIFACT_DIR,
+        ids=all_ids,
+        texts=all_chunks,
+        metadatas=all_metadatas,
+        embeddings=embeddings,
+        manifest=manifest,
+        index_dir=CHROMA_PATH if ship_index else None,
+        hashes=all_hashes,
+        lexical_index=lexical_index,
+        dtype=dtype,
+        keep_float=keep_float
+    )
     
     # Calcola dimensione
-    kb_size = Path('knowledge.pkl').stat().st_size / (1024 * 1024)
+    kb_size = kb_bytes / (1024 * 1024)
     
-    print(f"   ✅ knowledge.pkl creato ({kb_size:.1f} MB)\n")
+    print(f"   ✅ {ARTIFACT_DIR}/ creato ({kb_size:.1f} MB)\n")
     
     # Report finale
     print("=" * 60)
     print("📊 KNOWLEDGE BASE COMPLETATA")
     print("=" * 60)
+    print(f"Modalità:             {'incrementale' if previous is not None else 'completa'}")
     print(f"Documenti processati: {stats['processed_docs']}/{stats['total_docs']}")
     print(f"Documenti skippati:   {stats['skipped_docs']}")
-    print(f"Chunk totali:         {stats['total_chunks']}")
+    print(f"Quasi duplicati:      {stats['duplicate_docs']}")
+    print(f"Chunk totali:         {stats['total_chunks']} (max {chunker.max_seq_length} token)")
+    print(f"  - riutilizzati:     {stats['reused_chunks']}")
+    print(f"  - codificati:       {stats['encoded_chunks']}")
+    print(f"  - rimossi:          {stats['removed_chunks']}")
+    print(f"Cache embeddings:     {cache.hits} hit / {cache.misses} miss ({cache.hit_rate:.0%})")
     print(f"Dimensione DB:        {kb_size:.1f} MB")
-    print(f"Modello embeddings:   {model_name}")
-    print(f"File output:          knowledge.pkl")
+    print(f"Formato embeddings:   {dtype}{' (+ copia float32)' if keep_float and dtype != 'float32' else ''}")
+    print(f"Modello embeddings:   {model_name} (encoder {encoder})")
+    print(f"File output:          {ARTIFACT_DIR}/")
     print("=" * 60)
     print("\n✅ Pronto per il deploy su Hugging Face Space!")
     
-    return knowledge_data
+    return manifest
 
 
 if __name__ == '__main__':
-    build_rag_database()
+    parser = argparse.ArgumentParser(description="Costruisce la knowledge base RAG")
+    parser.add_argument(
+        '--full',
+        action='store_true',
+        help="ricostruisce tutto da zero ignorando la build precedente"
+    )
+    parser.add_argument(
+        '--dtype',
+        choices=EMBEDDING_DTYPES,
+        default='float32',
+        help="formato degli embedding nell'artifact (int8: scala per vettore)"
+    )
+    parser.add_argument(
+        '--keep-float',
+        action='store_true',
+        help="con --dtype float16/int8 salva anche la copia float32 per il rescoring"
+    )
+    parser.add_argument(
+        '--encoder',
+        choices=ENCODER_BACKENDS,
+        default=DEFAULT_ENCODER_BACKEND,
+        help="backend di inferenza per gli embedding (onnx: ONNX Runtime int8 su CPU)"
+    )
+    parser.add_argument(
+        '--dedup-threshold',
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="similarità oltre la quale due documenti sono accorpati (MinHash/LSH)"
+    )
+    parser.add_argument(
+        '--chroma-index',
+        choices=('auto', 'always', 'never'),
+        default='auto',
+        help="include l'indice ChromaDB nell'artifact (auto: solo oltre "
+             "RAG_EXACT_SEARCH_MAX_CHUNKS chunk, sotto l'app usa la ricerca esatta NumPy)"
+    )
+    parser.add_argument(
+        '--no-dedup',
+        action='store_true',
+        help="non accorpa i documenti quasi identici"
+    )
+    args = parser.parse_args()
+    
+    build_rag_database(
+        incremental=not args.full,
+        dtype=args.dtype,
+        keep_float=args.keep_float,
+        encoder=args.encoder,
+        dedup_threshold=None if args.no_dedup else args.dedup_threshold,
+        chroma_index=args.chroma_index
+    )
@@ -0,0 +1,319 @@
+"""
+Chunking misurato in token del modello di embedding
+Posizione: /scripts/chunking.py
+
+paraphrase-multilingual-MiniLM-L12-v2 tronca l'input a max_seq_length
+token (128): con chunk di 800 parole quasi tutto il testo veniva
+tokenizzato, riempito di padding e poi scartato da model.encode, e l'indice
+non ne vedeva la maggior parte. TokenChunker invece:
+
+    - divide il testo in paragrafi (righe) e frasi
+    - conta i token di ogni frase con il tokenizer del modello, in batch
+    - impacchetta frasi consecutive fino a max_seq_length meno i token
+      speciali, preferendo chiudere il chunk a fine paragrafo
+    - sovrappone le ultime frasi di un chunk al successivo quando il taglio
+      cade a metà paragrafo
+    - spezza sui confini dei token solo le frasi più lunghe del limite
+
+Ogni chunk è una porzione contigua del testo originale (offset del
+tokenizer), quindi non c'è perdita per decodifica dei token.
+"""
+
+import json
+import re
+from dataclasses import dataclass
+
+
+DEFAULT_MAX_SEQ_LENGTH = 128
+DEFAULT_OVERLAP_TOKENS = 16
+MIN_CHUNK_TOKENS = 8
+TOKENIZE_BATCH = 256  # frasi per chiamata al tokenizer
+
+_LINE_RE = re.compile(r'[^\n]+')
+_LAST_WORD_RE = re.compile(r"[\s'’(]+")
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?;])\s+(?=[A-ZÀÈÉÌÒÙ«"“(])')
+
+# Abbreviazioni frequenti nella normativa: "art. 3", "D.M. 242", "Prot. N. 88"
+_ABBREVIATIONS = frozenset("""
+art artt c co comma d dl dlgs dm dpr lgs l lett n nn nr num o om p pag pagg prot
+dott prof sig sigg ecc es cfr all rif reg
+""".split())
+
+
+@dataclass
+class _Piece:
+    """Porzione di testo (frase o parte di frase) con il suo numero di token"""
+    start: int
+    end: int
+    tokens: int
+    paragraph_start: bool
+
+
+def split_sentences(text):
+    """
+    Frasi del testo come intervalli di caratteri
+
+    Returns:
+        lista di (inizio, fine, inizio_paragrafo)
+    """
+    spans = []
+
+    for line in _LINE_RE.finditer(text):
+        line_text = line.group()
+        start = 0
+        first = True
+
+        for boundary in _SENTENCE_END_RE.finditer(line_text):
+            previous = line_text[start:boundary.start()]
+            last_word = _LAST_WORD_RE.split(previous.rstrip())[-1]
+            if last_word.rstrip('.').replace('.', '').lower() in _ABBREVIATIONS:
+                continue
+
+            spans.append((line.start() + start, line.start() + boundary.start(), first))
+            start = boundary.end()
+            first = False
+
+        spans.append((line.start() + start, line.end(), first))
+
+    # Via gli spazi ai bordi e le frasi vuote
+    result = []
+    for start, end, paragraph_start in spans:
+        segment = text[start:end]
+        stripped = segment.strip()
+        if not stripped:
+            continue
+        start += len(segment) - len(segment.lstrip())
+        result.append((start, start + len(stripped), paragraph_start))
+
+    return result
+
+
+def model_max_seq_length(model_name, tokenizer=None):
+    """max_seq_length di un modello sentence-transformers (sentence_bert_config.json)"""
+    try:
+        from huggingface_hub import hf_hub_download
+
+        with open(hf_hub_download(model_name, 'sentence_bert_config.json'), 'r', encoding='utf-8') as f:
+            return int(json.load(f)['max_seq_length'])
+    except Exception:
+        pass
+
+    limit = getattr(tokenizer, 'model_max_length', None)
+    if limit and limit < 100_000:
+        return min(int(limit), 512)
+    return DEFAULT_MAX_SEQ_LENGTH
+
+
+class TokenChunker:
+    """Chunk di testo che entrano per intero nella finestra dell'encoder"""
+
+    def __init__(self, tokenizer, max_seq_length=DEFAULT_MAX_SEQ_LENGTH,
+                 overlap_tokens=DEFAULT_OVERLAP_TOKENS, min_tokens=MIN_CHUNK_TOKENS):
+        if not getattr(tokenizer, 'is_fast', False):
+            raise ValueError("TokenChunker richiede un tokenizer 'fast' (offset dei token)")
+
+        self.tokenizer = tokenizer
+        self.max_seq_length = max_seq_length
+        self.max_tokens = max_seq_length - tokenizer.num_special_tokens_to_add(pair=False)
+        self.overlap_tokens = min(overlap_tokens, self.max_tokens // 2)
+        self.min_tokens = min_tokens
+        self.reset_stats()
+
+    @classmethod
+    def for_model(cls, model_name, **kwargs):
+        """Tokenizer e max_seq_length del modello (senza caricarne i pesi)"""
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        kwargs.setdefault('max_seq_length', model_max_seq_length(model_name, tokenizer))
+        return cls(tokenizer, **kwargs)
+
+    def config(self):
+        """Parametri che determinano i chunk (salvati nel manifest dell'artifact)"""
+        return {
+            'type': 'tokens',
+            'max_seq_length': self.max_seq_length,
+            'max_tokens': self.max_tokens,
+            'overlap_tokens': self.overlap_tokens,
+            'min_tokens': self.min_tokens,
+        }
+
+    def reset_stats(self):
+        self.stats = {
+            'documents': 0,
+            'chunks': 0,
+            'document_tokens': 0,   # token dei documenti, contati una volta
+            'encoded_tokens': 0,    # token dei chunk (sovrapposizioni comprese)
+            'overlap_tokens': 0,
+            'dropped_tokens': 0,    # chunk sotto min_tokens, non indicizzati
+        }
+
+    # ------------------------------------------------------------------
+    # Chunking
+    # ------------------------------------------------------------------
+
+    def _token_offsets(self, segments):
+        """Offset (inizio, fine) dei token di ogni segmento, tokenizzando in batch"""
+        offsets = []
+        for i in range(0, len(segments), TOKENIZE_BATCH):
+            encoded = self.tokenizer(
+                segments[i:i + TOKENIZE_BATCH],
+                add_special_tokens=False,
+                return_offsets_mapping=True,
+                return_attention_mask=False,
+                return_token_type_ids=False,
+                verbose=False
+            )
+            offsets.extend(encoded['offset_mapping'])
+        return offsets
+
+    def _split_long(self, text, start, offsets, paragraph_start):
+        """Spezza una frase più lunga di max_tokens, tagliando a inizio parola se possibile"""
+        pieces = []
+        i = 0
+        n = len(offsets)
+
+        while i < n:
+            j = min(i + self.max_tokens, n)
+
+            if j < n:
+                k = j
+                while k > i + self.max_tokens // 2:
+                    char = start + offsets[k][0]
+                    if char > 0 and (text[char - 1].isspace() or text[char].isspace()):
+                        break
+                    k -= 1
+                if k > i + self.max_tokens // 2:
+                    j = k
+
+            pieces.append(_Piece(
+                start + offsets[i][0], start + offsets[j - 1][1], j - i,
+                paragraph_start and i == 0
+            ))
+            i = j
+
+        return pieces
+
+    def _pack(self, text, pieces):
+        chunks = []
+        current = []
+        tokens = 0
+        carried = 0
+
+        def emit():
+            chunk_tokens = sum(p.tokens for p in current)
+            new_tokens = sum(p.tokens for p in current[carried:])
+            if chunk_tokens < self.min_tokens:
+                self.stats['dropped_tokens'] += new_tokens
+                return
+            chunks.append(text[current[0].start:current[-1].end])
+            self.stats['encoded_tokens'] += chunk_tokens
+            self.stats['overlap_tokens'] += chunk_tokens - new_tokens
+
+        for piece in pieces:
+            full = tokens + piece.tokens > self.max_tokens
+            paragraph_break = piece.paragraph_start and tokens >= self.max_tokens // 2
+
+            if current and (full or paragraph_break):
+                emit()
+
+                # Sovrapposizione solo se il taglio cade a metà paragrafo
+                carry = []
+                carry_tokens = 0
+                if not piece.paragraph_start:
+                    for previous in reversed(current):
+                        if carry_tokens + previous.tokens > self.overlap_tokens:
+                            break
+                        carry.insert(0, previous)
+                        carry_tokens += previous.tokens
+                    if carry_tokens + piece.tokens > self.max_tokens:
+                        carry, carry_tokens = [], 0
+
+                current, tokens, carried = carry, carry_tokens, len(carry)
+
+            current.append(piece)
+            tokens += piece.tokens
+
+        if len(current) > carried:
+            emit()
+
+        return chunks
+
+    def chunk_many(self, texts):
+        """
+        Divide più documenti in chunk; le frasi di tutti i documenti sono
+        tokenizzate insieme, a batch di TOKENIZE_BATCH
+
+        Returns:
+            lista (una per documento) di liste di chunk
+        """
+        sentences = [split_sentences(text or '') for text in texts]
+        segments = [
+            text[start:end]
+            for text, spans in zip(texts, sentences)
+            for start, end, _ in spans
+        ]
+        offsets = iter(self._token_offsets(segments))
+
+        result = []
+        for text, spans in zip(texts, sentences):
+            pieces = []
+            for start, end, paragraph_start in spans:
+                token_offsets = next(offsets)
+                if not token_offsets:
+                    continue
+                if len(token_offsets) > self.max_tokens:
+                    pieces.extend(self._split_long(text, start, token_offsets, paragraph_start))
+                else:
+                    pieces.append(_Piece(start, end, len(token_offsets), paragraph_start))
+
+            self.stats['documents'] += 1
+            self.stats['document_tokens'] += sum(p.tokens for p in pieces)
+
+            chunks = self._pack(text, pieces) if pieces else []
+            self.stats['chunks'] += len(chunks)
+            result.append(chunks)
+
+        return result
+
+    def chunk(self, text):
+        """Chunk di un singolo documento"""
+        return self.chunk_many([text])[0]
+
+
+def truncation_report(chunks, tokenizer, max_seq_length, batch_size=TOKENIZE_BATCH):
+    """
+    Token che l'encoder vede davvero e token che tronca, per una lista di chunk
+
+    Returns:
+        dict con chunk, token totali, codificati e scartati per troncamento,
+        e quanti chunk superano la finestra
+    """
+    budget = max_seq_length - tokenizer.num_special_tokens_to_add(pair=False)
+    report = {
+        'chunks': len(chunks),
+        'tokens': 0,
+        'encoded_tokens': 0,
+        'discarded_tokens': 0,
+        'truncated_chunks': 0,
+    }
+
+    for i in range(0, len(chunks), batch_size):
+        encoded = tokenizer(
+            chunks[i:i + batch_size],
+            add_special_tokens=False,
+            return_attention_mask=False,
+            return_token_type_ids=False,
+            verbose=False
+        )
+        for ids in encoded['input_ids']:
+            report['tokens'] += len(ids)
+            report['encoded_tokens'] += min(len(ids), budget)
+            report['discarded_tokens'] += max(len(ids) - budget, 0)
+            report['truncated_chunks'] += len(ids) > budget
+
+    report['discarded_ratio'] = round(
+        report['discarded_tokens'] / report['tokens'], 4
+    ) if report['tokens'] else 0.0
+
+    return report
@@ -0,0 +1,583 @@
+"""
+Archivio SQLite dei documenti trovati dallo scraping e di quelli scaricati
+Posizione: /scripts/document_store.py
+
+    data/documents.sqlite
+        scraped_documents   documenti trovati da scrape_sources.py
+        fetched_documents   documenti completi scaricati da fetch_documents.py
+        run_stats           statistiche dell'ultimo scraping / fetch
+
+Ogni tabella ha indici su id, URL canonico, fonte e data normalizzata
+(epoch in secondi, UTC), più una colonna seq che cresce a ogni scrittura:
+i controlli "già scaricato?" e "documenti nuovi dall'ultima build" sono
+query indicizzate invece di caricare e riscrivere interi file JSON.
+
+Il database non è versionato (un binario riscritto a ogni run farebbe
+crescere la storia git senza diff leggibili). Nel repository va invece
+
+    data/documents.jsonl
+        una riga JSON per documento o statistica, ordinata per tabella e id,
+        con il seq originale: `export` la riscrive (diff riga per riga) e un
+        database assente viene ricreato da qui, watermark compresi
+
+I vecchi data/scraped_documents.json, data/fetched_documents.json e
+data/fetched_documents.jsonl (con il suo indice fetched_ids.tsv) vengono
+importati automaticamente alla creazione del database, oppure a mano; i file
+restano dove sono (scraped_documents.json è versionato nel repository) e
+non vengono più aggiornati:
+
+    python scripts/document_store.py migrate
+    python scripts/document_store.py export
+    python scripts/document_store.py stats
+    python scripts/document_store.py compact
+"""
+
+import argparse
+import json
+import re
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+
+DATA_DIR = Path('data')
+DB_FILE = 'documents.sqlite'
+SNAPSHOT_FILE = 'documents.jsonl'
+
+# Formati precedenti, importati una volta sola
+LEGACY_SCRAPED_FILE = 'scraped_documents.json'
+LEGACY_FETCHED_FILE = 'fetched_documents.json'
+LEGACY_LOG_FILE = 'fetched_documents.jsonl'
+LEGACY_STATS_FILE = 'fetch_stats.json'
+
+TABLES = ('scraped_documents', 'fetched_documents')
+
+# Limite prudente per il numero di parametri in una query SQLite
+_SQL_BATCH = 500
+
+# Parametri di tracciamento ignorati nell'URL canonico
+_TRACKING_PARAMS = re.compile(r'^(utm_\w+|fbclid|gclid|mc_cid|mc_eid)$', re.IGNORECASE)
+
+# Documenti trovati il cui URL canonico non è tra quelli scaricati
+_PENDING = (
+    "FROM scraped_documents s WHERE NOT EXISTS "
+    "(SELECT 1 FROM fetched_documents f WHERE f.canonical_url = s.canonical_url)"
+)
+
+_MONTHS_IT = {
+    'gennaio': 1, 'febbraio': 2, 'marzo': 3, 'aprile': 4, 'maggio': 5, 'giugno': 6,
+    'luglio': 7, 'agosto': 8, 'settembre': 9, 'ottobre': 10, 'novembre': 11, 'dicembre': 12,
+}
+_DMY = re.compile(r'^(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})$')
+_YMD = re.compile(r'^(\d{4})[/.-](\d{1,2})[/.-](\d{1,2})$')
+_DAY_MONTH_IT = re.compile(r'^(\d{1,2})\s+([a-zà]+)\s+(\d{4})$', re.IGNORECASE)
+
+
+def canonical_url(url):
+    """
+    URL in forma canonica per riconoscere lo stesso documento
+
+    Schema e host minuscoli, https al posto di http, niente frammento, niente
+    parametri di tracciamento, parametri ordinati e senza '/' finale.
+    """
+    if not url:
+        return ''
+
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    if scheme == 'http':
+        scheme = 'https'
+
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not _TRACKING_PARAMS.match(key)
+    )
+    path = parts.path.rstrip('/') or '/'
+
+    return urlunsplit((scheme, parts.netloc.lower(), path, urlencode(query), ''))
+
+
+def normalize_date(value):
+    """
+    Converte le date delle fonti in epoch (secondi, UTC)
+
+    Riconosce RFC-822 dei feed RSS, ISO 8601, dd/mm/yyyy, yyyy-mm-dd e date
+    in italiano come "24 Aprile 2026". Le date senza fuso sono considerate UTC.
+
+    Returns:
+        int oppure None se la data non è riconosciuta
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+
+    text = str(value).strip()
+    parsed = None
+
+    try:
+        parsed = datetime.fromisoformat(text.replace('Z', '+00:00'))
+    except ValueError:
+        pass
+
+    if parsed is None:
+        try:
+            parsed = parsedate_to_datetime(text)
+        except (TypeError, ValueError, IndexError):
+            parsed = None
+
+    if parsed is None:
+        try:
+            match = _DMY.match(text)
+            if match:
+                parsed = datetime(int(match[3]), int(match[2]), int(match[1]))
+            elif (match := _YMD.match(text)):
+                parsed = datetime(int(match[1]), int(match[2]), int(match[3]))
+            elif (match := _DAY_MONTH_IT.match(text)) and match[2].lower() in _MONTHS_IT:
+                parsed = datetime(int(match[3]), _MONTHS_IT[match[2].lower()], int(match[1]))
+        except ValueError:
+            return None
+
+    if parsed is None:
+        return None
+
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+
+    return int(parsed.timestamp())
+
+
+class DocumentStore:
+    """Documenti trovati e scaricati in un database SQLite con indici"""
+
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = Path(data_dir)
+        self.db_path = self.data_dir / DB_FILE
+        self._lock = threading.Lock()
+        self._conn = None
+
+    # ------------------------------------------------------------------
+    # Connessione e schema
+    # ------------------------------------------------------------------
+
+    def exists(self):
+        return self.db_path.exists() or any(
+            (self.data_dir / name).exists()
+            for name in (SNAPSHOT_FILE, LEGACY_SCRAPED_FILE, LEGACY_FETCHED_FILE, LEGACY_LOG_FILE)
+        )
+
+    def _connect(self):
+        if self._conn is not None:
+            return self._conn
+
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        created = not self.db_path.exists()
+
+        conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        for table in TABLES:
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    id TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    canonical_url TEXT NOT NULL,
+                    source TEXT NOT NULL DEFAULT '',
+                    date_epoch INTEGER,
+                    seq INTEGER NOT NULL,
+                    data TEXT NOT NULL
+                )
+            """)
+            for column in ('canonical_url', 'source', 'date_epoch', 'seq'):
+                conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table} ({column})"
+                )
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS run_stats (
+                name TEXT PRIMARY KEY,
+                data TEXT NOT NULL
+            )
+        """)
+        conn.commit()
+        self._conn = conn
+
+        if created:
+            # Il dump versionato è più recente dei file legacy: questi si
+            # importano solo se il dump non c'è ancora
+            if (self.data_dir / SNAPSHOT_FILE).exists():
+                self.restore_snapshot()
+            else:
+                self.migrate_legacy()
+
+        return conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # ------------------------------------------------------------------
+    # Scrittura
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _row(doc, seq):
+        """Valori di una riga delle tabelle dei documenti"""
+        return (
+            doc['id'],
+            doc.get('url', ''),
+            canonical_url(doc.get('url', '')),
+            doc.get('source', ''),
+            normalize_date(doc.get('date')),
+            seq,
+            json.dumps(doc, ensure_ascii=False),
+        )
+
+    def _upsert(self, table, documents):
+        """Documenti invariati non vengono riscritti e mantengono il loro seq"""
+        conn = self._connect()
+        if not documents:
+            return 0
+
+        with self._lock:
+            seq = conn.execute(f"SELECT COALESCE(MAX(seq), 0) + 1 FROM {table}").fetchone()[0]
+            conn.executemany(
+                f"INSERT INTO {table} (id, url, canonical_url, source, date_epoch, seq, data) "
+                f"VALUES (?, ?, ?, ?, ?, ?, ?) "
+                f"ON CONFLICT(id) DO UPDATE SET url = excluded.url, "
+                f"canonical_url = excluded.canonical_url, source = excluded.source, "
+                f"date_epoch = excluded.date_epoch, seq = excluded.seq, data = excluded.data "
+                f"WHERE {table}.data != excluded.data",
+                [self._row(doc, seq) for doc in documents]
+            )
+            conn.commit()
+
+        return len(documents)
+
+    def save_scraped(self, documents):
+        """Inserisce o aggiorna i documenti trovati dallo scraping"""
+        return self._upsert('scraped_documents', documents)
+
+    def append(self, documents):
+        """Inserisce o aggiorna i documenti scaricati; restituisce quanti ne ha scritti"""
+        return self._upsert('fetched_documents', documents)
+
+    # ------------------------------------------------------------------
+    # Lettura
+    # ------------------------------------------------------------------
+
+    def _query(self, sql, params=()):
+        conn = self._connect()
+        with self._lock:
+            return conn.execute(sql, params).fetchall()
+
+    def __len__(self):
+        return self._query("SELECT COUNT(*) FROM fetched_documents")[0][0]
+
+    def __contains__(self, doc_id):
+        return bool(self._query("SELECT 1 FROM fetched_documents WHERE id = ?", (doc_id,)))
+
+    def scraped_count(self):
+        return self._query("SELECT COUNT(*) FROM scraped_documents")[0][0]
+
+    def ids(self):
+        """Id dei documenti scaricati (senza leggerne il contenuto)"""
+        return {row[0] for row in self._query("SELECT id FROM fetched_documents")}
+
+    def fetched_urls(self, urls):
+        """Sottoinsieme degli URL (confrontati in forma canonica) già scaricati"""
+        by_canonical = {}
+        for url in urls:
+            by_canonical.setdefault(canonical_url(url), []).append(url)
+
+        found = set()
+        keys = list(by_canonical)
+        for i in range(0, len(keys), _SQL_BATCH):
+            batch = keys[i:i + _SQL_BATCH]
+            placeholders = ','.join('?' * len(batch))
+            for (key,) in self._query(
+                f"SELECT DISTINCT canonical_url FROM fetched_documents "
+                f"WHERE canonical_url IN ({placeholders})",
+                batch
+            ):
+                found.update(by_canonical[key])
+        return found
+
+    def get(self, doc_id):
+        """Un singolo documento scaricato, per id"""
+        rows = self._query("SELECT data FROM fetched_documents WHERE id = ?", (doc_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def iter_documents(self, since_seq=0):
+        """
+        Documenti scaricati in ordine di inserimento, letti a blocchi
+
+        Args:
+            since_seq: solo i documenti scritti dopo questo watermark (vedi watermark())
+        """
+        last_rowid = 0
+        while True:
+            rows = self._query(
+                "SELECT rowid, data FROM fetched_documents WHERE rowid > ? AND seq > ? "
+                "ORDER BY rowid LIMIT ?",
+                (last_rowid, since_seq, _SQL_BATCH)
+            )
+            if not rows:
+                return
+            for rowid, data in rows:
+                yield json.loads(data)
+            last_rowid = rows[-1][0]
+
+    def pending_count(self):
+        return self._query(
+            "SELECT COUNT(*) " + _PENDING
+        )[0][0]
+
+    def pending_documents(self, limit=None):
+        """
+        Documenti trovati dallo scraping e non ancora scaricati, i più recenti prima
+
+        Il confronto è sull'URL canonico: lo stesso link con parametri di
+        tracciamento diversi non viene riscaricato.
+        """
+        sql = (
+            "SELECT s.data " + _PENDING +
+            " ORDER BY s.date_epoch IS NULL, s.date_epoch DESC, s.rowid"
+        )
+        params = ()
+        if limit is not None:
+            sql += " LIMIT ?"
+            params = (limit,)
+        return [json.loads(data) for (data,) in self._query(sql, params)]
+
+    def watermark(self):
+        """Ultimo seq dei documenti scaricati: la build lo salva nel manifest"""
+        return self._query("SELECT COALESCE(MAX(seq), 0) FROM fetched_documents")[0][0]
+
+    def count_since(self, seq):
+        """Documenti scaricati o aggiornati dopo il watermark indicato"""
+        return self._query("SELECT COUNT(*) FROM fetched_documents WHERE seq > ?", (seq,))[0][0]
+
+    # ------------------------------------------------------------------
+    # Statistiche dei run
+    # ------------------------------------------------------------------
+
+    def _save_run_stats(self, name, output):
+        conn = self._connect()
+        with self._lock:
+            conn.execute(
+                "INSERT OR REPLACE INTO run_stats (name, data) VALUES (?, ?)",
+                (name, json.dumps(output, ensure_ascii=False))
+            )
+            conn.commit()
+
+    def _load_run_stats(self, name):
+        rows = self._query("SELECT data FROM run_stats WHERE name = ?", (name,))
+        return json.loads(rows[0][0]) if rows else {}
+
+    def save_stats(self, stats):
+        """Statistiche dell'ultimo fetch"""
+        self._save_run_stats('fetch', {
+            'last_fetch': datetime.now().isoformat(),
+            'stats': stats,
+            'total_documents': len(self),
+        })
+
+    def load_stats(self):
+        return self._load_run_stats('fetch')
+
+    def save_scrape_stats(self, stats):
+        """Statistiche dell'ultimo scraping"""
+        self._save_run_stats('scrape', {
+            'scraped_at': datetime.now().isoformat(),
+            'stats': stats,
+            'total_documents': self.scraped_count(),
+        })
+
+    def load_scrape_stats(self):
+        return self._load_run_stats('scrape')
+
+    # ------------------------------------------------------------------
+    # Manutenzione
+    # ------------------------------------------------------------------
+
+    def migrate_legacy(self):
+        """
+        Importa i file JSON/JSONL dei formati precedenti
+
+        I file non vengono toccati: l'import è un upsert, ripeterlo non
+        duplica documenti né fa avanzare seq per quelli invariati.
+
+        Returns:
+            dict con i documenti importati per tabella
+        """
+        self._connect()
+        migrated = {'scraped': 0, 'fetched': 0}
+
+        scraped_path = self.data_dir / LEGACY_SCRAPED_FILE
+        if scraped_path.exists():
+            print(f"📦 Migrazione {scraped_path} -> {self.db_path}")
+            with open(scraped_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            migrated['scraped'] = self.save_scraped(data.get('documents', []))
+            if data.get('stats'):
+                self._save_run_stats('scrape', {
+                    'scraped_at': data.get('scraped_at'),
+                    'stats': data['stats'],
+                    'total_documents': migrated['scraped'],
+                })
+
+        fetched_path = self.data_dir / LEGACY_FETCHED_FILE
+        if fetched_path.exists():
+            print(f"📦 Migrazione {fetched_path} -> {self.db_path}")
+            with open(fetched_path, 'r', encoding='utf-8') as f:
+                documents = json.load(f).get('documents', [])
+            migrated['fetched'] += self.append(documents)
+
+        log_path = self.data_dir / LEGACY_LOG_FILE
+        if log_path.exists():
+            print(f"📦 Migrazione {log_path} -> {self.db_path}")
+            documents = []
+            with open(log_path, 'rb') as f:
+                for raw in f:
+                    # Riga finale troncata o illeggibile: un run interrotto
+                    try:
+                        documents.append(json.loads(raw))
+                    except ValueError:
+                        continue
+                    if len(documents) >= _SQL_BATCH:
+                        migrated['fetched'] += self.append(documents)
+                        documents = []
+            migrated['fetched'] += self.append(documents)
+
+        stats_path = self.data_dir / LEGACY_STATS_FILE
+        if stats_path.exists():
+            with open(stats_path, 'r', encoding='utf-8') as f:
+                self._save_run_stats('fetch', json.load(f))
+
+        if migrated['scraped'] or migrated['fetched']:
+            print(f"   ✅ {migrated['scraped']} documenti trovati e "
+                  f"{migrated['fetched']} scaricati migrati")
+
+        return migrated
+
+    def export_snapshot(self):
+        """
+        Scrive data/documents.jsonl, il dump testuale versionato del database
+
+        Righe ordinate per tabella e id: un documento nuovo o aggiornato
+        cambia una sola riga del diff. Ogni documento conserva il suo seq,
+        così un database ricreato dal dump ha gli stessi watermark.
+
+        Returns:
+            numero di righe scritte
+        """
+        path = self.data_dir / SNAPSHOT_FILE
+        tmp_path = path.with_name(path.name + '.tmp')
+        lines = 0
+
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for table in TABLES:
+                for seq, data in self._query(f"SELECT seq, data FROM {table} ORDER BY id"):
+                    entry = {'table': table, 'seq': seq, 'doc': json.loads(data)}
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                    lines += 1
+            for name, data in self._query("SELECT name, data FROM run_stats ORDER BY name"):
+                entry = {'table': 'run_stats', 'name': name, 'data': json.loads(data)}
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                lines += 1
+
+        os.replace(tmp_path, path)
+        return lines
+
+    def restore_snapshot(self):
+        """
+        Ricrea il contenuto del database da data/documents.jsonl
+
+        Returns:
+            dict con le righe importate per tabella
+        """
+        conn = self._connect()
+        path = self.data_dir / SNAPSHOT_FILE
+        rows = {table: [] for table in TABLES}
+        stats = []
+
+        print(f"📦 Ripristino {path} -> {self.db_path}")
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if entry['table'] == 'run_stats':
+                    stats.append((entry['name'], json.dumps(entry['data'], ensure_ascii=False)))
+                else:
+                    rows[entry['table']].append(self._row(entry['doc'], entry['seq']))
+
+        with self._lock:
+            for table, values in rows.items():
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO {table} "
+                    f"(id, url, canonical_url, source, date_epoch, seq, data) "
+                    f"VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    values
+                )
+            conn.executemany("INSERT OR REPLACE INTO run_stats (name, data) VALUES (?, ?)", stats)
+            conn.commit()
+
+        restored = {table: len(values) for table, values in rows.items()}
+        print(f"   ✅ {restored['scraped_documents']} documenti trovati e "
+              f"{restored['fetched_documents']} scaricati ripristinati")
+        return restored
+
+    def compact(self):
+        """
+        Ricompatta il file del database (VACUUM)
+
+        Returns:
+            dict con documenti e byte prima/dopo
+        """
+        conn = self._connect()
+        bytes_before = self.db_path.stat().st_size
+
+        with self._lock:
+            conn.execute("VACUUM")
+
+        return {
+            'documents': len(self),
+            'bytes_before': bytes_before,
+            'bytes_after': self.db_path.stat().st_size,
+        }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Gestione dell'archivio dei documenti")
+    parser.add_argument('command', choices=['migrate', 'export', 'compact', 'stats'])
+    parser.add_argument('--data-dir', default=str(DATA_DIR))
+    args = parser.parse_args()
+
+    store = DocumentStore(args.data_dir)
+
+    if args.command == 'migrate':
+        # Alla creazione del database la migrazione parte da sola; qui si
+        # importano anche file legacy ricomparsi dopo (es. da un backup)
+        store.migrate_legacy()
+        print(f"📚 Archivio: {store.scraped_count()} documenti trovati, {len(store)} scaricati")
+    elif args.command == 'export':
+        lines = store.export_snapshot()
+        print(f"📝 Dump testuale: {store.data_dir / SNAPSHOT_FILE} ({lines} righe)")
+    elif args.command == 'compact':
+        result = store.compact()
+        print(f"🗜️  Database compattato: {result['documents']} documenti, "
+              f"{result['bytes_before'] / 1024:.0f} KB -> {result['bytes_after'] / 1024:.0f} KB")
+    else:
+        size = store.db_path.stat().st_size if store.db_path.exists() else 0
+        print(f"🔎 Trovati:      {store.scraped_count()}")
+        print(f"📚 Scaricati:    {len(store)}")
+        print(f"⏳ Da scaricare: {store.pending_count()}")
+        print(f"💾 Database:     {store.db_path} ({size / 1024:.0f} KB)")
+        last = store.load_stats()
+        if last:
+            print(f"🕐 Ultimo fetch: {last['last_fetch']}")
@@ -0,0 +1,276 @@
+"""
+Cache persistente degli embedding indirizzata per contenuto
+Posizione: /scripts/embedding_cache.py
+
+Ogni vettore è salvato in un unico file SQLite con chiave
+(nome modello, SHA-256 del testo): lo stesso testo non viene mai
+ricodificato, anche se ricompare sotto un altro id di documento, dopo una
+ricostruzione completa o arrivando sia da RSS sia da fetch HTML.
+Quando il file supera la dimensione massima vengono eliminate le voci
+usate meno di recente (LRU).
+
+QueryEmbeddingCache è il livello in memoria davanti a questa cache per le
+domande della chat, indicizzato sulla domanda normalizzata; su disco le
+domande usano un file proprio (QUERY_CACHE_FILE).
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from knowledge_artifact import chunk_hash
+
+
+DEFAULT_CACHE_FILE = os.environ.get('EMBEDDING_CACHE_PATH', '.cache/embeddings.sqlite')
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# Domande della chat: file separato, con un limite più basso. Eviction e
+# dimensione valgono per tutto il file, quindi nella cache della build
+# l'LRU delle domande cancellerebbe gli embedding dei chunk.
+QUERY_CACHE_FILE = os.environ.get('QUERY_EMBEDDING_CACHE_PATH', '.cache/query_embeddings.sqlite')
+
+# Limite prudente per il numero di parametri in una query SQLite
+_SQL_BATCH = 500
+
+
+class EmbeddingCache:
+    """Cache SQLite di embedding float32 con eviction LRU per dimensione"""
+
+    def __init__(self, model_name, path=DEFAULT_CACHE_FILE, max_bytes=DEFAULT_MAX_BYTES):
+        self.model_name = model_name
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access)"
+        )
+        self._conn.commit()
+
+        row = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()
+        self._total_bytes = row[0]
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    @property
+    def size_bytes(self):
+        return self._total_bytes
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hit_rate, 4),
+            'size_mb': round(self._total_bytes / (1024 * 1024), 2),
+        }
+
+    def get_or_encode(self, texts, encode_fn, keys=None):
+        """
+        Restituisce gli embedding dei testi, codificando solo quelli mancanti
+
+        Args:
+            texts: lista di stringhe
+            encode_fn: funzione lista di testi -> matrice numpy (N x D)
+            keys: chiavi di cache al posto dei testi (es. domande normalizzate);
+                al modello arriva comunque il testo originale
+
+        Returns:
+            matrice float32 (len(texts) x D)
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        hashes = [chunk_hash(key) for key in (keys if keys is not None else texts)]
+        found = self._lookup(hashes)
+
+        # Testi mancanti (deduplicati: lo stesso testo si codifica una volta)
+        missing = {}
+        for text, h in zip(texts, hashes):
+            if h not in found and h not in missing:
+                missing[h] = text
+
+        n_hits = sum(1 for h in hashes if h in found)
+        with self._lock:
+            self.hits += n_hits
+            self.misses += len(hashes) - n_hits
+
+        if missing:
+            encoded = np.asarray(encode_fn(list(missing.values())), dtype=np.float32)
+            new_vectors = dict(zip(missing.keys(), encoded))
+            self._store(new_vectors)
+            found.update(new_vectors)
+
+        return np.stack([found[h] for h in hashes]).astype(np.float32, copy=False)
+
+    def _lookup(self, hashes):
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+
+        with self._lock:
+            for i in range(0, len(unique), _SQL_BATCH):
+                batch = unique[i:i + _SQL_BATCH]
+                placeholders = ','.join('?' * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [self.model_name, *batch]
+                ).fetchall()
+
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float32)
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE model = ? AND text_hash = ?",
+                    [(now, self.model_name, h) for h in found]
+                )
+                self._conn.commit()
+
+        return found
+
+    def _store(self, vectors):
+        now = time.time()
+        rows = [
+            (self.model_name, h, int(vector.shape[0]), vector.astype(np.float32).tobytes(), now)
+            for h, vector in vectors.items()
+        ]
+
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, text_hash, dim, vector, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+            if self._conn.total_changes - before == len(rows):
+                self._total_bytes += sum(len(row[3]) for row in rows)
+            else:
+                row = self._conn.execute(
+                    "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+                ).fetchone()
+                self._total_bytes = row[0]
+
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Elimina le voci meno recenti fino a scendere al 90% del limite"""
+        target = int(self.max_bytes * 0.9)
+        to_delete = []
+        freed = 0
+
+        cursor = self._conn.execute(
+            "SELECT model, text_hash, LENGTH(vector) FROM embeddings ORDER BY last_access ASC"
+        )
+        for model, text_hash, size in cursor:
+            if self._total_bytes - freed <= target:
+                break
+            to_delete.append((model, text_hash))
+            freed += size
+
+        self._conn.executemany(
+            "DELETE FROM embeddings WHERE model = ? AND text_hash = ?",
+            to_delete
+        )
+        self._conn.commit()
+        self._total_bytes -= freed
+
+        print(f"   🧹 Cache embeddings: rimosse {len(to_delete)} voci ({freed / (1024 * 1024):.1f} MB)")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def normalize_query(query):
+    """Normalizza una domanda per la cache: maiuscole, spazi e punteggiatura"""
+    query = unicodedata.normalize('NFKC', query).lower()
+    query = ''.join(
+        ' ' if unicodedata.category(ch).startswith('P') else ch
+        for ch in query
+    )
+    return ' '.join(query.split())
+
+
+class QueryEmbeddingCache:
+    """Cache LRU in memoria, limitata e thread-safe, degli embedding delle domande"""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.model_name = None
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def bind_model(self, model_name):
+        """Associa la cache a un modello: se cambia, gli embedding non valgono più"""
+        with self._lock:
+            if model_name != self.model_name:
+                self._entries.clear()
+                self.model_name = model_name
+
+    def get(self, key):
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, key, embedding):
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hit_rate, 4),
+            'size': len(self._entries),
+        }
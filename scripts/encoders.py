@@ -0,0 +1,251 @@
+"""
+Encoder di testo intercambiabili per build e chat (PyTorch / ONNX Runtime)
+Posizione: /scripts/encoders.py
+
+    torch   SentenceTransformer originale (riferimento)
+    onnx    lo stesso transformer esportato in ONNX, quantizzato dinamicamente
+            in int8 ed eseguito con ONNX Runtime su CPU (thread intra-op
+            configurabili); mean pooling fatto in NumPy
+
+onnxruntime e onnx sono dipendenze opzionali (requirements-onnx.txt): senza,
+si usa l'encoder PyTorch. L'esportazione avviene una sola volta e finisce
+in .cache/onnx/<modello>/.
+Gli embedding ONNX int8 differiscono leggermente da quelli PyTorch: per
+questo ogni encoder ha una propria chiave nella cache degli embedding
+(`cache_key`) e il manifest dell'artifact registra l'encoder usato.
+"""
+
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import onnxruntime as ort
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+
+ENCODER_BACKENDS = ('torch', 'onnx')
+DEFAULT_ENCODER_BACKEND = os.environ.get('RAG_ENCODER_BACKEND', 'torch')
+ONNX_CACHE_DIR = Path(os.environ.get('ONNX_CACHE_DIR', '.cache/onnx'))
+# 0 = tutti i core disponibili
+ENCODER_THREADS = int(os.environ.get('RAG_ENCODER_THREADS', 0))
+
+ONNX_CONFIG_FILE = 'encoder_config.json'
+ONNX_MODEL_FILE = 'model.onnx'
+ONNX_INT8_MODEL_FILE = 'model_int8.onnx'
+
+
+def resolve_backend(name):
+    """Backend effettivo: senza onnxruntime si ripiega su PyTorch"""
+    if name not in ENCODER_BACKENDS:
+        raise ValueError(f"Encoder sconosciuto: {name}")
+
+    if name == 'onnx' and not ONNX_AVAILABLE:
+        print("⚠️  onnxruntime non installato: uso encoder PyTorch")
+        return 'torch'
+
+    return name
+
+
+def cache_key(model_name, backend):
+    """Chiave della cache embedding: gli embedding ONNX int8 non sono identici a PyTorch"""
+    return model_name if backend == 'torch' else f"{model_name}#onnx-int8"
+
+
+class TorchEncoder:
+    """SentenceTransformer così com'è"""
+
+    backend = 'torch'
+
+    def __init__(self, model_name):
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self.cache_key = cache_key(model_name, self.backend)
+        self.model = SentenceTransformer(model_name, device='cpu')
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False):
+        return np.asarray(
+            self.model.encode(
+                texts,
+                batch_size=batch_size,
+                show_progress_bar=show_progress_bar,
+                convert_to_numpy=True
+            ),
+            dtype=np.float32
+        )
+
+
+def export_onnx(model_name, cache_dir=ONNX_CACHE_DIR):
+    """
+    Esporta il transformer di un SentenceTransformer in ONNX e lo quantizza in int8
+
+    Returns:
+        directory con modello, tokenizer e configurazione di pooling
+    """
+    export_dir = Path(cache_dir) / model_name.replace('/', '__')
+    if (export_dir / ONNX_CONFIG_FILE).exists():
+        return export_dir
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Normalize, Pooling
+
+    print(f"📤 Esportazione ONNX: {model_name}")
+    st_model = SentenceTransformer(model_name, device='cpu')
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+
+    pooling = next((m for m in st_model if isinstance(m, Pooling)), None)
+    if pooling is None or not pooling.pooling_mode_mean_tokens:
+        raise ValueError(f"Solo modelli con mean pooling sono supportati: {model_name}")
+
+    tmp_dir = export_dir.with_name(export_dir.name + '.tmp')
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    sample = tokenizer(['esempio di esportazione'], return_tensors='pt')
+    input_names = [
+        name for name in ('input_ids', 'attention_mask', 'token_type_ids')
+        if name in sample
+    ]
+
+    class _LastHiddenState(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs)), return_dict=False)[0]
+
+    axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            _LastHiddenState(transformer),
+            tuple(sample[name] for name in input_names),
+            str(tmp_dir / ONNX_MODEL_FILE),
+            input_names=input_names,
+            output_names=['last_hidden_state'],
+            dynamic_axes=axes,
+            opset_version=14
+        )
+
+    print("   🔧 Quantizzazione dinamica int8...")
+    quantize_dynamic(
+        str(tmp_dir / ONNX_MODEL_FILE),
+        str(tmp_dir / ONNX_INT8_MODEL_FILE),
+        weight_type=QuantType.QInt8
+    )
+
+    tokenizer.save_pretrained(str(tmp_dir))
+
+    config = {
+        'model_name': model_name,
+        'max_seq_length': st_model.max_seq_length,
+        'normalize': any(isinstance(m, Normalize) for m in st_model),
+        'input_names': input_names,
+    }
+    with open(tmp_dir / ONNX_CONFIG_FILE, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2)
+
+    if export_dir.exists():
+        shutil.rmtree(export_dir)
+    tmp_dir.rename(export_dir)
+
+    size_mb = (export_dir / ONNX_INT8_MODEL_FILE).stat().st_size / (1024 * 1024)
+    print(f"   ✅ Modello int8 salvato in {export_dir}/ ({size_mb:.0f} MB)")
+
+    return export_dir
+
+
+class OnnxEncoder:
+    """Transformer ONNX int8 + mean pooling, stessa interfaccia di TorchEncoder"""
+
+    backend = 'onnx'
+
+    def __init__(self, model_name, cache_dir=ONNX_CACHE_DIR, threads=ENCODER_THREADS,
+                 quantized=True):
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        self.cache_key = cache_key(model_name, self.backend)
+
+        export_dir = export_onnx(model_name, cache_dir)
+        with open(export_dir / ONNX_CONFIG_FILE, 'r', encoding='utf-8') as f:
+            self.config = json.load(f)
+
+        self.tokenizer = AutoTokenizer.from_pretrained(str(export_dir))
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = threads or os.cpu_count() or 1
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+
+        model_file = ONNX_INT8_MODEL_FILE if quantized else ONNX_MODEL_FILE
+        self.session = ort.InferenceSession(
+            str(export_dir / model_file),
+            sess_options=options,
+            providers=['CPUExecutionProvider']
+        )
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def _encode_batch(self, texts):
+        encoded = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.config['max_seq_length'],
+            return_tensors='np'
+        )
+        feeds = {name: encoded[name].astype(np.int64) for name in self.input_names}
+        hidden = self.session.run(None, feeds)[0]
+
+        # Mean pooling sui soli token reali (come sentence_transformers.models.Pooling)
+        mask = encoded['attention_mask'][..., None].astype(np.float32)
+        embeddings = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        if self.config['normalize']:
+            embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+        return embeddings.astype(np.float32)
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False):
+        if isinstance(texts, str):
+            return self.encode([texts], batch_size)[0]
+
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        # Batch di testi di lunghezza simile: meno padding da calcolare
+        order = np.argsort([-len(text) for text in texts], kind='stable')
+        result = [None] * len(texts)
+        total_batches = (len(texts) + batch_size - 1) // batch_size
+
+        for b, start in enumerate(range(0, len(texts), batch_size), 1):
+            rows = order[start:start + batch_size]
+            for row, embedding in zip(rows, self._encode_batch([texts[i] for i in rows])):
+                result[row] = embedding
+
+            if show_progress_bar and (b % 10 == 0 or b == total_batches):
+                print(f"   Batch {b}/{total_batches}")
+
+        return np.stack(result)
+
+
+def create_encoder(backend, model_name):
+    """Istanzia l'encoder richiesto (con ripiego su PyTorch se ONNX non è disponibile)"""
+    backend = resolve_backend(backend)
+
+    if backend == 'onnx':
+        return OnnxEncoder(model_name)
+    return TorchEncoder(model_name)
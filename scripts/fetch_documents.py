@@ -3,7 +3,7 @@ Script per scaricare documenti completi (PDF/HTML) dai link trovati
 Posizione: /scripts/fetch_documents.py
 """
 
-import json
+import argparse
 import requests
 from pathlib import Path
 from urllib.parse import urlparse
@@ -11,6 +11,11 @@ import hashlib
 from datetime import datetime
 import time
 import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import multiprocessing
+import os
+from contextlib import contextmanager, nullcontext
 
 try:
     import PyPDF2
@@ -21,14 +26,140 @@ except ImportError:
 
 from bs4 import BeautifulSoup
 
+from document_store import DocumentStore
 
-def download_pdf(url, save_dir):
-    """Scarica PDF e estrae testo"""
+
+# Limiti per i PDF
+MAX_PDF_BYTES = 50 * 1024 * 1024
+PDF_EXTRACT_TIMEOUT = 120  # secondi per documento
+PDF_EXTRACT_WORKERS = os.cpu_count() or 2
+
+# forkserver: i processi figli non ereditano i lock dei thread di download
+_mp_context = multiprocessing.get_context(
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+)
+_pdf_workers = threading.BoundedSemaphore(PDF_EXTRACT_WORKERS)
+
+
+class HostRateLimiter:
+    """
+    Limita concorrenza e frequenza delle richieste per singolo host
+
+    Le pause di cortesia valgono per host: richieste verso siti diversi
+    procedono in parallelo, quelle verso lo stesso sito restano distanziate
+    di un intervallo casuale tra min_delay e max_delay secondi.
+    """
+    
+    def __init__(self, per_host_concurrency=2, min_delay=1.0, max_delay=3.0):
+        self.per_host_concurrency = per_host_concurrency
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.slept_seconds = 0.0
+        
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._next_slot = {}
+    
+    def _semaphore(self, host):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.Semaphore(self.per_host_concurrency)
+            return self._semaphores[host]
+    
+    @contextmanager
+    def slot(self, url):
+        """Attende il turno per l'host dell'URL e lo occupa per la richiesta"""
+        host = urlparse(url).netloc
+        semaphore = self._semaphore(host)
+        
+        semaphore.acquire()
+        try:
+            with self._lock:
+                now = time.monotonic()
+                start = max(now, self._next_slot.get(host, now))
+                self._next_slot[host] = start + random.uniform(self.min_delay, self.max_delay)
+                wait = start - now
+                self.slept_seconds += wait
+            
+            if wait > 0:
+                time.sleep(wait)
+            
+            yield
+        finally:
+            semaphore.release()
+
+
+def _extract_pdf_worker(filepath, conn):
+    """Estrae il testo di un PDF (eseguita in un processo separato)"""
+    try:
+        with open(filepath, 'rb') as f:
+            reader = PyPDF2.PdfReader(f)
+            text = '\n'.join([page.extract_text() for page in reader.pages])
+            conn.send({'text': text, 'pages': len(reader.pages)})
+    except Exception as e:
+        conn.send({'error': str(e)})
+    finally:
+        conn.close()
+
+
+def extract_pdf_text(filepath, timeout=PDF_EXTRACT_TIMEOUT):
+    """
+    Estrae il testo di un PDF in un processo dedicato
+    
+    Al massimo PDF_EXTRACT_WORKERS estrazioni girano insieme, in parallelo ai
+    download degli altri thread; un PDF patologico viene terminato allo
+    scadere del timeout invece di bloccare la run.
+    
+    Returns:
+        dict con 'text' e 'pages', oppure con 'error'
+    """
+    with _pdf_workers:
+        parent_conn, child_conn = _mp_context.Pipe(duplex=False)
+        process = _mp_context.Process(
+            target=_extract_pdf_worker,
+            args=(str(filepath), child_conn),
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        
+        try:
+            if parent_conn.poll(timeout):
+                result = parent_conn.recv()
+            else:
+                result = {'error': f"timeout estrazione ({timeout}s)"}
+        except EOFError:
+            result = {'error': f"processo di estrazione terminato (exit {process.exitcode})"}
+        finally:
+            parent_conn.close()
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        
+        return result
+
+
+def download_pdf(url, save_dir, limiter=None, max_bytes=MAX_PDF_BYTES):
+    """
+    Scarica PDF in streaming su disco e estrae testo
+    
+    Args:
+        url: URL del PDF
+        save_dir: directory di destinazione
+        limiter: HostRateLimiter da occupare solo durante il download
+        max_bytes: dimensione massima accettata
+    """
     
     if not PDF_AVAILABLE:
         print(f"  ⚠️  Skip PDF (PyPDF2 mancante): {url}")
         return None
     
+    # Genera nome file univoco
+    url_hash = hashlib.sha256(url.encode()).hexdigest()[:12]
+    filename = f"{url_hash}.pdf"
+    filepath = save_dir / filename
+    part_path = filepath.with_suffix('.part')
+    
     try:
         print(f"  📄 Downloading PDF: {url}")
         
@@ -36,44 +167,54 @@ def download_pdf(url, save_dir):
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
         
-        response = requests.get(url, headers=headers, timeout=60)
-        response.raise_for_status()
-        
-        # Genera nome file univoco
-        url_hash = hashlib.sha256(url.encode()).hexdigest()[:12]
-        filename = f"{url_hash}.pdf"
-        filepath = save_dir / filename
+        size_bytes = 0
         
-        # Salva PDF
-        filepath.write_bytes(response.content)
-        
-        # Estrai testo
-        try:
-            with open(filepath, 'rb') as f:
-                reader = PyPDF2.PdfReader(f)
-                text = '\n'.join([page.extract_text() for page in reader.pages])
+        with limiter.slot(url) if limiter else nullcontext():
+            with requests.get(url, headers=headers, timeout=60, stream=True) as response:
+                response.raise_for_status()
                 
-                return {
-                    'filepath': str(filepath),
-                    'text': text,
-                    'pages': len(reader.pages),
-                    'size_bytes': len(response.content),
-                    'success': True
-                }
-        except Exception as e:
-            print(f"    ⚠️  Errore estrazione testo: {e}")
-            return {
-                'filepath': str(filepath),
-                'text': '',
-                'pages': 0,
-                'size_bytes': len(response.content),
-                'success': False,
-                'error': str(e)
-            }
+                declared = int(response.headers.get('Content-Length') or 0)
+                if declared > max_bytes:
+                    raise ValueError(f"PDF troppo grande ({declared / (1024 * 1024):.0f} MB)")
+                
+                # Salva PDF a blocchi, senza tenerlo tutto in memoria
+                with open(part_path, 'wb') as f:
+                    for block in response.iter_content(chunk_size=64 * 1024):
+                        size_bytes += len(block)
+                        if size_bytes > max_bytes:
+                            raise ValueError(
+                                f"PDF oltre il limite di {max_bytes / (1024 * 1024):.0f} MB"
+                            )
+                        f.write(block)
+        
+        part_path.replace(filepath)
             
     except Exception as e:
+        part_path.unlink(missing_ok=True)
         print(f"    ❌ Errore download: {e}")
         return None
+    
+    # Estrai testo (fuori dallo slot dell'host: il prossimo download può partire)
+    extracted = extract_pdf_text(filepath)
+    
+    if 'error' in extracted:
+        print(f"    ⚠️  Errore estrazione testo: {extracted['error']}")
+        return {
+            'filepath': str(filepath),
+            'text': '',
+            'pages': 0,
+            'size_bytes': size_bytes,
+            'success': False,
+            'error': extracted['error']
+        }
+    
+    return {
+        'filepath': str(filepath),
+        'text': extracted['text'],
+        'pages': extracted['pages'],
+        'size_bytes': size_bytes,
+        'success': True
+    }
 
 
 def fetch_html_content(url):
@@ -98,10 +239,6 @@ def fetch_html_content(url):
             'Cookie': 'cookie_notice_accepted=true; gdpr_consent=true'
         }
         
-        # Aggiungi delay casuale per sembrare umano
-        import random
-        time.sleep(random.uniform(1, 3))
-        
         response = requests.get(url, headers=headers, timeout=30, allow_redirects=True)
         response.raise_for_status()
         
@@ -170,34 +307,72 @@ def should_fetch_document(url, existing_ids):
     return True, doc_id
 
 
-def fetch_all_documents(max_docs=100):
-    """Scarica tutti i documenti dalla lista scraped"""
+def fetch_document(doc, doc_id, pdf_dir, limiter):
+    """
+    Scarica un singolo documento rispettando i limiti del suo host
+
+    Returns:
+        (documento completo oppure None, 'pdf' | 'html')
+    """
+    url = doc['url']
+    
+    # Determina tipo documento
+    is_pdf = url.lower().endswith('.pdf') or '.pdf' in url.lower()
+    
+    if is_pdf:
+        result = download_pdf(url, pdf_dir, limiter=limiter)
+    else:
+        with limiter.slot(url):
+            result = fetch_html_content(url)
+    
+    kind = 'pdf' if is_pdf else 'html'
+    
+    if not (result and result.get('success')):
+        return None, kind
+    
+    # Aggiungi metadati
+    full_doc = {
+        **doc,
+        **result,
+        'id': doc_id,
+        'fetched_at': datetime.now().isoformat(),
+        'document_type': kind
+    }
+    
+    return full_doc, kind
+
+
+def fetch_all_documents(max_docs=100, max_workers=8, per_host_concurrency=2, limiter=None):
+    """
+    Scarica tutti i documenti dalla lista scraped
+    
+    Args:
+        max_docs: numero massimo di documenti da scaricare per run (i più recenti)
+        max_workers: download contemporanei in totale
+        per_host_concurrency: download contemporanei verso lo stesso host
+        limiter: HostRateLimiter da usare (default: pause di cortesia standard)
+    
+    Returns:
+        i documenti scaricati in questo run (salvati in data/documents.sqlite)
+    """
     
     print("📥 Avvio download documenti...\n")
     
-    # Carica lista documenti scoperti
-    input_file = Path('data') / 'scraped_documents.json'
+    # Documenti scoperti e non ancora scaricati: query indicizzata sull'URL canonico
+    store = DocumentStore()
+    total = store.scraped_count()
     
-    if not input_file.exists():
-        print(f"❌ File non trovato: {input_file}")
+    if not total:
+        print(f"❌ Nessun documento trovato in {store.db_path}")
         print("   Esegui prima: python scripts/scrape_sources.py")
         return []
     
-    with open(input_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    documents = data.get('documents', [])
-    print(f"📋 Trovati {len(documents)} documenti da processare")
-    
-    # Carica documenti già processati (se esistono)
-    fetched_file = Path('data') / 'fetched_documents.json'
-    existing_ids = set()
+    pending = store.pending_count()
+    documents = store.pending_documents(limit=max_docs)
+    print(f"📋 Trovati {total} documenti, {pending} da processare")
     
-    if fetched_file.exists():
-        with open(fetched_file, 'r', encoding='utf-8') as f:
-            existing = json.load(f)
-            existing_ids = {doc['id'] for doc in existing.get('documents', [])}
-        print(f"♻️  {len(existing_ids)} documenti già in cache\n")
+    if len(store):
+        print(f"♻️  {len(store)} documenti già in archivio\n")
     
     # Crea directory per documenti
     docs_dir = Path('documents')
@@ -207,34 +382,35 @@ def fetch_all_documents(max_docs=100):
     pdf_dir.mkdir(exist_ok=True)
     
     # Processa documenti
-    processed = []
     stats = {
-        'total': len(documents),
+        'total': total,
         'fetched': 0,
-        'skipped': 0,
+        'skipped': total - pending,
         'failed': 0,
         'pdfs': 0,
         'html': 0
     }
     
-    for i, doc in enumerate(documents[:max_docs], 1):
+    results = [None] * len(documents)
+    to_fetch = []
+    seen_ids = set()
+    
+    # Primo passaggio (senza rete): duplicati del run e contenuto già presente nel feed
+    for i, doc in enumerate(documents):
         url = doc['url']
         
-        print(f"[{i}/{min(len(documents), max_docs)}] {doc['source']}")
-        
-        # Check se già processato
-        should_fetch, doc_id = should_fetch_document(url, existing_ids)
+        # Stesso URL trovato più volte (es. titolo cambiato tra due scraping)
+        should_fetch, doc_id = should_fetch_document(url, seen_ids)
         
         if not should_fetch:
-            print(f"  ⏭️  Skip: già processato")
             stats['skipped'] += 1
             continue
         
-        # NUOVO: Se il feed RSS ha già contenuto completo, usalo direttamente
+        seen_ids.add(doc_id)
+        
+        # Se il feed RSS ha già contenuto completo, usalo direttamente
         if doc.get('has_full_content') and doc.get('full_content'):
-            print(f"  ✅ Using content from RSS feed (skip fetch)")
-            
-            full_doc = {
+            results[i] = {
                 **doc,
                 'text': doc['full_content'],
                 'id': doc_id,
@@ -242,74 +418,58 @@ def fetch_all_documents(max_docs=100):
                 'document_type': 'rss_full',
                 'success': True
             }
-            
-            processed.append(full_doc)
-            existing_ids.add(doc_id)
             stats['fetched'] += 1
             stats['html'] += 1
-            
-            # Rate limiting più leggero per RSS (già scaricato)
-            time.sleep(0.5)
-            print()
             continue
         
-        # Altrimenti procedi con fetch normale
-        # Determina tipo documento
-        is_pdf = url.lower().endswith('.pdf') or '.pdf' in url.lower()
-        
-        result = None
-        
-        if is_pdf:
-            result = download_pdf(url, pdf_dir)
-            if result:
-                stats['pdfs'] += 1
-        else:
-            result = fetch_html_content(url)
-            if result:
-                stats['html'] += 1
+        to_fetch.append((i, doc, doc_id))
+    
+    print(f"⏭️  Già processati: {stats['skipped']}")
+    print(f"✅ Contenuto dal feed RSS: {stats['fetched']}")
+    print(f"🌐 Da scaricare: {len(to_fetch)} "
+          f"({max_workers} in parallelo, max {per_host_concurrency} per host)\n")
+    
+    # Download concorrente con limiti per host
+    if limiter is None:
+        limiter = HostRateLimiter(per_host_concurrency=per_host_concurrency)
+    
+    download_start = time.perf_counter()
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(fetch_document, doc, doc_id, pdf_dir, limiter): (i, doc)
+            for i, doc, doc_id in to_fetch
+        }
         
-        if result and result.get('success'):
-            # Aggiungi metadati
-            full_doc = {
-                **doc,
-                **result,
-                'id': doc_id,
-                'fetched_at': datetime.now().isoformat(),
-                'document_type': 'pdf' if is_pdf else 'html'
-            }
+        for done, future in enumerate(as_completed(futures), 1):
+            i, doc = futures[future]
             
-            processed.append(full_doc)
-            existing_ids.add(doc_id)
-            stats['fetched'] += 1
+            try:
+                full_doc, kind = future.result()
+            except Exception as e:
+                print(f"    ❌ Errore {doc['url']}: {e}")
+                full_doc, kind = None, None
             
-        else:
-            stats['failed'] += 1
-        
-        # Rate limiting: pausa tra richieste
-        time.sleep(random.uniform(1, 2))
-        print()
-    
-    # Carica documenti esistenti e aggiorna
-    all_documents = []
-    
-    if fetched_file.exists():
-        with open(fetched_file, 'r', encoding='utf-8') as f:
-            existing_data = json.load(f)
-            all_documents = existing_data.get('documents', [])
-    
-    # Aggiungi nuovi documenti
-    all_documents.extend(processed)
-    
-    # Salva risultati
-    output = {
-        'last_fetch': datetime.now().isoformat(),
-        'stats': stats,
-        'total_documents': len(all_documents),
-        'documents': all_documents
-    }
+            if full_doc:
+                results[i] = full_doc
+                stats['fetched'] += 1
+                stats['pdfs' if kind == 'pdf' else 'html'] += 1
+                print(f"[{done}/{len(to_fetch)}] ✅ {doc['source']}")
+            else:
+                stats['failed'] += 1
+                print(f"[{done}/{len(to_fetch)}] ❌ {doc['source']}")
+    
+    # Mantieni l'ordine della lista scraped
+    processed = [doc for doc in results if doc is not None]
+    
+    stats['download_seconds'] = round(time.perf_counter() - download_start, 2)
+    stats['politeness_sleep_seconds'] = round(limiter.slept_seconds, 2)
     
-    with open(fetched_file, 'w', encoding='utf-8') as f:
-        json.dump(output, f, indent=2, ensure_ascii=False)
+    print()
+    
+    # Scrive solo i nuovi documenti: I/O proporzionale al run, non allo storico
+    store.append(processed)
+    store.save_stats(stats)
     
     # Report
     print("=" * 60)
@@ -321,13 +481,25 @@ def fetch_all_documents(max_docs=100):
     print(f"  - HTML:             {stats['html']}")
     print(f"Già in cache:         {stats['skipped']}")
     print(f"Falliti:              {stats['failed']}")
-    print(f"Totale in database:   {len(all_documents)}")
-    print(f"Output salvato in:    {fetched_file}")
+    print(f"Tempo download:       {stats['download_seconds']}s "
+          f"(pause di cortesia: {stats['politeness_sleep_seconds']}s sommate sui thread)")
+    print(f"Totale in database:   {len(store)}")
+    print(f"Output salvato in:    {store.db_path}")
     print("=" * 60)
     
-    return all_documents
+    return processed
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Scarica i documenti trovati dallo scraping")
     # Limita a 100 documenti per run per evitare timeout
-    fetch_all_documents(max_docs=100)
+    parser.add_argument('--max-docs', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=8, help="download contemporanei totali")
+    parser.add_argument('--per-host', type=int, default=2, help="download contemporanei per host")
+    args = parser.parse_args()
+    
+    fetch_all_documents(
+        max_docs=args.max_docs,
+        max_workers=args.workers,
+        per_host_concurrency=args.per_host
+    )
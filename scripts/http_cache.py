@@ -0,0 +1,91 @@
+"""
+Cache dei validatori HTTP (ETag / Last-Modified) per feed e pagine indice
+Posizione: /scripts/http_cache.py
+
+Per ogni URL si conservano i validatori dell'ultima risposta 200 insieme
+ai documenti già estratti. Alla run successiva la richiesta è condizionale
+(If-None-Match / If-Modified-Since): con un 304 lo scraper restituisce
+direttamente i documenti salvati, senza scaricare né parsare la pagina.
+"""
+
+import json
+import threading
+from datetime import datetime
+from pathlib import Path
+
+
+DEFAULT_HTTP_CACHE_FILE = Path('.cache') / 'http_cache.json'
+
+
+class HTTPValidatorCache:
+    """Validatori HTTP e documenti parsati, persistiti in un file JSON"""
+
+    def __init__(self, path=DEFAULT_HTTP_CACHE_FILE):
+        self.path = Path(path)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+
+        if self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️  Cache HTTP illeggibile, ignorata: {e}")
+
+    def conditional_headers(self, url):
+        """Header If-None-Match / If-Modified-Since per l'URL (vuoti se non in cache)"""
+        with self._lock:
+            entry = self._entries.get(url)
+
+        if not entry:
+            return {}
+
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def documents(self, url):
+        """Documenti estratti all'ultima risposta 200 (None se assenti)"""
+        with self._lock:
+            entry = self._entries.get(url)
+
+        if entry is None:
+            return None
+        return [dict(doc) for doc in entry['documents']]
+
+    def record_hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def store(self, url, response_headers, documents):
+        """Salva validatori e documenti di una risposta 200"""
+        etag = response_headers.get('ETag')
+        last_modified = response_headers.get('Last-Modified')
+
+        with self._lock:
+            self.misses += 1
+
+            # Senza validatori una richiesta condizionale è inutile
+            if not etag and not last_modified:
+                self._entries.pop(url, None)
+                return
+
+            self._entries[url] = {
+                'etag': etag,
+                'last_modified': last_modified,
+                'stored_at': datetime.now().isoformat(),
+                'documents': documents
+            }
+
+    def save(self):
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            tmp_path.replace(self.path)
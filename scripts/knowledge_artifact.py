@@ -0,0 +1,358 @@
+"""
+Formato binario della knowledge base (memory-mapped, zero-copy)
+Posizione: /scripts/knowledge_artifact.py
+
+Layout della directory knowledge/:
+    manifest.json       metadati (modello, data creazione, stats, shape, dtype)
+    embeddings.npy      matrice contigua (N x D), righe normalizzate L2, apribile con mmap:
+                        float32, float16 oppure int8 (vedi quantize_embeddings)
+    embeddings_scales.npy   solo int8: scala float32 per riga
+    embeddings_f32.npy      opzionale: copia float32 per il rescoring dei candidati
+    ids.txt             un id di chunk per riga
+    hashes.txt          SHA-256 del testo di ogni chunk (build incrementale)
+    texts.bin           testi dei chunk concatenati (UTF-8)
+    texts_offsets.npy   offset int64 (N+1) dei testi dentro texts.bin
+    metadatas.jsonl     un oggetto JSON di metadati per riga
+    chroma/             opzionale: indice ChromaDB già costruito (HNSW), solo per
+                        corpus oltre la soglia della ricerca esatta (vedi build_knowledge.py)
+    bm25_*              indice lessicale BM25 (vedi bm25_index.py)
+
+Al caricamento nessun float viene convertito in oggetto Python: la matrice
+resta mappata su disco e il sistema operativo carica solo le pagine usate.
+L'indice HNSW viene deserializzato così com'è, senza reinserire i vettori.
+"""
+
+import hashlib
+import json
+import pickle
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+from bm25_index import BM25Index
+
+
+FORMAT_VERSION = 1
+ARTIFACT_DIR = 'knowledge'
+
+MANIFEST_FILE = 'manifest.json'
+EMBEDDINGS_FILE = 'embeddings.npy'
+SCALES_FILE = 'embeddings_scales.npy'
+FULL_EMBEDDINGS_FILE = 'embeddings_f32.npy'
+IDS_FILE = 'ids.txt'
+HASHES_FILE = 'hashes.txt'
+TEXTS_FILE = 'texts.bin'
+TEXT_OFFSETS_FILE = 'texts_offsets.npy'
+METADATAS_FILE = 'metadatas.jsonl'
+INDEX_DIR = 'chroma'
+
+
+EMBEDDING_DTYPES = ('float32', 'float16', 'int8')
+
+
+def quantize_embeddings(matrix, dtype):
+    """
+    Quantizza una matrice di embedding
+
+    Args:
+        matrix: matrice float (N x D)
+        dtype: 'float32', 'float16' oppure 'int8' (scala simmetrica per riga)
+
+    Returns:
+        (dati quantizzati, scale per riga oppure None)
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+
+    if dtype == 'float32':
+        return np.ascontiguousarray(matrix), None
+
+    if dtype == 'float16':
+        return matrix.astype(np.float16), None
+
+    if dtype == 'int8':
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    raise ValueError(f"dtype non supportato: {dtype}")
+
+
+def dequantize_embeddings(data, scales=None):
+    """Inverso di quantize_embeddings (float32)"""
+    data = np.asarray(data, dtype=np.float32)
+    if scales is None:
+        return data
+    scales = np.asarray(scales, dtype=np.float32)
+    return data * (scales[..., None] if data.ndim == 2 else scales)
+
+
+def chunk_hash(text):
+    """Hash del contenuto di un chunk (SHA-256 esadecimale)"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class TextStore:
+    """Accesso lazy ai testi dei chunk concatenati in un unico blob UTF-8"""
+
+    def __init__(self, blob, offsets):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+
+        start, end = int(self._offsets[index]), int(self._offsets[index + 1])
+        return bytes(self._blob[start:end]).decode('utf-8')
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class KnowledgeArtifact:
+    """Knowledge base aperta in sola lettura"""
+
+    def __init__(self, manifest, ids, texts, metadatas, embeddings, path=None, hashes=None,
+                 scales=None, full_embeddings=None):
+        self.manifest = manifest
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.embeddings = embeddings
+        self.scales = scales
+        self.full_embeddings = full_embeddings
+        self.path = path
+        self._hashes = hashes
+        self._lexical_index = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def created_at(self):
+        return self.manifest.get('created_at', 'N/A')
+
+    @property
+    def model_name(self):
+        return self.manifest.get('model_name')
+
+    @property
+    def hashes(self):
+        """Hash dei chunk (calcolati dai testi per artifact che non li hanno)"""
+        if self._hashes is None:
+            self._hashes = [chunk_hash(text) for text in self.texts]
+        return self._hashes
+
+    @property
+    def dtype(self):
+        return self.manifest.get('dtype', 'float32')
+
+    def float_vectors(self, index):
+        """Vettori float32 delle righe indicate (copia a precisione piena se presente)"""
+        if self.full_embeddings is not None:
+            return np.asarray(self.full_embeddings[index], dtype=np.float32)
+        scales = self.scales[index] if self.scales is not None else None
+        return dequantize_embeddings(self.embeddings[index], scales)
+
+    @property
+    def normalized(self):
+        """True se le righe della matrice hanno già norma 1"""
+        return bool(self.manifest.get('normalized', False))
+
+    @property
+    def has_lexical_index(self):
+        return self.path is not None and BM25Index.exists(self.path)
+
+    @property
+    def lexical_index(self):
+        """Indice BM25 dei chunk (costruito in memoria se l'artifact non lo contiene)"""
+        if self._lexical_index is None:
+            if self.has_lexical_index:
+                self._lexical_index = BM25Index.open(self.path)
+            else:
+                self._lexical_index = BM25Index.build(list(self.texts))
+        return self._lexical_index
+
+    @property
+    def index_path(self):
+        """Directory dell'indice ChromaDB serializzato (None se assente)"""
+        if self.path is None or not (self.path / INDEX_DIR).is_dir():
+            return None
+        return self.path / INDEX_DIR
+
+    @property
+    def mapped_bytes(self):
+        """Byte su disco mappati in memoria (non necessariamente residenti)"""
+        if self.path is None:
+            return 0
+        return sum(
+            (self.path / name).stat().st_size
+            for name in (EMBEDDINGS_FILE, SCALES_FILE, FULL_EMBEDDINGS_FILE,
+                         TEXTS_FILE, TEXT_OFFSETS_FILE)
+            if (self.path / name).exists()
+        )
+
+    @classmethod
+    def open(cls, path=ARTIFACT_DIR):
+        """Apre la directory dell'artifact senza copiare embeddings e testi"""
+        path = Path(path)
+
+        with open(path / MANIFEST_FILE, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+
+        if manifest.get('format_version') != FORMAT_VERSION:
+            raise ValueError(
+                f"Formato knowledge base non supportato: {manifest.get('format_version')}"
+            )
+
+        embeddings = np.load(path / EMBEDDINGS_FILE, mmap_mode='r')
+        scales = np.load(path / SCALES_FILE) if (path / SCALES_FILE).exists() else None
+        full_embeddings = None
+        if (path / FULL_EMBEDDINGS_FILE).exists():
+            full_embeddings = np.load(path / FULL_EMBEDDINGS_FILE, mmap_mode='r')
+        offsets = np.load(path / TEXT_OFFSETS_FILE, mmap_mode='r')
+
+        # np.memmap non accetta file vuoti
+        if (path / TEXTS_FILE).stat().st_size > 0:
+            blob = np.memmap(path / TEXTS_FILE, dtype=np.uint8, mode='r')
+        else:
+            blob = np.zeros(0, dtype=np.uint8)
+
+        with open(path / IDS_FILE, 'r', encoding='utf-8') as f:
+            ids = f.read().splitlines()
+
+        with open(path / METADATAS_FILE, 'r', encoding='utf-8') as f:
+            metadatas = [json.loads(line) for line in f if line.strip()]
+
+        hashes = None
+        if (path / HASHES_FILE).exists():
+            with open(path / HASHES_FILE, 'r', encoding='utf-8') as f:
+                hashes = f.read().splitlines()
+
+        if not (len(ids) == len(metadatas) == len(offsets) - 1 == embeddings.shape[0]):
+            raise ValueError(f"Knowledge base corrotta: sidecar non allineati in {path}")
+
+        return cls(
+            manifest, ids, TextStore(blob, offsets), metadatas, embeddings,
+            path=path, hashes=hashes, scales=scales, full_embeddings=full_embeddings
+        )
+
+    @classmethod
+    def from_legacy_pickle(cls, pickle_path):
+        """Carica il vecchio knowledge.pkl (liste Python) nello stesso formato"""
+        with open(pickle_path, 'rb') as f:
+            data = pickle.load(f)
+
+        manifest = {
+            'format_version': FORMAT_VERSION,
+            'collection_name': data.get('collection_name', 'scuola_docs'),
+            'model_name': data.get('model_name'),
+            'created_at': data.get('created_at', 'N/A'),
+            'stats': data.get('stats', {}),
+        }
+        embeddings = np.asarray(data['embeddings'], dtype=np.float32)
+
+        return cls(manifest, data['ids'], data['documents'], data['metadatas'], embeddings)
+
+
+def artifact_exists(path=ARTIFACT_DIR):
+    return (Path(path) / MANIFEST_FILE).exists()
+
+
+def write_artifact(path, ids, texts, metadatas, embeddings, manifest, index_dir=None,
+                   hashes=None, lexical_index=None, dtype='float32', keep_float=False):
+    """
+    Scrive l'artifact in una directory temporanea e la sostituisce
+    atomicamente a quella esistente
+
+    Args:
+        path: directory di destinazione
+        ids: lista di id dei chunk
+        texts: lista di testi dei chunk
+        metadatas: lista di dict di metadati
+        embeddings: matrice (N x D)
+        manifest: dict con i metadati della build
+        index_dir: directory di un ChromaDB persistente da includere
+        hashes: hash dei testi (calcolati se non forniti)
+        lexical_index: BM25Index da includere
+        dtype: formato di embeddings.npy ('float32', 'float16', 'int8')
+        keep_float: salva anche la copia float32 per il rescoring
+
+    Returns:
+        dimensione totale in byte
+    """
+    path = Path(path)
+    tmp_path = path.with_name(path.name + '.tmp')
+
+    if tmp_path.exists():
+        shutil.rmtree(tmp_path)
+    tmp_path.mkdir(parents=True)
+
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    data, scales = quantize_embeddings(embeddings, dtype)
+    np.save(tmp_path / EMBEDDINGS_FILE, data)
+    if scales is not None:
+        np.save(tmp_path / SCALES_FILE, scales)
+    if keep_float and dtype != 'float32':
+        np.save(tmp_path / FULL_EMBEDDINGS_FILE, embeddings)
+
+    with open(tmp_path / IDS_FILE, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(ids))
+
+    if hashes is None:
+        hashes = [chunk_hash(text) for text in texts]
+    with open(tmp_path / HASHES_FILE, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(hashes))
+
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    with open(tmp_path / TEXTS_FILE, 'wb') as f:
+        for i, text in enumerate(texts):
+            encoded = text.encode('utf-8')
+            f.write(encoded)
+            offsets[i + 1] = offsets[i] + len(encoded)
+    np.save(tmp_path / TEXT_OFFSETS_FILE, offsets)
+
+    with open(tmp_path / METADATAS_FILE, 'w', encoding='utf-8') as f:
+        for metadata in metadatas:
+            f.write(json.dumps(metadata, ensure_ascii=False) + '\n')
+
+    if index_dir is not None:
+        shutil.copytree(index_dir, tmp_path / INDEX_DIR)
+
+    if lexical_index is not None:
+        lexical_index.save(tmp_path)
+
+    manifest = {
+        **manifest,
+        'format_version': FORMAT_VERSION,
+        'index': INDEX_DIR if index_dir is not None else None,
+        'count': int(embeddings.shape[0]),
+        'dim': int(embeddings.shape[1]) if embeddings.ndim == 2 else 0,
+        'dtype': dtype,
+    }
+
+    # Il manifest è scritto per ultimo: una directory senza manifest è incompleta
+    with open(tmp_path / MANIFEST_FILE, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+    old_path = path.with_name(path.name + '.old')
+    if old_path.exists():
+        shutil.rmtree(old_path)
+    if path.exists():
+        path.rename(old_path)
+    tmp_path.rename(path)
+    if old_path.exists():
+        shutil.rmtree(old_path)
+
+    return sum(p.stat().st_size for p in path.rglob('*') if p.is_file())
@@ -0,0 +1,137 @@
+"""
+Micro-batching delle richieste concorrenti
+Posizione: /scripts/microbatch.py
+
+Con molti docenti che chiedono insieme (es. il giorno delle GPS) ogni
+richiesta faceva il proprio forward del modello: il costo di un forward
+cresce poco con il numero di domande, quindi N forward da una domanda
+costano molto più di uno da N. MicroBatcher raccoglie le richieste che
+arrivano entro max_wait_ms (fino a max_batch_size domande) e le passa
+insieme a una sola funzione di elaborazione, eseguita da un thread dedicato;
+ogni chiamante riceve il proprio risultato (o l'eccezione del batch).
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+DEFAULT_MAX_BATCH_SIZE = 32
+DEFAULT_MAX_WAIT_MS = 5.0
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """Accorpa le richieste concorrenti in batch elaborati da un thread dedicato"""
+
+    def __init__(self, process, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms=DEFAULT_MAX_WAIT_MS, name='microbatch'):
+        """
+        Args:
+            process: funzione lista di item -> lista di risultati (stesso ordine)
+            max_batch_size: domande massime per batch (somma delle `size`)
+            max_wait_ms: attesa massima, dalla prima richiesta, di altre richieste;
+                con 0 non si aspetta ma si accorpano comunque le richieste già
+                in coda (per non accorpare affatto non usare il batcher)
+            name: nome del thread (utile nei dump dei thread)
+        """
+        self.process = process
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.name = name
+
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def submit(self, item, size=1):
+        """
+        Accoda un item e attende il suo risultato
+
+        Args:
+            size: domande contenute nell'item (conta per max_batch_size)
+        """
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((item, size, future))
+        return future.result()
+
+    def close(self):
+        """Ferma il thread dopo aver elaborato le richieste già accodate"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'mean_batch': round(self.items / self.batches, 2) if self.batches else 0.0,
+            'largest_batch': self.largest_batch,
+        }
+
+    def _collect(self, first):
+        """Il primo item più quelli arrivati entro max_wait (False se va fermato)"""
+        batch = [first]
+        total = first[1]
+        deadline = time.perf_counter() + self.max_wait
+
+        while total < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is _STOP:
+                return batch, False
+            batch.append(entry)
+            total += entry[1]
+
+        return batch, True
+
+    def _run(self):
+        running = True
+        while running:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+
+            batch, running = self._collect(first)
+            self._execute(batch)
+
+    def _execute(self, batch):
+        futures = [future for _, _, future in batch]
+
+        try:
+            results = list(self.process([item for item, _, _ in batch]))
+            # Un risultato mancante lascerebbe un chiamante in attesa per sempre
+            if len(results) != len(batch):
+                raise RuntimeError(
+                    f"{self.name}: {len(results)} risultati per un batch di {len(batch)} richieste"
+                )
+        except BaseException as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.items += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+
+        for future, result in zip(futures, results):
+            future.set_result(result)
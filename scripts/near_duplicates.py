@@ -0,0 +1,160 @@
+"""
+Rilevamento dei documenti quasi identici con MinHash e LSH
+Posizione: /scripts/near_duplicates.py
+
+La stessa notizia arriva spesso da più canali (feed ATA e Mobilità di
+Orizzonte Scuola, URL con parametri diversi, ripubblicazioni dei sindacati):
+il controllo sull'URL non la riconosce e il testo verrebbe chunkato e
+codificato più volte. Qui ogni documento diventa una firma MinHash sugli
+shingle di parole; le firme sono divise in bande (LSH) e solo i documenti
+che condividono almeno una banda vengono confrontati. Le coppie con
+similarità di Jaccard stimata sopra la soglia finiscono nello stesso gruppo.
+
+Di ogni gruppo resta un documento canonico (il testo più lungo), che
+conserva URL e fonti degli altri.
+"""
+
+import re
+import unicodedata
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+
+DEFAULT_THRESHOLD = 0.8
+NUM_PERM = 128
+BANDS = 16  # 16 bande da 8 righe: coppie candidate da Jaccard ~0.7 in su
+SHINGLE_SIZE = 5
+
+_SIGNATURE_BLOCK = 4096
+
+_WORD_RE = re.compile(r'\w+')
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """Hash a 32 bit degli shingle di `size` parole normalizzate"""
+    words = _WORD_RE.findall(unicodedata.normalize('NFKC', text).lower())
+    if len(words) < size:
+        words = words or ['']
+        return np.array([zlib.crc32(' '.join(words).encode())], dtype=np.uint64)
+
+    return np.unique(np.fromiter(
+        (zlib.crc32(' '.join(words[i:i + size]).encode()) for i in range(len(words) - size + 1)),
+        dtype=np.uint64
+    ))
+
+
+class NearDuplicateDetector:
+    """Raggruppa i documenti con testo quasi identico (Jaccard stimata >= soglia)"""
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, num_perm=NUM_PERM, bands=BANDS,
+                 shingle_size=SHINGLE_SIZE, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm deve essere multiplo di bands")
+
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, int(_MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, int(_MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+
+        self._docs = []          # (id, url, source, lunghezza testo)
+        self._signatures = []
+        self._buckets = [defaultdict(list) for _ in range(bands)]
+        self._parent = []
+
+    def __len__(self):
+        return len(self._docs)
+
+    def signature(self, text):
+        """Firma MinHash (num_perm valori a 32 bit)"""
+        hashes = shingles(text, self.shingle_size)
+        result = np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+
+        # A blocchi: un PDF lungo non crea una matrice shingle x num_perm enorme.
+        # L'overflow a 64 bit è voluto (stessa famiglia di hash di datasketch)
+        for start in range(0, len(hashes), _SIGNATURE_BLOCK):
+            block = hashes[start:start + _SIGNATURE_BLOCK]
+            with np.errstate(over='ignore'):
+                permuted = (np.outer(block, self._a) + self._b) % _MERSENNE_PRIME
+            np.minimum(result, (permuted & _MAX_HASH).min(axis=0), out=result)
+
+        return result.astype(np.uint32)
+
+    def _find(self, i):
+        while self._parent[i] != i:
+            self._parent[i] = self._parent[self._parent[i]]
+            i = self._parent[i]
+        return i
+
+    def add(self, doc_id, text, url='', source=''):
+        """Aggiunge un documento e lo unisce ai quasi duplicati già visti"""
+        index = len(self._docs)
+        signature = self.signature(text)
+
+        self._docs.append((doc_id, url, source, len(text)))
+        self._signatures.append(signature)
+        self._parent.append(index)
+
+        candidates = set()
+        for band, buckets in enumerate(self._buckets):
+            key = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            candidates.update(buckets[key])
+            buckets[key].append(index)
+
+        for other in candidates:
+            if self._find(other) == self._find(index):
+                continue
+            similarity = np.mean(self._signatures[other] == signature)
+            if similarity >= self.threshold:
+                self._parent[self._find(index)] = self._find(other)
+
+    def groups(self):
+        """
+        Gruppi di quasi duplicati
+
+        Returns:
+            dict id canonico -> lista di (id, url, fonte) dei documenti del
+            gruppo, canonico per primo (testo più lungo, a parità il primo visto)
+        """
+        members = defaultdict(list)
+        for i in range(len(self._docs)):
+            members[self._find(i)].append(i)
+
+        groups = {}
+        for indices in members.values():
+            canonical = max(indices, key=lambda i: (self._docs[i][3], -i))
+            ordered = [canonical] + [i for i in indices if i != canonical]
+            groups[self._docs[canonical][0]] = [self._docs[i][:3] for i in ordered]
+
+        return groups
+
+    def canonical_ids(self):
+        """id documento -> id del canonico del suo gruppo"""
+        return {
+            doc_id: canonical
+            for canonical, members in self.groups().items()
+            for doc_id, _, _ in members
+        }
+
+    def report(self):
+        """Documenti e duplicati rimossi per fonte"""
+        canonical = self.canonical_ids()
+        per_source = defaultdict(lambda: {'documents': 0, 'duplicates': 0})
+
+        for doc_id, _, source, _ in self._docs:
+            per_source[source]['documents'] += 1
+            if canonical[doc_id] != doc_id:
+                per_source[source]['duplicates'] += 1
+
+        for stats in per_source.values():
+            stats['dedup_ratio'] = round(stats['duplicates'] / stats['documents'], 4)
+
+        return dict(per_source)
@@ -0,0 +1,154 @@
+"""
+Partizioni della knowledge base per fonte e per data
+Posizione: /scripts/partitions.py
+
+build_knowledge.py ordina i chunk dell'artifact per (fonte, data): ogni
+fonte occupa un intervallo contiguo di righe, ordinato per data al suo
+interno. PartitionIndex ricostruisce all'avvio, dai metadati, le righe di
+ogni fonte con le loro date (epoch): un filtro "solo USR Lazio, ultimi 30
+giorni" diventa una ricerca binaria sulle date delle partizioni scelte, e la
+ricerca vettoriale e BM25 scandisce solo quelle righe.
+
+Un chunk accorpato da più fonti (quasi duplicati) appartiene anche alle
+partizioni delle altre fonti. Con artifact non ordinati (build precedenti)
+le partizioni restano corrette, solo non contigue.
+"""
+
+from datetime import date, datetime, time, timezone
+
+import numpy as np
+
+from document_store import normalize_date
+
+
+# Data sconosciuta: ordinata per prima, esclusa da qualunque filtro per data
+UNKNOWN_DATE = np.iinfo(np.int64).min
+
+
+def metadata_epoch(metadata):
+    """Data del chunk in epoch (dal metadato date_epoch o, per build precedenti, da date)"""
+    epoch = metadata.get('date_epoch')
+    if epoch is None:
+        epoch = normalize_date(metadata.get('date'))
+    return epoch
+
+
+def metadata_sources(metadata):
+    """Fonte del chunk più quelle dei documenti accorpati come quasi duplicati"""
+    sources = [metadata.get('source', '')]
+    if metadata.get('duplicate_sources'):
+        sources.extend(metadata['duplicate_sources'].split(' | '))
+    return list(dict.fromkeys(sources))
+
+
+def partition_order(metadatas):
+    """Permutazione delle righe per (fonte, data, ordine originale) usata dalla build"""
+    def key(row):
+        epoch = metadata_epoch(metadatas[row])
+        return (metadatas[row].get('source', ''), UNKNOWN_DATE if epoch is None else epoch, row)
+
+    return sorted(range(len(metadatas)), key=key)
+
+
+def date_bound(value, end_of_day=False):
+    """
+    Estremo di un filtro per data in epoch
+
+    Accetta epoch, date/datetime o stringhe (ISO, dd/mm/yyyy, RFC-822...).
+    Con end_of_day una data senza orario include tutto il giorno.
+    """
+    if value is None or value == '':
+        return None
+
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp())
+
+    if isinstance(value, date):
+        moment = time.max if end_of_day else time.min
+        return int(datetime.combine(value, moment, tzinfo=timezone.utc).timestamp())
+
+    epoch = normalize_date(value)
+    if epoch is None:
+        raise ValueError(f"Data non riconosciuta: {value!r}")
+
+    if end_of_day and isinstance(value, str) and epoch % 86400 == 0 and ':' not in value:
+        epoch += 86400 - 1
+
+    return epoch
+
+
+class PartitionIndex:
+    """Righe dell'artifact per fonte, ordinate per data"""
+
+    def __init__(self, partitions):
+        """
+        Args:
+            partitions: dict fonte -> (righe int64, date int64), ordinate per data
+        """
+        self.partitions = partitions
+
+    @classmethod
+    def from_metadatas(cls, metadatas):
+        rows_by_source = {}
+
+        for row, metadata in enumerate(metadatas):
+            epoch = metadata_epoch(metadata)
+            for source in metadata_sources(metadata):
+                rows_by_source.setdefault(source, []).append(
+                    (UNKNOWN_DATE if epoch is None else epoch, row)
+                )
+
+        partitions = {}
+        for source, entries in rows_by_source.items():
+            entries.sort()
+            dates, rows = zip(*entries)
+            partitions[source] = (np.array(rows, dtype=np.int64), np.array(dates, dtype=np.int64))
+
+        return cls(partitions)
+
+    @property
+    def sources(self):
+        return sorted(self.partitions)
+
+    def stats(self):
+        """Chunk per fonte (per la UI e le metriche)"""
+        return {source: len(rows) for source, (rows, _) in sorted(self.partitions.items())}
+
+    def select(self, sources=None, date_from=None, date_to=None):
+        """
+        Righe che soddisfano i filtri
+
+        Args:
+            sources: nomi delle fonti (None = tutte)
+            date_from, date_to: estremi inclusi in epoch (None = aperto)
+
+        Returns:
+            None se non c'è alcun filtro, altrimenti array ordinato delle righe
+        """
+        if not sources and date_from is None and date_to is None:
+            return None
+
+        names = self.partitions if not sources else [s for s in sources if s in self.partitions]
+        selected = []
+
+        for name in names:
+            rows, dates = self.partitions[name]
+            start, end = 0, len(rows)
+
+            if date_from is not None or date_to is not None:
+                start = np.searchsorted(dates, UNKNOWN_DATE, side='right')
+            if date_from is not None:
+                start = max(start, np.searchsorted(dates, date_from, side='left'))
+            if date_to is not None:
+                end = np.searchsorted(dates, date_to, side='right')
+
+            if end > start:
+                selected.append(rows[start:end])
+
+        if not selected:
+            return np.zeros(0, dtype=np.int64)
+
+        # Un chunk può stare in più partizioni (fonti accorpate)
+        return np.unique(np.concatenate(selected))
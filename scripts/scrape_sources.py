@@ -7,22 +7,58 @@ import requests
 from bs4 import BeautifulSoup
 import feedparser
 from datetime import datetime
-import json
-from pathlib import Path
 import time
 import hashlib
-import urllib.request
+import argparse
+import threading
+
+from document_store import DocumentStore, normalize_date
+from http_cache import HTTPValidatorCache
 
 class SourceScraper:
     """Classe base per tutti gli scraper"""
     
-    def __init__(self, name, url):
+    def __init__(self, name, url, http_cache=None):
         self.name = name
         self.url = url
+        self.http_cache = http_cache
     
     def scrape(self):
         raise NotImplementedError
     
+    def _get(self, headers, timeout=30):
+        """
+        GET (condizionale se c'è una cache HTTP) della pagina dello scraper
+        
+        Returns:
+            response, oppure None se il server risponde 304 Not Modified
+        """
+        if self.http_cache is not None:
+            headers = {**headers, **self.http_cache.conditional_headers(self.url)}
+        
+        response = requests.get(self.url, headers=headers, timeout=timeout)
+        
+        if response.status_code == 304 and self.http_cache is not None:
+            if self.http_cache.documents(self.url) is not None:
+                return None
+            # 304 senza documenti salvati: riscarica senza validatori
+            headers = {k: v for k, v in headers.items() if not k.startswith('If-')}
+            response = requests.get(self.url, headers=headers, timeout=timeout)
+        
+        return response
+    
+    def _cached_documents(self):
+        """Documenti della run precedente per una risorsa non modificata"""
+        self.http_cache.record_hit()
+        documents = self.http_cache.documents(self.url)
+        print(f"  ♻️  Non modificato (304): {len(documents)} documenti dalla cache")
+        return documents
+    
+    def _remember(self, response, documents):
+        """Salva validatori e documenti estratti da una risposta 200"""
+        if self.http_cache is not None and response.status_code == 200:
+            self.http_cache.store(self.url, response.headers, documents)
+    
     def _make_absolute_url(self, url, base_url):
         """Converte URL relativo in assoluto"""
         if url.startswith('http'):
@@ -39,299 +75,295 @@ class RSSFeedScraper(SourceScraper):
     """Scraper per feed RSS (più affidabile)"""
     
     def scrape(self):
-        try:
-            print(f"  📡 Fetching RSS: {self.url}")
-            
-            # Headers per bypassare cookie banner
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Accept': 'application/rss+xml, application/xml, text/xml, */*',
-                'Accept-Language': 'it-IT,it;q=0.9,en-US;q=0.8,en;q=0.7',
-                'Cookie': 'cookie_notice_accepted=true'
+        print(f"  📡 Fetching RSS: {self.url}")
+        
+        # Headers per bypassare cookie banner
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+            'Accept': 'application/rss+xml, application/xml, text/xml, */*',
+            'Accept-Language': 'it-IT,it;q=0.9,en-US;q=0.8,en;q=0.7',
+            'Cookie': 'cookie_notice_accepted=true'
+        }
+        
+        # Scarica con headers (richiesta condizionale)
+        response = self._get(headers)
+        if response is None:
+            return self._cached_documents()
+        
+        response.raise_for_status()
+        feed_data = response.content
+        
+        # Parse feed
+        feed = feedparser.parse(feed_data)
+        
+        if not feed.entries:
+            print(f"  ⚠️  No entries found in RSS")
+            return []
+        
+        documents = []
+        
+        for entry in feed.entries[:50]:  # Ultimi 50
+            # Estrai data
+            date = entry.get('published', entry.get('updated', datetime.now().isoformat()))
+            
+            # Estrai TUTTO il contenuto disponibile
+            description = entry.get('summary', entry.get('description', ''))
+            content = ''
+            
+            # Alcuni feed hanno contenuto completo in 'content'
+            if entry.get('content'):
+                content = entry.content[0].get('value', '')
+            
+            # Usa il più lungo tra description e content
+            full_text = content if len(content) > len(description) else description
+            
+            if full_text:
+                # Rimuovi tag HTML
+                soup = BeautifulSoup(full_text, 'html.parser')
+                clean_text = soup.get_text(separator='\n', strip=True)
+            else:
+                clean_text = ''
+            
+            doc = {
+                'title': entry.title,
+                'url': entry.link,
+                'date': date,
+                'source': self.name,
+                'type': 'rss_article',
+                'description': clean_text[:500] if len(clean_text) > 500 else clean_text,
+                'full_content': clean_text,  # NUOVO: contenuto completo dal feed
+                'has_full_content': len(clean_text) > 200  # Flag se ha contenuto utile
             }
             
-            # Scarica con headers
-            import urllib.request
-            req = urllib.request.Request(self.url, headers=headers)
-            response = urllib.request.urlopen(req)
-            feed_data = response.read()
-            
-            # Parse feed
-            feed = feedparser.parse(feed_data)
-            
-            if not feed.entries:
-                print(f"  ⚠️  No entries found in RSS")
-                return []
-            
-            documents = []
-            
-            for entry in feed.entries[:50]:  # Ultimi 50
-                # Estrai data
-                date = entry.get('published', entry.get('updated', datetime.now().isoformat()))
-                
-                # Estrai TUTTO il contenuto disponibile
-                description = entry.get('summary', entry.get('description', ''))
-                content = ''
-                
-                # Alcuni feed hanno contenuto completo in 'content'
-                if entry.get('content'):
-                    content = entry.content[0].get('value', '')
-                
-                # Usa il più lungo tra description e content
-                full_text = content if len(content) > len(description) else description
-                
-                if full_text:
-                    # Rimuovi tag HTML
-                    soup = BeautifulSoup(full_text, 'html.parser')
-                    clean_text = soup.get_text(separator='\n', strip=True)
-                else:
-                    clean_text = ''
-                
-                doc = {
-                    'title': entry.title,
-                    'url': entry.link,
-                    'date': date,
-                    'source': self.name,
-                    'type': 'rss_article',
-                    'description': clean_text[:500] if len(clean_text) > 500 else clean_text,
-                    'full_content': clean_text,  # NUOVO: contenuto completo dal feed
-                    'has_full_content': len(clean_text) > 200  # Flag se ha contenuto utile
-                }
-                
-                documents.append(doc)
-            
-            print(f"  ✅ Found {len(documents)} documents")
-            return documents
-            
-        except Exception as e:
-            print(f"  ❌ Error: {e}")
-            return []
+            documents.append(doc)
+        
+        self._remember(response, documents)
+        
+        print(f"  ✅ Found {len(documents)} documents")
+        return documents
 
 
 class MIMNormativaScraper(SourceScraper):
     """Scraper per pagina normativa MIM"""
     
     def scrape(self):
-        try:
-            print(f"  🌐 Scraping HTML: {self.url}")
-            
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            
-            response = requests.get(self.url, headers=headers, timeout=30)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            documents = []
-            
-            # Cerca link a PDF o pagine di normativa
-            # Il sito MIM ha diverse strutture possibili
-            
-            # Strategia 1: cerca tutti i link che contengono "normativa" o terminano in .pdf
-            for link in soup.find_all('a', href=True):
-                href = link['href']
-                text = link.get_text(strip=True)
-                
-                if not text or len(text) < 10:
-                    continue
+        print(f"  🌐 Scraping HTML: {self.url}")
+        
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        }
+        
+        response = self._get(headers)
+        if response is None:
+            return self._cached_documents()
+        
+        response.raise_for_status()
+        
+        soup = BeautifulSoup(response.text, 'html.parser')
+        documents = []
+        
+        # Cerca link a PDF o pagine di normativa
+        # Il sito MIM ha diverse strutture possibili
+        
+        # Strategia 1: cerca tutti i link che contengono "normativa" o terminano in .pdf
+        for link in soup.find_all('a', href=True):
+            href = link['href']
+            text = link.get_text(strip=True)
+            
+            if not text or len(text) < 10:
+                continue
+            
+            # Filtra link rilevanti
+            is_relevant = (
+                '.pdf' in href.lower() or
+                'normativa' in href.lower() or
+                'circolare' in href.lower() or
+                'decreto' in href.lower() or
+                'ordinanza' in href.lower()
+            )
+            
+            if is_relevant:
+                # Trova data (cerca nel parent o nei siblings)
+                date = datetime.now().isoformat()
+                parent = link.find_parent(['div', 'li', 'tr'])
+                if parent:
+                    date_text = parent.get_text()
+                    # Cerca pattern data (es: 01/12/2024 o 2024-12-01)
+                    import re
+                    date_match = re.search(r'\d{2}[/-]\d{2}[/-]\d{4}|\d{4}[/-]\d{2}[/-]\d{2}', date_text)
+                    if date_match:
+                        date = date_match.group()
                 
-                # Filtra link rilevanti
-                is_relevant = (
-                    '.pdf' in href.lower() or
-                    'normativa' in href.lower() or
-                    'circolare' in href.lower() or
-                    'decreto' in href.lower() or
-                    'ordinanza' in href.lower()
-                )
+                doc = {
+                    'title': text,
+                    'url': self._make_absolute_url(href, self.url),
+                    'date': date,
+                    'source': self.name,
+                    'type': 'normativa',
+                    'description': ''
+                }
                 
-                if is_relevant:
-                    # Trova data (cerca nel parent o nei siblings)
-                    date = datetime.now().isoformat()
-                    parent = link.find_parent(['div', 'li', 'tr'])
-                    if parent:
-                        date_text = parent.get_text()
-                        # Cerca pattern data (es: 01/12/2024 o 2024-12-01)
-                        import re
-                        date_match = re.search(r'\d{2}[/-]\d{2}[/-]\d{4}|\d{4}[/-]\d{2}[/-]\d{2}', date_text)
-                        if date_match:
-                            date = date_match.group()
-                    
-                    doc = {
-                        'title': text,
-                        'url': self._make_absolute_url(href, self.url),
-                        'date': date,
-                        'source': self.name,
-                        'type': 'normativa',
-                        'description': ''
-                    }
-                    
-                    documents.append(doc)
-            
-            # Deduplicazione per URL
-            unique_docs = {doc['url']: doc for doc in documents}
-            result = list(unique_docs.values())
-            
-            print(f"  ✅ Found {len(result)} documents")
-            return result
-            
-        except Exception as e:
-            print(f"  ❌ Error: {e}")
-            return []
+                documents.append(doc)
+        
+        # Deduplicazione per URL
+        unique_docs = {doc['url']: doc for doc in documents}
+        result = list(unique_docs.values())
+        
+        self._remember(response, result)
+        
+        print(f"  ✅ Found {len(result)} documents")
+        return result
 
 
 class CISLScuolaScraper(SourceScraper):
     """Scraper per CISL Scuola Roma e Rieti"""
     
     def scrape(self):
-        try:
-            print(f"  🌐 Scraping HTML: {self.url}")
-            
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            
-            response = requests.get(self.url, headers=headers, timeout=30)
-            soup = BeautifulSoup(response.text, 'html.parser')
-            documents = []
-            
-            # Cerca articoli/notizie (struttura tipica WordPress/CMS)
-            # Prova diversi selettori comuni
-            selectors = [
-                'article',
-                '.post',
-                '.news-item',
-                '.entry',
-                'div[class*="news"]',
-                'div[class*="post"]'
-            ]
-            
-            items_found = []
-            for selector in selectors:
-                items = soup.select(selector)
-                if items:
-                    items_found = items
-                    break
-            
-            if not items_found:
-                # Fallback: cerca tutti i link nella pagina
-                items_found = soup.find_all('a', href=True)
-            
-            for item in items_found[:50]:
-                try:
-                    # Estrai titolo
-                    title_elem = item.find(['h1', 'h2', 'h3', 'h4', 'a'])
-                    if not title_elem:
-                        continue
-                    
-                    title = title_elem.get_text(strip=True)
-                    
-                    # Estrai link
-                    link_elem = item.find('a', href=True) if item.name != 'a' else item
-                    if not link_elem:
-                        continue
-                    
-                    url = link_elem['href']
-                    
-                    # Filtra link non rilevanti
-                    if not url or url.startswith('#') or 'javascript:' in url:
-                        continue
-                    
-                    # Estrai data
-                    date = datetime.now().isoformat()
-                    date_elem = item.find(['time', 'span', 'div'], class_=lambda x: x and 'date' in x.lower() if x else False)
-                    if date_elem:
-                        date = date_elem.get_text(strip=True)
-                    
-                    doc = {
-                        'title': title,
-                        'url': self._make_absolute_url(url, self.url),
-                        'date': date,
-                        'source': self.name,
-                        'type': 'news',
-                        'description': ''
-                    }
-                    
-                    if len(title) > 10:  # Filtra titoli troppo corti
-                        documents.append(doc)
+        print(f"  🌐 Scraping HTML: {self.url}")
+        
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        }
+        
+        response = self._get(headers)
+        if response is None:
+            return self._cached_documents()
+        
+        soup = BeautifulSoup(response.text, 'html.parser')
+        documents = []
+        
+        # Cerca articoli/notizie (struttura tipica WordPress/CMS)
+        # Prova diversi selettori comuni
+        selectors = [
+            'article',
+            '.post',
+            '.news-item',
+            '.entry',
+            'div[class*="news"]',
+            'div[class*="post"]'
+        ]
+        
+        items_found = []
+        for selector in selectors:
+            items = soup.select(selector)
+            if items:
+                items_found = items
+                break
+        
+        if not items_found:
+            # Fallback: cerca tutti i link nella pagina
+            items_found = soup.find_all('a', href=True)
+        
+        for item in items_found[:50]:
+            try:
+                # Estrai titolo
+                title_elem = item.find(['h1', 'h2', 'h3', 'h4', 'a'])
+                if not title_elem:
+                    continue
+                
+                title = title_elem.get_text(strip=True)
                 
-                except Exception:
+                # Estrai link
+                link_elem = item.find('a', href=True) if item.name != 'a' else item
+                if not link_elem:
                     continue
+                
+                url = link_elem['href']
+                
+                # Filtra link non rilevanti
+                if not url or url.startswith('#') or 'javascript:' in url:
+                    continue
+                
+                # Estrai data
+                date = datetime.now().isoformat()
+                date_elem = item.find(['time', 'span', 'div'], class_=lambda x: x and 'date' in x.lower() if x else False)
+                if date_elem:
+                    date = date_elem.get_text(strip=True)
+                
+                doc = {
+                    'title': title,
+                    'url': self._make_absolute_url(url, self.url),
+                    'date': date,
+                    'source': self.name,
+                    'type': 'news',
+                    'description': ''
+                }
+                
+                if len(title) > 10:  # Filtra titoli troppo corti
+                    documents.append(doc)
             
-            # Deduplicazione
-            unique_docs = {doc['url']: doc for doc in documents}
-            result = list(unique_docs.values())
-            
-            print(f"  ✅ Found {len(result)} documents")
-            return result
-            
-        except Exception as e:
-            print(f"  ❌ Error: {e}")
-            return []
+            except Exception:
+                continue
+        
+        # Deduplicazione
+        unique_docs = {doc['url']: doc for doc in documents}
+        result = list(unique_docs.values())
+        
+        self._remember(response, result)
+        
+        print(f"  ✅ Found {len(result)} documents")
+        return result
 
 
 class USRLazioScraper(SourceScraper):
     """Scraper per USR Lazio - Gestisce siti dinamici"""
     
     def scrape(self):
-        try:
-            print(f"  🌐 Scraping HTML: {self.url}")
-            print(f"  ⚠️  Nota: sito potrebbe usare JavaScript (contenuto limitato)")
-            
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            
-            response = requests.get(self.url, headers=headers, timeout=30)
-            soup = BeautifulSoup(response.text, 'html.parser')
-            documents = []
-            
-            # Cerca link a documenti/comunicazioni
-            for link in soup.find_all('a', href=True):
-                text = link.get_text(strip=True)
-                href = link['href']
-                
-                if not text or len(text) < 10:
-                    continue
-                
-                # Filtra link rilevanti
-                is_relevant = any(keyword in text.lower() for keyword in [
-                    'comunicazione', 'circolare', 'avviso', 'decreto',
-                    'ordinanza', 'nota', 'bando', 'concorso'
-                ])
-                
-                if is_relevant or '.pdf' in href.lower():
-                    doc = {
-                        'title': text,
-                        'url': self._make_absolute_url(href, self.url),
-                        'date': datetime.now().isoformat(),
-                        'source': self.name,
-                        'type': 'comunicazione',
-                        'description': ''
-                    }
-                    documents.append(doc)
-            
-            unique_docs = {doc['url']: doc for doc in documents}
-            result = list(unique_docs.values())
+        print(f"  🌐 Scraping HTML: {self.url}")
+        print(f"  ⚠️  Nota: sito potrebbe usare JavaScript (contenuto limitato)")
+        
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        }
+        
+        response = self._get(headers)
+        if response is None:
+            return self._cached_documents()
+        
+        soup = BeautifulSoup(response.text, 'html.parser')
+        documents = []
+        
+        # Cerca link a documenti/comunicazioni
+        for link in soup.find_all('a', href=True):
+            text = link.get_text(strip=True)
+            href = link['href']
             
-            print(f"  ✅ Found {len(result)} documents")
-            if len(result) < 5:
-                print(f"  ⚠️  Pochi risultati: il sito potrebbe richiedere JavaScript")
+            if not text or len(text) < 10:
+                continue
             
-            return result
+            # Filtra link rilevanti
+            is_relevant = any(keyword in text.lower() for keyword in [
+                'comunicazione', 'circolare', 'avviso', 'decreto',
+                'ordinanza', 'nota', 'bando', 'concorso'
+            ])
             
-        except Exception as e:
-            print(f"  ❌ Error: {e}")
-            return []
+            if is_relevant or '.pdf' in href.lower():
+                doc = {
+                    'title': text,
+                    'url': self._make_absolute_url(href, self.url),
+                    'date': datetime.now().isoformat(),
+                    'source': self.name,
+                    'type': 'comunicazione',
+                    'description': ''
+                }
+                documents.append(doc)
+        
+        unique_docs = {doc['url']: doc for doc in documents}
+        result = list(unique_docs.values())
+        
+        self._remember(response, result)
+        
+        print(f"  ✅ Found {len(result)} documents")
+        if len(result) < 5:
+            print(f"  ⚠️  Pochi risultati: il sito potrebbe richiedere JavaScript")
+        
+        return result
 
 
-def scrape_all_sources():
-    """Esegue scraping di tutte le fonti configurate"""
+def build_scrapers():
+    """Configurazione scrapers"""
     
-    print("🚀 Avvio scraping multi-sorgente...\n")
-    
-    # Configurazione scrapers
-    scrapers = [
+    return [
         # Feed RSS (più affidabili)
         RSSFeedScraper(
             name='Orizzonte Scuola - Diventare Insegnanti',
@@ -364,6 +396,42 @@ def scrape_all_sources():
             url='https://www.ufficioscolasticoregionalelazio.it/home/'
         ),
     ]
+
+
+def _timed_scrape(scraper):
+    """Esegue uno scraper misurandone tempo e stato (gli errori arrivano fin qui)"""
+    start = time.perf_counter()
+    
+    try:
+        docs = scraper.scrape()
+    except Exception as e:
+        print(f"  ❌ Error ({scraper.name}): {e}")
+        return [], time.perf_counter() - start, 'error'
+    
+    return docs, time.perf_counter() - start, 'ok' if docs else 'empty'
+
+
+def scrape_all_sources(scrapers=None, parallel=True, timeout=90, use_http_cache=True):
+    """
+    Esegue scraping di tutte le fonti configurate
+    
+    Args:
+        scrapers: lista di scraper (default: build_scrapers())
+        parallel: esegue gli scraper in contemporanea (domini diversi)
+        timeout: secondi massimi concessi a ogni scraper in modalità parallela
+        use_http_cache: richieste condizionali ETag/Last-Modified
+    """
+    
+    print("🚀 Avvio scraping multi-sorgente...\n")
+    
+    if scrapers is None:
+        scrapers = build_scrapers()
+    
+    http_cache = HTTPValidatorCache() if use_http_cache else None
+    if http_cache is not None:
+        for scraper in scrapers:
+            if scraper.http_cache is None:
+                scraper.http_cache = http_cache
     
     all_documents = []
     stats = {
@@ -373,22 +441,75 @@ def scrape_all_sources():
         'total_docs': 0
     }
     
-    # Esegui ogni scraper
-    for i, scraper in enumerate(scrapers, 1):
-        print(f"[{i}/{len(scrapers)}] {scraper.name}")
+    # Per ogni fonte: (documenti, secondi, stato)
+    outcomes = {}
+    run_start = time.perf_counter()
+    
+    if parallel:
+        # Thread daemon: uno scraper bloccato oltre il timeout non trattiene
+        # il processo all'uscita (i worker di ThreadPoolExecutor vengono
+        # attesi dall'interprete prima di terminare)
+        results = {}
         
-        try:
-            docs = scraper.scrape()
-            all_documents.extend(docs)
+        def run(scraper):
+            results[scraper.name] = _timed_scrape(scraper)
+        
+        threads = [
+            threading.Thread(target=run, args=(scraper,), name=f"scrape-{i}", daemon=True)
+            for i, scraper in enumerate(scrapers)
+        ]
+        for thread in threads:
+            thread.start()
+        
+        # Tutti partono insieme: il timeout di ciascuno coincide con la scadenza globale
+        deadline = time.perf_counter() + timeout
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.perf_counter()))
+        
+        for scraper in scrapers:
+            outcomes[scraper.name] = results.get(scraper.name, ([], timeout, 'timeout'))
+        print()
+    else:
+        # Esegui ogni scraper
+        for i, scraper in enumerate(scrapers, 1):
+            print(f"[{i}/{len(scrapers)}] {scraper.name}")
+            
+            outcomes[scraper.name] = _timed_scrape(scraper)
+            
+            # Pausa educata tra richieste
+            time.sleep(1)
+            print()
+    
+    wall_time = time.perf_counter() - run_start
+    
+    # Raccogli risultati nell'ordine di configurazione
+    print("⏱️  Tempi per fonte:")
+    
+    status_icons = {'ok': '✅', 'empty': '⚠️ ', 'error': '❌', 'timeout': '⏰'}
+    
+    for scraper in scrapers:
+        docs, elapsed, status = outcomes[scraper.name]
+        print(f"  {status_icons[status]} {scraper.name:<45} {elapsed:6.1f}s  {len(docs):4d} doc  ({status})")
+        
+        if status in ('ok', 'empty'):
             stats['successful'] += 1
-            stats['total_docs'] += len(docs)
-        except Exception as e:
-            print(f"  ❌ Fatal error: {e}")
+        else:
             stats['failed'] += 1
         
-        # Pausa educata tra richieste
-        time.sleep(1)
-        print()
+        all_documents.extend(docs)
+        stats['total_docs'] += len(docs)
+    
+    print(f"  Tempo totale: {wall_time:.1f}s\n")
+    
+    if http_cache is not None:
+        http_cache.save()
+        stats['http_not_modified'] = http_cache.hits
+    
+    stats['sources'] = {
+        name: {'status': status, 'seconds': round(elapsed, 2), 'documents': len(docs)}
+        for name, (docs, elapsed, status) in outcomes.items()
+    }
+    stats['wall_time_seconds'] = round(wall_time, 2)
     
     # Deduplicazione globale per URL
     unique_docs = {}
@@ -405,24 +526,12 @@ def scrape_all_sources():
         doc['id'] = hashlib.sha256(doc_str.encode()).hexdigest()[:16]
     
     # Ordina per data (più recenti prima)
-    final_docs.sort(key=lambda x: x.get('date', ''), reverse=True)
-    
-    # Salva risultati
-    output = {
-        'scraped_at': datetime.now().isoformat(),
-        'stats': {
-            **stats,
-            'unique_documents': len(final_docs)
-        },
-        'documents': final_docs
-    }
+    final_docs.sort(key=lambda x: normalize_date(x.get('date')) or 0, reverse=True)
     
-    # Crea directory data se non esiste
-    Path('data').mkdir(exist_ok=True)
-    
-    output_file = 'data/scraped_documents.json'
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(output, f, indent=2, ensure_ascii=False)
+    # Salva risultati (upsert: i documenti invariati non vengono riscritti)
+    store = DocumentStore()
+    store.save_scraped(final_docs)
+    store.save_scrape_stats({**stats, 'unique_documents': len(final_docs)})
     
     # Report finale
     print("=" * 60)
@@ -433,11 +542,24 @@ def scrape_all_sources():
     print(f"Fallimenti:           {stats['failed']}")
     print(f"Documenti trovati:    {stats['total_docs']}")
     print(f"Documenti unici:      {len(final_docs)}")
-    print(f"Output salvato in:    {output_file}")
+    if http_cache is not None:
+        print(f"Fonti non modificate: {http_cache.hits} (304, nessun parsing)")
+    print(f"Totale in archivio:   {store.scraped_count()}")
+    print(f"Output salvato in:    {store.db_path}")
     print("=" * 60)
     
     return final_docs
 
 
 if __name__ == '__main__':
-    scrape_all_sources()
+    parser = argparse.ArgumentParser(description="Scraping di tutte le fonti configurate")
+    parser.add_argument('--sequential', action='store_true', help="esegue gli scraper uno alla volta")
+    parser.add_argument('--timeout', type=int, default=90, help="secondi massimi per fonte")
+    parser.add_argument('--no-http-cache', action='store_true', help="disattiva le richieste condizionali")
+    args = parser.parse_args()
+    
+    scrape_all_sources(
+        parallel=not args.sequential,
+        timeout=args.timeout,
+        use_http_cache=not args.no_http_cache
+    )
@@ -0,0 +1,331 @@
+"""
+Backend di ricerca vettoriale intercambiabili per RAGBot
+Posizione: /scripts/vector_backends.py
+
+    ChromaBackend   indice HNSW di ChromaDB (approssimato, adatto a corpus grandi)
+    NumpyBackend    ricerca esatta brute-force: prodotto matrice-vettore su
+                    vettori normalizzati + argpartition per il top-k; lavora
+                    anche direttamente su vettori float16/int8, con rescoring
+                    opzionale dei migliori candidati in float32
+
+Con qualche migliaio di chunk una singola moltiplicazione float32 è più
+veloce sia da caricare sia da interrogare di un indice HNSW.
+Tutti i backend restituiscono, per ogni domanda, una lista di
+(riga nell'artifact, distanza coseno). Con `rows` la ricerca è limitata alle
+righe indicate (partizioni per fonte/data, vedi partitions.py).
+"""
+
+import os
+import shutil
+import tempfile
+import uuid
+import weakref
+
+import numpy as np
+import chromadb
+from chromadb.segment import VectorReader
+from chromadb.segment.impl.vector.batch import Batch
+
+
+# In 'auto' fino a questa soglia di chunk si usa la ricerca esatta NumPy
+# (stessa variabile d'ambiente per l'app e per la build dell'artifact)
+EXACT_SEARCH_MAX_CHUNKS = int(os.environ.get('RAG_EXACT_SEARCH_MAX_CHUNKS', 20000))
+
+
+def normalize_rows(matrix):
+    """Normalizza L2 le righe di una matrice (le righe nulle restano nulle)"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def persist_collection(client, collection):
+    """
+    Scrive su disco tutto il grafo HNSW di una collection persistente
+
+    Chroma 0.4.x inserisce i record nell'HNSW a gruppi di hnsw:batch_size e
+    salva il grafo solo ogni hnsw:sync_threshold (1000) inserimenti: il resto
+    resta nel log SQLite e verrebbe reinserito a ogni apertura dell'indice.
+    Va chiamata prima di copiare la directory nell'artifact.
+    """
+    segment = client._server._manager.get_segment(collection.id, VectorReader)
+    if segment._index is None:
+        return
+
+    if len(segment._curr_batch):
+        segment._apply_batch(segment._curr_batch)
+        segment._curr_batch = Batch()
+        segment._brute_force_index.clear()
+
+    segment._persist()
+
+
+def _drop_collection(client, name):
+    """Elimina una collection in memoria non più usata (ignora se già assente)"""
+    try:
+        client.delete_collection(name)
+    except ValueError:
+        pass
+
+
+class VectorBackend:
+    """Interfaccia comune dei backend"""
+
+    name = None
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def search(self, query_embeddings, top_k, rows=None):
+        """
+        Args:
+            query_embeddings: matrice (Q x D) degli embedding delle domande
+            top_k: risultati per domanda
+            rows: array ordinato delle sole righe da considerare (None = tutte)
+
+        Returns:
+            lista (una per domanda) di liste di (riga, distanza coseno)
+        """
+        raise NotImplementedError
+
+
+def _subset(array, rows):
+    """Righe selezionate di una matrice: vista senza copia se sono contigue"""
+    if rows is None:
+        return array
+    if len(rows) and rows[-1] - rows[0] + 1 == len(rows):
+        return array[rows[0]:rows[-1] + 1]
+    return array[rows]
+
+
+def _top_k(scores, k):
+    """Indici e punteggi dei k massimi per riga, in ordine decrescente"""
+    n = scores.shape[1]
+
+    if k < n:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        top = np.tile(np.arange(n), (scores.shape[0], 1))
+
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+class NumpyBackend(VectorBackend):
+    """Ricerca esatta vettorializzata su matrice normalizzata (anche quantizzata)"""
+
+    name = 'numpy'
+
+    # Righe convertite in float32 per volta quando la matrice è float16/int8
+    BLOCK_ROWS = 8192
+
+    def __init__(self, embeddings, normalized=False, scales=None, full_embeddings=None,
+                 rescore_factor=0):
+        """
+        Args:
+            embeddings: matrice (N x D) float32, float16 o int8
+            normalized: True se le righe (dequantizzate) hanno già norma 1
+            scales: scala per riga delle matrici int8
+            full_embeddings: copia float32 per il rescoring (opzionale)
+            rescore_factor: candidati rivalutati in float32 = top_k * rescore_factor
+        """
+        if not normalized:
+            embeddings = normalize_rows(
+                embeddings if scales is None else embeddings * scales[:, None]
+            )
+            scales = None
+
+        # Artifact già normalizzato: si usa direttamente la matrice mappata
+        self.matrix = embeddings
+        self.scales = scales
+        self.full_embeddings = full_embeddings
+        self.rescore_factor = rescore_factor if full_embeddings is not None else 0
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def _scores(self, queries, rows=None):
+        """(Q x D) @ (D x N): similarità coseno per tutte le domande insieme"""
+        matrix = _subset(self.matrix, rows)
+
+        if matrix.dtype == np.float32:
+            return queries @ matrix.T
+
+        # float16/int8: NumPy non ha BLAS per questi tipi, si converte a blocchi
+        # (la matrice resta compatta in memoria, il blocco corrente è temporaneo)
+        n = matrix.shape[0]
+        scores = np.empty((len(queries), n), dtype=np.float32)
+        for start in range(0, n, self.BLOCK_ROWS):
+            end = min(start + self.BLOCK_ROWS, n)
+            block = np.asarray(matrix[start:end], dtype=np.float32)
+            scores[:, start:end] = queries @ block.T
+
+        if self.scales is not None:
+            scores *= _subset(self.scales, rows)
+
+        return scores
+
+    def search(self, query_embeddings, top_k, rows=None):
+        queries = normalize_rows(np.atleast_2d(query_embeddings))
+        if rows is not None:
+            rows = np.asarray(rows, dtype=np.int64)
+        n = len(self) if rows is None else len(rows)
+        k = min(top_k, n)
+
+        if k == 0:
+            return [[] for _ in range(len(queries))]
+
+        scores = self._scores(queries, rows)
+
+        if not self.rescore_factor:
+            top, top_scores = _top_k(scores, k)
+            if rows is not None:
+                top = rows[top]
+        else:
+            # Candidati dai vettori quantizzati, ordine finale in float32
+            candidates, _ = _top_k(scores, min(k * self.rescore_factor, n))
+            if rows is not None:
+                candidates = rows[candidates]
+            top = np.empty((len(queries), k), dtype=np.int64)
+            top_scores = np.empty((len(queries), k), dtype=np.float32)
+
+            for q, candidate_rows in enumerate(candidates):
+                candidate_rows = np.sort(candidate_rows)
+                exact = np.asarray(self.full_embeddings[candidate_rows], dtype=np.float32) @ queries[q]
+                order = np.argsort(-exact, kind='stable')[:k]
+                top[q] = candidate_rows[order]
+                top_scores[q] = exact[order]
+
+        return [
+            [(int(row), float(1.0 - score)) for row, score in zip(top_rows, row_scores)]
+            for top_rows, row_scores in zip(top, top_scores)
+        ]
+
+
+class ChromaBackend(VectorBackend):
+    """Indice HNSW di ChromaDB"""
+
+    name = 'chroma'
+
+    def __init__(self, collection, row_of_id, exact_factory=None):
+        """
+        Args:
+            exact_factory: crea un NumpyBackend sull'artifact per le ricerche
+                limitate a una partizione (istanziato al primo uso)
+        """
+        self.collection = collection
+        self.row_of_id = row_of_id
+        self._exact_factory = exact_factory
+        self._exact = None
+
+    def __len__(self):
+        return self.collection.count()
+
+    @classmethod
+    def open(cls, artifact, row_of_id, exact_factory=None):
+        """Deserializza l'indice salvato nell'artifact (nessun reinserimento)"""
+        print(f"🗄️  Apertura indice ChromaDB: {artifact.index_path}")
+        # Un PersistentClient scrive nella sua directory (SQLite, file HNSW):
+        # si lavora su una copia privata, l'artifact versionato resta intatto.
+        # Ogni caricamento ha un path nuovo, quindi anche un client nuovo
+        workdir = tempfile.mkdtemp(prefix='rag_chroma_')
+        index_path = shutil.copytree(artifact.index_path, f"{workdir}/{artifact.index_path.name}")
+        client = chromadb.PersistentClient(path=str(index_path))
+        collection = client.get_collection(
+            name=artifact.manifest.get('collection_name', 'scuola_docs')
+        )
+        backend = cls(collection, row_of_id, exact_factory)
+        weakref.finalize(backend, shutil.rmtree, workdir, True)
+        return backend
+
+    @classmethod
+    def rebuild(cls, artifact, row_of_id, exact_factory=None):
+        """Ricostruisce ChromaDB in memoria (artifact senza indice serializzato)"""
+        print("🗄️  Ricostruzione ChromaDB...")
+        client = chromadb.EphemeralClient()  # In memoria (più veloce)
+
+        # Tutti gli EphemeralClient del processo condividono lo stesso sistema:
+        # con un nome fisso un hot reload troverebbe i chunk della knowledge
+        # base precedente. Nome univoco per caricamento; la collection viene
+        # eliminata quando il backend non è più in uso (la vecchia resta
+        # interrogabile finché il reload non è completato)
+        collection = client.create_collection(
+            name=f"scuola_docs_{uuid.uuid4().hex}",
+            metadata={"hnsw:space": "cosine"}
+        )
+
+        # Popola collection a blocchi: dalla matrice mappata si copia
+        # solo il batch corrente, mai l'intera knowledge base
+        batch_size = 5000
+
+        for i in range(0, len(artifact), batch_size):
+            end_idx = min(i + batch_size, len(artifact))
+
+            collection.upsert(
+                ids=artifact.ids[i:end_idx],
+                embeddings=artifact.float_vectors(slice(i, end_idx)).tolist(),
+                documents=artifact.texts[i:end_idx],
+                metadatas=artifact.metadatas[i:end_idx]
+            )
+
+        backend = cls(collection, row_of_id, exact_factory)
+        weakref.finalize(backend, _drop_collection, client, collection.name)
+        return backend
+
+    def search(self, query_embeddings, top_k, rows=None):
+        # Partizione: ricerca esatta sulle sole righe selezionate, non su tutto l'HNSW
+        if rows is not None:
+            if self._exact is None:
+                self._exact = self._exact_factory()
+            return self._exact.search(query_embeddings, top_k, rows)
+        
+        # Testi e metadati si leggono dall'artifact: a Chroma servono solo id e distanze
+        results = self.collection.query(
+            query_embeddings=np.atleast_2d(query_embeddings).tolist(),
+            n_results=top_k,
+            include=['distances']
+        )
+
+        return [
+            [
+                (self.row_of_id[chunk_id], distance)
+                for chunk_id, distance in zip(ids, distances)
+            ]
+            for ids, distances in zip(results['ids'], results['distances'])
+        ]
+
+
+def create_backend(name, artifact, row_of_id, exact_max_chunks, rescore_factor=0):
+    """
+    Sceglie e apre il backend
+
+    Args:
+        name: 'numpy', 'chroma' oppure 'auto'
+        artifact: KnowledgeArtifact aperto
+        row_of_id: dict id chunk -> riga nell'artifact
+        exact_max_chunks: in 'auto', sotto questa soglia si usa la ricerca esatta
+        rescore_factor: rescoring float32 dei candidati (artifact quantizzati)
+    """
+    if name == 'auto':
+        name = 'numpy' if len(artifact) <= exact_max_chunks else 'chroma'
+
+    def exact_backend():
+        return NumpyBackend(
+            artifact.embeddings,
+            normalized=artifact.normalized,
+            scales=artifact.scales,
+            full_embeddings=artifact.full_embeddings,
+            rescore_factor=rescore_factor
+        )
+
+    if name == 'numpy':
+        return exact_backend()
+
+    if name == 'chroma':
+        if artifact.index_path is not None:
+            return ChromaBackend.open(artifact, row_of_id, exact_backend)
+        return ChromaBackend.rebuild(artifact, row_of_id, exact_backend)
+
+    raise ValueError(f"Backend vettoriale sconosciuto: {name}")